@@ -1,25 +1,99 @@
 import time
+import asyncio
 from llama_index.core.llms import LLM, ChatMessage
 from llama_index.core.prompts import BasePromptTemplate
 from typing import Any, Dict, Iterable, List, Optional, Tuple, Sequence
+from llm_cache import LLMResponseCache, get_llm_cache
 
 
-def call_llm(prompt: BasePromptTemplate, llm: Optional[LLM] = None, max_try=5, sleep=10, **prompt_args)->str:
+def llm_cache_key(llm: LLM, rendered_prompt: str, **kwargs) -> str:
+    """cache key of a request: model, rendered prompt and sampling parameters"""
+    model = "{}:{}".format(type(llm).__name__, llm.metadata.model_name)
+    params = {name: getattr(llm, name) for name in ['temperature', 'top_p', 'top_k', 'max_tokens', 'seed']
+              if getattr(llm, name, None) is not None}
+    params.update(kwargs)
+    return LLMResponseCache.make_key(model, rendered_prompt, params)
+
+
+def messages_to_str(messages: Sequence[ChatMessage]) -> str:
+    return '\n'.join(f"{msg.role}: {msg.content}" for msg in messages)
+
+
+def call_llm(prompt: BasePromptTemplate, llm: Optional[LLM] = None, max_try=5, sleep=10,
+             use_cache: bool = True, **prompt_args)->str:
+    cache = get_llm_cache() if use_cache else None
+    if cache is not None:
+        key = llm_cache_key(llm, prompt.format(llm=llm, **prompt_args))
+        res = cache.get(key)
+        if res is not None:
+            return res
+
     for try_idx in range(max_try):
         try:
             res = llm.predict(prompt, **prompt_args)
+            if cache is not None:
+                cache.put(key, res)
             return res
         except:
             time.sleep(sleep)
     return ''
 
 
-def call_llm_message(messages: Sequence[ChatMessage], llm: Optional[LLM] = None, max_try=5, sleep=10, **kwargs)->str:
+def call_llm_message(messages: Sequence[ChatMessage], llm: Optional[LLM] = None, max_try=5, sleep=10,
+                     use_cache: bool = True, **kwargs)->str:
+    cache = get_llm_cache() if use_cache else None
+    if cache is not None:
+        key = llm_cache_key(llm, messages_to_str(messages), **kwargs)
+        res = cache.get(key)
+        if res is not None:
+            return res
+
     for try_idx in range(max_try):
         try:
             res = llm.chat(messages, **kwargs)
+            if cache is not None:
+                cache.put(key, res.message.content)
             return res.message.content
         except:
             time.sleep(sleep)
     return ''
 
+
+async def acall_llm(prompt: BasePromptTemplate, llm: Optional[LLM] = None, max_try=5, sleep=10,
+                    use_cache: bool = True, **prompt_args)->str:
+    cache = get_llm_cache() if use_cache else None
+    if cache is not None:
+        key = llm_cache_key(llm, prompt.format(llm=llm, **prompt_args))
+        res = cache.get(key)
+        if res is not None:
+            return res
+
+    for try_idx in range(max_try):
+        try:
+            res = await llm.apredict(prompt, **prompt_args)
+            if cache is not None:
+                cache.put(key, res)
+            return res
+        except:
+            await asyncio.sleep(sleep)
+    return ''
+
+
+async def acall_llm_message(messages: Sequence[ChatMessage], llm: Optional[LLM] = None, max_try=5, sleep=10,
+                            use_cache: bool = True, **kwargs)->str:
+    cache = get_llm_cache() if use_cache else None
+    if cache is not None:
+        key = llm_cache_key(llm, messages_to_str(messages), **kwargs)
+        res = cache.get(key)
+        if res is not None:
+            return res
+
+    for try_idx in range(max_try):
+        try:
+            res = await llm.achat(messages, **kwargs)
+            if cache is not None:
+                cache.put(key, res.message.content)
+            return res.message.content
+        except:
+            await asyncio.sleep(sleep)
+    return ''
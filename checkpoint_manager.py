@@ -1,66 +1,185 @@
 # Funzione: Gestisce i checkpoint durante l'analisi del database.
-# Il checkpoint è un file JSON che memorizza i campi già processati durante l'analisi del database.
-# Questo permette di riprendere l'analisi da dove si era interrotta in caso di interruzione del processo.
+# Il checkpoint è un journal JSONL append-only: ogni riga registra il risultato di una fase della pipeline
+# (statistiche, categoria, info supplementari, descrizione di colonna o tabella) per una colonna o una tabella.
+# Ogni scrittura aggiunge una sola riga (costo O(1)), e alla ripartenza il journal viene riletto
+# per riprendere l'analisi esattamente da dove si era interrotta.
+# Ogni riga porta lo scope (database/schema analizzato) e l'impronta della struttura della tabella:
+# alla ripartenza le righe di un altro database o di una tabella modificata nel frattempo vengono scartate.
+# Le righe senza scope (journal precedenti o migrati dal vecchio checkpoint JSON) valgono per qualunque scope.
 
 
 
 import json
+import os
+import threading
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
 import logging
+from utils import json_default
+
+# Fasi della pipeline registrate nel journal
+STAGE_ANALYSIS = 'analysis'        # info del campo salvate da main.py
+STAGE_STATS = 'stats'              # statistiche della colonna
+STAGE_CATEGORY = 'category'        # categoria, dim/meas, granularità minima e valori enum della colonna
+STAGE_DB_INFO = 'db_info'          # comprensione del database
+STAGE_SUPP_INFO = 'supp_info'      # info supplementari dimensioni/misure della tabella
+STAGE_COLUMN_DESC = 'column_desc'  # descrizione della colonna
+STAGE_TABLE_DESC = 'table_desc'    # descrizione della tabella
+
 
 class CheckpointManager:
     """Gestisce i checkpoint durante l'analisi del database."""
-    
-    def __init__(self, checkpoint_dir: str = "checkpoints"):
+
+    def __init__(self, checkpoint_dir: str = "checkpoints", journal_name: str = "analysis_journal.jsonl",
+                 fsync: bool = False, scope: Optional[str] = None):
         self.checkpoint_dir = Path(checkpoint_dir)
         self.checkpoint_dir.mkdir(exist_ok=True)
+        self.journal_file = self.checkpoint_dir / journal_name
+        self.fsync = fsync
+        # database/schema a cui appartengono le righe del journal (None: tutte le righe sono valide)
+        self.scope = scope
+        # {stage: {(table_name, field_name): data}}
+        self.records = {}
+        # {stage: {(table_name, field_name): impronta della tabella al momento della registrazione}}
+        self.fingerprints = {}
+        self.current_checkpoint = {}
+        self._lock = threading.RLock()
+        self._journal = None
+        self._load_journal()
+
+    def _load_journal(self):
+        """Rilegge il journal; una riga finale incompleta (processo interrotto durante la scrittura) viene ignorata."""
+        self.records = {}
+        self.fingerprints = {}
         self.current_checkpoint = {}
-        
+        if self.journal_file.exists():
+            with open(self.journal_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        logging.warning(f"Riga del journal non valida ignorata: {line[:100]}")
+                        continue
+                    if self.scope is not None and entry.get('scope') not in (None, self.scope):
+                        continue
+                    self._apply(entry['stage'], entry['table'], entry.get('field'), entry.get('data'),
+                                entry.get('fingerprint'))
+        else:
+            # Migrazione dal vecchio checkpoint JSON
+            legacy_file = self.checkpoint_dir / "analysis_checkpoint.json"
+            if legacy_file.exists():
+                with open(legacy_file, 'r', encoding='utf-8') as f:
+                    for table_name, fields in json.load(f).items():
+                        for field_name, data in fields.items():
+                            self.record(STAGE_ANALYSIS, table_name, field_name, data)
+
+    def _apply(self, stage: str, table_name: Optional[str], field_name: Optional[str], data: Any,
+               fingerprint: Optional[str] = None):
+        self.records.setdefault(stage, {})[(table_name, field_name)] = data
+        self.fingerprints.setdefault(stage, {})[(table_name, field_name)] = fingerprint
+        if stage == STAGE_ANALYSIS:
+            self.current_checkpoint.setdefault(table_name, {})[field_name] = data
+
+    def set_scope(self, scope: str):
+        """Limita il journal al database/schema indicato: le righe di altri scope vengono ignorate."""
+        with self._lock:
+            if scope != self.scope:
+                self.scope = scope
+                self._load_journal()
+
+    def record(self, stage: str, table_name: Optional[str], field_name: Optional[str], data: Any,
+               fingerprint: Optional[str] = None):
+        """
+        Aggiunge al journal il risultato di una fase per una colonna (o una tabella se field_name è None).
+        fingerprint è l'impronta della struttura della tabella da cui il risultato è stato ricavato.
+        """
+        line = json.dumps({"stage": stage, "table": table_name, "field": field_name, "data": data,
+                           "scope": self.scope, "fingerprint": fingerprint}, ensure_ascii=False, default=json_default)
+        with self._lock:
+            try:
+                if self._journal is None:
+                    self._journal = open(self.journal_file, 'a', encoding='utf-8')
+                    # chiude l'eventuale riga incompleta lasciata da un'interruzione
+                    if self._journal.tell() > 0:
+                        with open(self.journal_file, 'rb') as f:
+                            f.seek(-1, os.SEEK_END)
+                            if f.read(1) != b'\n':
+                                self._journal.write('\n')
+                self._journal.write(line + '\n')
+                self._journal.flush()
+                if self.fsync:
+                    os.fsync(self._journal.fileno())
+            except Exception as e:
+                logging.error(f"Errore nel salvataggio del checkpoint: {str(e)}")
+            self._apply(stage, table_name, field_name, data, fingerprint)
+        logging.debug(f"Checkpoint {stage} salvato per {table_name}.{field_name}")
+
+    def get(self, stage: str, table_name: Optional[str], field_name: Optional[str] = None,
+            default: Any = None, fingerprint: Optional[str] = None) -> Any:
+        """
+        Risultato registrato di una fase, o default se la fase non è ancora stata completata.
+        Se fingerprint è indicata, un risultato registrato con un'altra impronta viene scartato.
+        """
+        if not self.has(stage, table_name, field_name, fingerprint):
+            return default
+        return self.records[stage][(table_name, field_name)]
+
+    def has(self, stage: str, table_name: Optional[str], field_name: Optional[str] = None,
+            fingerprint: Optional[str] = None) -> bool:
+        key = (table_name, field_name)
+        with self._lock:
+            if key not in self.records.get(stage, {}):
+                return False
+            if fingerprint is not None and self.fingerprints[stage].get(key) != fingerprint:
+                # la riga resta finché record() non la sovrascrive con il nuovo risultato
+                logging.info(f"Checkpoint {stage} di {table_name}.{field_name} ignorato: la tabella è cambiata")
+                return False
+            return True
+
+    def clear(self):
+        """Cancella il journal, per iniziare una nuova analisi da zero."""
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            if self.journal_file.exists():
+                self.journal_file.unlink()
+            self.records = {}
+            self.fingerprints = {}
+            self.current_checkpoint = {}
+
+    def close(self):
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
     def save_checkpoint(self, table_name: str, field_name: str, data: Dict[str, Any]):
         """Salva un checkpoint per una specifica tabella e campo."""
-        try:
-            checkpoint_file = self.checkpoint_dir / "analysis_checkpoint.json"
-            
-            # Carica checkpoint esistente se presente
-            if checkpoint_file.exists():
-                with open(checkpoint_file, 'r', encoding='utf-8') as f:
-                    self.current_checkpoint = json.load(f)
-            
-            # Aggiorna il checkpoint
-            if table_name not in self.current_checkpoint:
-                self.current_checkpoint[table_name] = {}
-            self.current_checkpoint[table_name][field_name] = data
-            
-            # Salva il checkpoint aggiornato
-            with open(checkpoint_file, 'w', encoding='utf-8') as f:
-                json.dump(self.current_checkpoint, f, indent=2)
-                
-            logging.debug(f"Checkpoint salvato per {table_name}.{field_name}")
-            
-        except Exception as e:
-            logging.error(f"Errore nel salvataggio del checkpoint: {str(e)}")
-    
+        self.record(STAGE_ANALYSIS, table_name, field_name, data)
+
     def load_checkpoint(self) -> Dict[str, Any]:
         """Carica l'ultimo checkpoint salvato."""
         try:
-            checkpoint_file = self.checkpoint_dir / "analysis_checkpoint.json"
-            if checkpoint_file.exists():
-                with open(checkpoint_file, 'r', encoding='utf-8') as f:
-                    self.current_checkpoint = json.load(f)
-                logging.info(f"Checkpoint caricato: {len(self.current_checkpoint)} tabelle")
+            with self._lock:
+                self._load_journal()
+            logging.info(f"Checkpoint caricato: {len(self.current_checkpoint)} tabelle")
             return self.current_checkpoint
         except Exception as e:
             logging.error(f"Errore nel caricamento del checkpoint: {str(e)}")
             return {}
-    
+
     def is_field_processed(self, table_name: str, field_name: str) -> bool:
         """Verifica se un campo è già stato processato."""
-        return (table_name in self.current_checkpoint and 
+        return (table_name in self.current_checkpoint and
                 field_name in self.current_checkpoint[table_name])
-    
+
     def get_progress(self) -> tuple:
         """Restituisce il progresso corrente."""
         total_tables = len(self.current_checkpoint)
         total_fields = sum(len(fields) for fields in self.current_checkpoint.values())
-        return total_tables, total_fields
\ No newline at end of file
+        return total_tables, total_fields
+
+    def get_stage_progress(self) -> Dict[str, int]:
+        """Numero di colonne/tabelle completate per ciascuna fase."""
+        return {stage: len(records) for stage, records in self.records.items()}
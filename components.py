@@ -1,17 +1,22 @@
+import re
+import json
 from llama_index.core.llms import LLM
 from typing import Any, Dict, Iterable, List, Optional, Tuple
-from utils import extract_sql_from_llm_response, extract_simple_json_from_qwen
+from utils import extract_sql_from_llm_response, extract_simple_json_from_qwen, estimate_tokens, truncate_to_tokens
 from default_prompts import (
     DEFAULT_IS_DATE_TIME_FIELD_PROMPT,
     DEFAULT_NUMBER_CATEGORY_FIELD_PROMPT,
     DEFAULT_STRING_CATEGORY_FIELD_PROMPT,
     DEFAULT_UNKNOWN_FIELD_PROMPT,
+    DEFAULT_BATCH_FIELD_CATEGORY_PROMPT,
     DEFAULT_COLUMN_DESC_GEN_CHINESE_PROMPT,
     DEFAULT_COLUMN_DESC_GEN_ENGLISH_PROMPT,
     DEFAULT_TABLE_DESC_GEN_CHINESE_PROMPT,
     DEFAULT_TABLE_DESC_GEN_ENGLISH_PROMPT,
     DEFAULT_UNDERSTAND_FIELDS_BY_CATEGORY_PROMPT,
     DEFAULT_UNDERSTAND_DATABASE_PROMPT,
+    DEFAULT_UNDERSTAND_DATABASE_CHUNK_PROMPT,
+    DEFAULT_MERGE_DATABASE_SUMMARIES_PROMPT,
     DEFAULT_GET_DOMAIN_KNOWLEDGE_PROMPT,
     DEFAULT_DATE_TIME_MIN_GRAN_PROMPT,
     DEFAULT_SQL_GEN_PROMPT
@@ -41,6 +46,49 @@ def understand_database(db_mschema: str = '', llm: Optional[LLM] = None):
     return (db_info1 + '\n' + db_info2).strip()
 
 
+def understand_database_chunk(db_mschema: str = '', llm: Optional[LLM] = None):
+    """
+    Summary of a part of the database (map step of map-reduce database understanding).
+    """
+    return call_llm(DEFAULT_UNDERSTAND_DATABASE_CHUNK_PROMPT, llm, db_mschema=db_mschema)
+
+
+def merge_database_summaries(summaries: List[str], llm: Optional[LLM] = None, token_budget: int = 3000) -> str:
+    """
+    Reduce the summaries of the database parts to one summary. When they do not fit in token_budget,
+    they are merged group by group first. Summaries longer than half the budget are cut, so that every
+    group but the last one holds at least two summaries and each round reduces their number.
+    """
+    if len(summaries) == 1:
+        return summaries[0]
+    summaries = [truncate_to_tokens(summary, max(token_budget // 2, 1)) for summary in summaries]
+    groups, group, group_tokens = [], [], 0
+    for summary in summaries:
+        tokens = estimate_tokens(summary)
+        if len(group) > 0 and group_tokens + tokens > token_budget:
+            groups.append(group)
+            group, group_tokens = [], 0
+        group.append(summary)
+        group_tokens += tokens
+    groups.append(group)
+    if len(groups) > 1:
+        return merge_database_summaries([merge_database_summaries(g, llm, token_budget) for g in groups],
+                                        llm, token_budget)
+    summaries_str = '\n\n'.join('[Part {}]\n{}'.format(i + 1, summary.strip()) for i, summary in enumerate(summaries))
+    return call_llm(DEFAULT_MERGE_DATABASE_SUMMARIES_PROMPT, llm, summaries=summaries_str)
+
+
+def understand_database_from_summaries(summaries: List[str], llm: Optional[LLM] = None, token_budget: int = 3000):
+    """
+    Database understanding of a schema too large for one prompt (reduce step of map-reduce):
+    the summaries of its parts are merged into one summary, completed with the domain knowledge.
+    """
+    summaries = [summary for summary in summaries if len(summary.strip()) > 0]
+    db_info1 = merge_database_summaries(summaries, llm, token_budget) if len(summaries) > 0 else ''
+    db_info2 = call_llm(DEFAULT_GET_DOMAIN_KNOWLEDGE_PROMPT, llm, db_info=db_info1)
+    return (db_info1 + '\n' + db_info2).strip()
+
+
 def generate_column_desc(field_name: str, field_info_str: str = '', table_mschema: str = '',
         llm: Optional[LLM] = None, sql: Optional[str] = None, sql_res: Optional[str] = None,
         supp_info: Optional[str] = None, language: Optional[str] = 'CN'):
@@ -179,6 +227,72 @@ def field_category(field_type_cate: str, type_engine: TypeEngine, llm: Optional[
                     return code_res
 
 
+def parse_json_list_from_llm_response(llm_response: str) -> Optional[List]:
+    """
+    Parse a JSON array from LLM response, inside ```json ``` if present.
+    """
+    snippets = re.findall(r"```json(.*?)```", llm_response, re.DOTALL)
+    text = snippets[-1] if len(snippets) > 0 else llm_response
+    start, end = text.find('['), text.rfind(']')
+    if start < 0 or end < start:
+        return None
+    try:
+        data = json.loads(text[start: end + 1])
+    except json.JSONDecodeError:
+        return None
+    return data if isinstance(data, list) else None
+
+
+def batch_field_category(fields: List[Tuple[str, str, str]], type_engine: TypeEngine,
+                         llm: Optional[LLM] = None) -> List[Optional[Dict]]:
+    """
+    Classify several columns of a table with a single LLM call.
+    fields: [(field_name, field_type_cate, field_info_str)]
+    Return, for each column in order, {"category", "dim_or_meas", "min_gran"} or None
+    when the answer for that column is missing or invalid, so the caller can fall back to field_category.
+    """
+    label_res = {
+        'code': {"category": type_engine.field_category_code_label, "dim_or_meas": type_engine.dimension_label},
+        'enum': {"category": type_engine.field_category_enum_label, 'dim_or_meas': type_engine.dimension_label},
+        'datetime': {"category": type_engine.field_category_date_label, 'dim_or_meas': type_engine.dimension_label},
+        'measure': {"category": type_engine.field_category_measure_label, 'dim_or_meas': type_engine.measure_label},
+        'text': {"category": type_engine.field_category_text_label, 'dim_or_meas': type_engine.dimension_label},
+    }
+    allowed_labels = {
+        type_engine.field_type_string_label: ['enum', 'code', 'text'],
+        type_engine.field_type_number_label: ['enum', 'code', 'measure'],
+        type_engine.field_type_date_label: ['datetime'],
+    }
+
+    fields_info_str = []
+    for i, (field_name, field_type_cate, field_info_str) in enumerate(fields, 1):
+        labels = allowed_labels.get(field_type_cate, ['enum', 'code', 'text', 'measure'])
+        fields_info_str.append(f"[Column {i}: {field_name}] allowed categories: {', '.join(labels)}\n{field_info_str}")
+    llm_response = call_llm(DEFAULT_BATCH_FIELD_CATEGORY_PROMPT, llm, fields_info_str='\n\n'.join(fields_info_str))
+
+    answers = parse_json_list_from_llm_response(llm_response) or []
+    answers_by_name = {str(a.get('field_name', '')): a for a in answers if isinstance(a, dict)}
+    results = []
+    for i, (field_name, field_type_cate, field_info_str) in enumerate(fields):
+        answer = answers_by_name.get(field_name)
+        if answer is None and i < len(answers) and isinstance(answers[i], dict) and 'field_name' not in answers[i]:
+            answer = answers[i]
+        if answer is None:
+            results.append(None)
+            continue
+
+        label = str(answer.get('category', '')).strip().lower()
+        if answer.get('is_datetime') is True or field_type_cate == type_engine.field_type_date_label:
+            label = 'datetime'
+        if label not in label_res or (label != 'datetime' and
+                                      label not in allowed_labels.get(field_type_cate, label_res.keys())):
+            results.append(None)
+            continue
+        min_gran = str(answer.get('min_gran') or '').upper().strip() if label == 'datetime' else None
+        results.append({**label_res[label], "min_gran": min_gran})
+    return results
+
+
 def dummy_sql_generator(dialect: str, db_mschema: str, question: str, evidence: str = '',
                   llm: Optional[LLM] = None) -> None or str:
     """
@@ -1,8 +1,10 @@
 from typing import Optional
 import os
+import importlib.util
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
-from sqlalchemy.engine import Engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 
 def get_database_url() -> str:
     """
@@ -22,20 +24,85 @@ def get_database_url() -> str:
     
     return f"{db_type}://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
 
-def create_db_engine(database_url: Optional[str] = None) -> Engine:
+def set_session_statement_timeout(dbapi_connection, dialect_name: str, timeout: float):
+    """
+    Imposta il timeout di default delle query sulla sessione di una connessione DBAPI
+    (statement_timeout su Postgres, max_execution_time su MySQL).
+    """
+    timeout_ms = int(timeout * 1000)
+    if dialect_name == 'postgresql':
+        sql = f"SET statement_timeout = {timeout_ms}"
+    elif dialect_name == 'mysql':
+        sql = f"SET SESSION max_execution_time = {timeout_ms}"
+    else:
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(sql)
+    finally:
+        cursor.close()
+    # su Postgres SET è transazionale
+    dbapi_connection.commit()
+
+def create_db_engine(database_url: Optional[str] = None, pool_size: Optional[int] = None,
+                     max_overflow: Optional[int] = None, pool_pre_ping: bool = False,
+                     pool_recycle: Optional[int] = None, statement_timeout: Optional[float] = None,
+                     **engine_kwargs) -> Engine:
     """
     Crea e restituisce un'istanza del database engine
     
     Args:
         database_url: URL di connessione opzionale. Se non fornito, usa i parametri dal file .env
+        pool_size: Numero di connessioni mantenute nel pool (default di SQLAlchemy se None)
+        max_overflow: Connessioni aggiuntive oltre pool_size (default di SQLAlchemy se None)
+        pool_pre_ping: Verifica la connessione prima di riusarla dal pool
+        pool_recycle: Secondi dopo i quali una connessione del pool viene ricreata
+        statement_timeout: Timeout in secondi applicato a ogni query dal server (Postgres e MySQL)
         
     Returns:
         SQLAlchemy Engine instance
     """
     if database_url is None:
         database_url = get_database_url()
-        
-    return create_engine(database_url)
+
+    if pool_size is not None:
+        engine_kwargs['pool_size'] = pool_size
+    if max_overflow is not None:
+        engine_kwargs['max_overflow'] = max_overflow
+    if pool_recycle is not None:
+        engine_kwargs['pool_recycle'] = pool_recycle
+    engine = create_engine(database_url, pool_pre_ping=pool_pre_ping, **engine_kwargs)
+
+    if statement_timeout is not None:
+        @event.listens_for(engine, 'connect')
+        def _set_statement_timeout(dbapi_connection, connection_record):
+            set_session_statement_timeout(dbapi_connection, engine.dialect.name, statement_timeout)
+
+    return engine
+
+# Driver asyncio usati per ciascun dialetto
+ASYNC_DRIVERS = {
+    'postgresql': 'asyncpg',
+    'mysql': 'aiomysql',
+    'sqlite': 'aiosqlite',
+}
+
+def create_async_db_engine(database_url: Optional[str] = None, **engine_kwargs) -> AsyncEngine:
+    """
+    Crea un AsyncEngine sullo stesso database, sostituendo il driver con quello asyncio del dialetto
+    (asyncpg, aiomysql, aiosqlite). Usato dai metodi a* di SchemaEngine.
+    """
+    if database_url is None:
+        database_url = get_database_url()
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"Dialetto {backend} non supportato in modalità asincrona")
+    driver = ASYNC_DRIVERS[backend]
+    if importlib.util.find_spec(driver) is None:
+        raise ImportError(f"Il driver asincrono {driver} per {backend} non è installato: pip install {driver}")
+    url = url.set(drivername=f"{backend}+{driver}")
+    return create_async_engine(url, **engine_kwargs)
 
 # Esempio di utilizzo
 if __name__ == "__main__":
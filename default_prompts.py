@@ -102,6 +102,31 @@ DEFAULT_UNKNOWN_FIELD_PROMPT = PromptTemplate(
     prompt_type=PromptType.CUSTOM,
 )
 
+DEFAULT_BATCH_FIELD_CATEGORY_TMPL = """You are now a data analyst. Given information about several columns of a data table, classify every column.
+
+For each column, first decide whether it represents a datetime type. A datetime type is defined as a combination of one or more of the following: year, month, day, hour, minute, and second, with the constraints that the month must be between 1 and 12, the day between 1 and 31, the hour between 0 and 23, and the minute and second between 0 and 59.
+If it is a datetime column, give the minimum time unit it can represent, one of: YEAR, MONTH, DAY, WEEK, QUARTER, HOUR, MINUTE, SECOND, MILLISECOND, MICROSECOND, OTHER.
+Otherwise, give its category:
+enum: Enumeration type, where the values are confined to a predefined limited set, usually short and typically used for statuses or types.
+code: A code with specific meaning; its composition usually follows certain rules or standards, such as user IDs or identity card numbers.
+text: Free text, usually used for descriptions or explanations, with no restrictions on length; it can be any form of text.
+measure: A metric or measure that can be used for computations and aggregations, such as calculating averages or maximum values.
+The allowed categories of each column are given in its header.
+
+{fields_info_str}
+
+Answer with a JSON array containing one object per column, in the same order as the columns above, enclosed within ```json and ```:
+```json
+[{"field_name": "column name", "is_datetime": false, "category": "enum", "min_gran": null}]
+```
+Use "category": "datetime" together with a "min_gran" value for datetime columns.
+"""
+
+DEFAULT_BATCH_FIELD_CATEGORY_PROMPT = PromptTemplate(
+    DEFAULT_BATCH_FIELD_CATEGORY_TMPL,
+    prompt_type=PromptType.CUSTOM,
+)
+
 DEFAULT_COLUMN_DESC_GEN_CHINESE_TMPL = '''You are now a data analyst. Here is the column information and some sample data for a data table:
 
 {table_mschema}
@@ -173,6 +198,30 @@ DEFAULT_UNDERSTAND_DATABASE_PROMPT = PromptTemplate(
     prompt_type=PromptType.CUSTOM,
 )
 
+DEFAULT_UNDERSTAND_DATABASE_CHUNK_TMPL = '''You are now a data analyst. Here is a part of the schema of a database, made of related tables:
+
+{db_mschema}
+
+Please carefully read the above information and summarize what domain and type of data this part of the database stores. Keep the summary short and mention the main entities; there is no need to analyze each table individually.
+'''
+
+DEFAULT_UNDERSTAND_DATABASE_CHUNK_PROMPT = PromptTemplate(
+    DEFAULT_UNDERSTAND_DATABASE_CHUNK_TMPL,
+    prompt_type=PromptType.CUSTOM,
+)
+
+DEFAULT_MERGE_DATABASE_SUMMARIES_TMPL = '''You are now a data analyst. A large database has been split into parts, and here are the summaries of its parts:
+
+{summaries}
+
+Please carefully read the above summaries and analyze, at the database level, what domain and type of data the database primarily stores. Provide a summary only; there is no need to analyze each part individually.
+'''
+
+DEFAULT_MERGE_DATABASE_SUMMARIES_PROMPT = PromptTemplate(
+    DEFAULT_MERGE_DATABASE_SUMMARIES_TMPL,
+    prompt_type=PromptType.CUSTOM,
+)
+
 DEFAULT_GET_DOMAIN_KNOWLEDGE_TMPL = '''There is a database with the following basic information:
 {db_info}
 
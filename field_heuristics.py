@@ -0,0 +1,94 @@
+import re
+import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from type_engine import TypeEngine
+
+
+# ISO-like date/time formats and the minimum time granularity they represent
+DATE_TIME_PATTERNS = [
+    (re.compile(r'^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}\.\d{6}$'), 'MICROSECOND'),
+    (re.compile(r'^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}\.\d{3}$'), 'MILLISECOND'),
+    (re.compile(r'^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}$'), 'SECOND'),
+    (re.compile(r'^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}$'), 'MINUTE'),
+    (re.compile(r'^\d{4}-\d{2}-\d{2}$'), 'DAY'),
+    (re.compile(r'^\d{4}/\d{2}/\d{2}$'), 'DAY'),
+    (re.compile(r'^\d{4}-\d{2}$'), 'MONTH'),
+]
+
+INTEGER_TYPES = ['TINYINT', 'SMALLINT', 'MEDIUMINT', 'INT', 'INTEGER', 'BIGINT',
+                 'SMALLSERIAL', 'SERIAL', 'BIGSERIAL']
+
+
+def match_date_time_examples(examples: List) -> Optional[str]:
+    """
+    If every example is an ISO-like date/time string (and a valid date), return the minimum
+    time granularity of the format shared by all examples, otherwise None.
+    """
+    examples = [str(e).strip() for e in examples if e is not None and len(str(e).strip()) > 0]
+    if len(examples) == 0:
+        return None
+    for pattern, min_gran in DATE_TIME_PATTERNS:
+        if all(pattern.match(e) for e in examples):
+            try:
+                for e in examples:
+                    value = e.replace('/', '-')
+                    datetime.datetime.fromisoformat(value + '-01' if min_gran == 'MONTH' else value)
+            except ValueError:
+                return None
+            return min_gran
+    return None
+
+
+def heuristic_field_category(field_info: Dict, stats: Dict, examples: List, type_engine: TypeEngine,
+                             is_foreign_key: bool = False) -> Tuple[Optional[Dict], float]:
+    """
+    Deterministic column classification from M-Schema metadata, column statistics and sample values.
+    Return ({"category", "dim_or_meas", "min_gran"}, confidence), or (None, 0.0) if no rule applies.
+    Native date and bool columns are left to field_category, which never asks the LLM about their category.
+    """
+    code_res = {"category": type_engine.field_category_code_label,
+                "dim_or_meas": type_engine.dimension_label, "min_gran": None}
+    enum_res = {"category": type_engine.field_category_enum_label,
+                'dim_or_meas': type_engine.dimension_label, "min_gran": None}
+    measure_res = {"category": type_engine.field_category_measure_label,
+                   'dim_or_meas': type_engine.measure_label, "min_gran": None}
+    text_res = {"category": type_engine.field_category_text_label,
+                'dim_or_meas': type_engine.dimension_label, "min_gran": None}
+
+    field_type = field_info.get('type', '')
+    field_type_cate = type_engine.field_type_cate(field_type)
+    abbr_type = type_engine.field_type_abbr(field_type.upper())
+    if field_type_cate in [type_engine.field_type_date_label, type_engine.field_type_bool_label]:
+        return None, 0.0
+
+    total_num = stats.get('count', -1)
+    unique_num = stats.get('unique_count', -1)
+    max_len = stats.get('max_len', -1)
+    unique_ratio = unique_num / total_num if total_num > 0 and unique_num >= 0 else None
+
+    # 自增主键、单列主键和外键都是编码
+    if field_info.get('autoincrement', False) is True:
+        return code_res, 0.95
+    if field_info.get('primary_key', False) and field_info.get('unique', False) and \
+            (abbr_type in INTEGER_TYPES or field_type_cate == type_engine.field_type_string_label):
+        return code_res, 0.95
+    if is_foreign_key:
+        return code_res, 0.9
+
+    # 只有一个取值的字段
+    if unique_num == 1 and total_num > 1:
+        return enum_res, 0.9
+
+    if field_type_cate == type_engine.field_type_string_label:
+        min_gran = match_date_time_examples(examples)
+        if min_gran is not None:
+            return {"category": type_engine.field_category_date_label,
+                    "dim_or_meas": type_engine.dimension_label, "min_gran": min_gran}, 0.9
+        if unique_ratio is not None and total_num >= 100 and unique_num <= 20 and 0 <= max_len <= 32:
+            return enum_res, 0.85
+        if unique_ratio is not None and unique_ratio > 0.5 and max_len > 100:
+            return text_res, 0.85
+    elif field_type_cate == type_engine.field_type_number_label:
+        if abbr_type not in INTEGER_TYPES and unique_ratio is not None and unique_ratio > 0.5:
+            return measure_res, 0.85
+    return None, 0.0
@@ -0,0 +1,154 @@
+# Funzione: Cache delle risposte LLM indirizzata per contenuto.
+# La chiave è l'hash di (modello, prompt renderizzato, parametri di campionamento), così che
+# rieseguire main.py o retry_schema_gen.py dopo un'interruzione non ripaghi le chiamate già fatte.
+# Le risposte sono tenute in una LRU in memoria e opzionalmente in un file sqlite,
+# con scadenza (TTL) ed espulsione per numero di voci.
+# Le letture da disco non scrivono subito: gli aggiornamenti di accessed_at (usato dall'espulsione)
+# riguardano solo le voci non toccate da touch_interval secondi e sono salvati a blocchi.
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class LLMResponseCache:
+    """Cache a due livelli (LRU in memoria + sqlite su disco) delle risposte LLM."""
+
+    def __init__(self, cache_path: Optional[str] = None, max_memory_entries: int = 1024,
+                 max_disk_entries: Optional[int] = None, ttl: Optional[float] = None, enabled: bool = True,
+                 touch_interval: float = 60.0, touch_batch_size: int = 64):
+        self.enabled = enabled
+        self._max_memory_entries = max_memory_entries
+        self._max_disk_entries = max_disk_entries
+        self._ttl = ttl
+        self._touch_interval = touch_interval
+        self._touch_batch_size = touch_batch_size
+        # {key: accessed_at} letti da disco e non ancora salvati
+        self._pending_touches = {}
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if cache_path is not None:
+            self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, response TEXT, created_at REAL, accessed_at REAL)"
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, prompt: str, params: Optional[Dict[str, Any]] = None) -> str:
+        content = json.dumps([model, prompt, params or {}], ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self._ttl is not None and now - created_at > self._ttl
+
+    def get(self, key: str) -> Optional[str]:
+        """Restituisce la risposta in cache, o None se assente, scaduta o se la cache è disattivata."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[1], now):
+                    self._memory.move_to_end(key)
+                    return entry[0]
+                del self._memory[key]
+
+            if self._conn is None:
+                return None
+            row = self._conn.execute("SELECT response, created_at, accessed_at FROM llm_cache WHERE key = ?",
+                                     (key,)).fetchone()
+            if row is None:
+                return None
+            if self._expired(row[1], now):
+                self._pending_touches.pop(key, None)
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            if row[2] is None or now - row[2] > self._touch_interval:
+                self._pending_touches[key] = now
+                if len(self._pending_touches) >= self._touch_batch_size:
+                    self._flush_touches()
+            self._put_memory(key, row[0], row[1])
+            return row[0]
+
+    def _flush_touches(self):
+        """Salva in una sola transazione gli accessed_at in sospeso (da chiamare con il lock)."""
+        if self._conn is None or len(self._pending_touches) == 0:
+            return
+        touches = [(accessed_at, key) for key, accessed_at in self._pending_touches.items()]
+        self._pending_touches = {}
+        try:
+            self._conn.executemany("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", touches)
+            self._conn.commit()
+        except Exception as e:
+            logging.error(f"Errore nell'aggiornamento della cache LLM: {str(e)}")
+
+    def flush(self):
+        with self._lock:
+            self._flush_touches()
+
+    def _put_memory(self, key: str, response: str, created_at: float):
+        self._memory[key] = (response, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def put(self, key: str, response: str):
+        """Salva una risposta; le risposte vuote (chiamate fallite) non vengono salvate."""
+        if not self.enabled or not response:
+            return
+        now = time.time()
+        with self._lock:
+            self._put_memory(key, response, now)
+            if self._conn is None:
+                return
+            try:
+                self._pending_touches.pop(key, None)
+                self._conn.execute("INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?)", (key, response, now, now))
+                if self._max_disk_entries is not None:
+                    # l'espulsione ordina per accessed_at: prima salva gli accessi in sospeso
+                    self._flush_touches()
+                    self._conn.execute(
+                        "DELETE FROM llm_cache WHERE key NOT IN "
+                        "(SELECT key FROM llm_cache ORDER BY accessed_at DESC LIMIT ?)", (self._max_disk_entries,)
+                    )
+                self._conn.commit()
+            except Exception as e:
+                logging.error(f"Errore nel salvataggio della cache LLM: {str(e)}")
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._pending_touches = {}
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM llm_cache")
+                self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._flush_touches()
+                self._conn.close()
+                self._conn = None
+
+
+_default_cache: Optional[LLMResponseCache] = None
+
+
+def set_llm_cache(cache: Optional[LLMResponseCache]):
+    """Imposta la cache usata da call_llm / call_llm_message (None la disattiva)."""
+    global _default_cache
+    _default_cache = cache
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    return _default_cache
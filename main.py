@@ -1,9 +1,13 @@
 from database import create_db_engine
 from openrouter_llm import OpenRouterLLM
 from schema_engine import SchemaEngine
+from pipeline import SchemaPipeline
 from checkpoint_manager import CheckpointManager
+from stats_cache import StatsCache
+from llm_cache import LLMResponseCache, set_llm_cache
 from logger_config import setup_logger
 from tqdm import tqdm
+import os
 import signal
 import sys
 import time
@@ -11,6 +15,8 @@ import logging
 
 # Flag per gestire l'interruzione
 stop_processing = False
+# Pipeline in esecuzione (SCHEMA_PIPELINE=true), fermata all'interruzione
+active_pipeline = None
 
 def signal_handler(signum, frame):
     """Gestisce l'interruzione del processo."""
@@ -18,11 +24,14 @@ def signal_handler(signum, frame):
     if not stop_processing:
         print("\n⚠️ Richiesta interruzione. Completamento dell'operazione corrente...")
         stop_processing = True
+        if active_pipeline is not None:
+            active_pipeline.stop()
     else:
         print("\n⚠️ Forzatura interruzione...")
         sys.exit(1)
 
 def main():
+    global active_pipeline
     logger = None
     try:
         # Configura logging e gestione interruzioni
@@ -32,6 +41,9 @@ def main():
         # Inizializza checkpoint manager
         checkpoint_mgr = CheckpointManager()
         
+        # Cache delle risposte LLM: una nuova esecuzione non ripete le chiamate già fatte
+        set_llm_cache(LLMResponseCache(str(checkpoint_mgr.checkpoint_dir / 'llm_cache.sqlite')))
+        
         print("\n=== XiYan-DBDescGen: Generazione Descrizioni Database ===\n")
         
         # Inizializza il client OpenRouter (carica configurazione da .env)
@@ -50,20 +62,26 @@ def main():
             db_engine,
             llm=llm,
             db_name='timetable2',
-            comment_mode='merge'  # 'generation', 'merge', 'origin', o 'no_comment'
+            comment_mode='merge',  # 'generation', 'merge', 'origin', o 'no_comment'
+            stats_cache=StatsCache(str(checkpoint_mgr.checkpoint_dir / 'column_stats.sqlite')),
+            checkpoint=checkpoint_mgr
         )
         print("✓ SchemaEngine configurato")
         
+        # Con SCHEMA_PIPELINE=true profilazione dei campi e generazione descrizioni si sovrappongono tabella per tabella
+        use_pipeline = os.getenv('SCHEMA_PIPELINE', 'false').lower() in ('1', 'true', 'yes')
+        
         # Analisi dei campi
         print("\n4. Analisi dei campi...")
-        total_tables = len(schema_engine._usable_tables)
+        tables_to_analyze = [] if use_pipeline else schema_engine._usable_tables
+        total_tables = len(tables_to_analyze)
         
         # Carica l'ultimo checkpoint
         checkpoint = checkpoint_mgr.load_checkpoint()
         if checkpoint:
             print(f"ℹ️ Ripresa da checkpoint: {len(checkpoint)} tabelle già processate")
         
-        for i, table_name in enumerate(schema_engine._usable_tables, 1):
+        for i, table_name in enumerate(tables_to_analyze, 1):
             if stop_processing:
                 print("\n🛑 Interruzione richiesta. Salvataggio stato corrente...")
                 break
@@ -102,10 +120,18 @@ def main():
                 
                 time.sleep(0.1)  # Breve pausa per leggibilità
         
+        if use_pipeline and not stop_processing:
+            # Profilazione e generazione descrizioni in pipeline: la tabella N+1 è profilata mentre N è descritta
+            print("\n5. Generazione descrizioni (pipeline)...")
+            active_pipeline = SchemaPipeline(schema_engine, classify=False)
+            failures = active_pipeline.run()
+            active_pipeline = None
+        
         if not stop_processing:
             # Generazione descrizioni
-            print("\n5. Generazione descrizioni...")
-            schema_engine.table_and_column_desc_generation()
+            if not use_pipeline:
+                print("\n5. Generazione descrizioni...")
+                failures = schema_engine.table_and_column_desc_generation()
             
             # Salva lo schema generato
             print("\n6. Salvataggio schema...")
@@ -118,6 +144,12 @@ def main():
             print("\n7. Schema generato:")
             print(mschema.to_mschema())
             
+            # Analisi completa: il journal non serve più e non deve essere riusato dalla prossima esecuzione
+            if not failures:
+                checkpoint_mgr.clear()
+            else:
+                print(f"⚠️ {len(failures)} descrizioni non generate, il checkpoint viene mantenuto")
+            
             print("\n✅ Processo completato con successo!")
         else:
             print("\n⏸️ Processo interrotto. Lo stato è stato salvato nei checkpoint.")
@@ -1,6 +1,270 @@
-from utils import examples_to_str, read_json, write_json
+from utils import examples_to_str, json_default, read_json, write_json
 from type_engine import TypeEngine
-from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+from collections.abc import MutableMapping
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+
+# file suffixes saved and loaded as a sqlite file (one row per table) instead of JSON
+SQLITE_SUFFIXES = ('.sqlite', '.sqlite3', '.db')
+
+
+class LazyTables(MutableMapping):
+    """
+    Mapping table_name -> table info whose tables are loaded on first access.
+    The loader fills a table through MSchema.add_table/add_field/add_foreign_key; other threads
+    accessing a table while it is being loaded wait for the loader to finish.
+    """
+    def __init__(self, table_names: Iterable[str], loader: Callable[[str], None]):
+        self._order = list(table_names)
+        self._names = set(self._order)
+        self._data = {}
+        self._loader = loader
+        self._loaded = set()
+        self._loading = set()
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def _get_lock(self, table_name: str) -> threading.RLock:
+        with self._guard:
+            if table_name not in self._locks:
+                self._locks[table_name] = threading.RLock()
+            return self._locks[table_name]
+
+    def is_loaded(self, table_name: str) -> bool:
+        return table_name in self._loaded
+
+    def __getitem__(self, table_name: str) -> Dict:
+        if table_name in self._loaded:
+            return self._data[table_name]
+        if table_name not in self._names:
+            raise KeyError(table_name)
+        with self._get_lock(table_name):
+            # the loader itself re-enters here while it builds the table
+            if table_name not in self._loaded and table_name not in self._loading:
+                self._loading.add(table_name)
+                try:
+                    self._loader(table_name)
+                finally:
+                    self._loading.discard(table_name)
+                self._loaded.add(table_name)
+            return self._data[table_name]
+
+    def __setitem__(self, table_name: str, table_info: Dict):
+        self._data[table_name] = table_info
+        if table_name not in self._names:
+            self._names.add(table_name)
+            self._order.append(table_name)
+        if table_name not in self._loading:
+            self._loaded.add(table_name)
+
+    def __delitem__(self, table_name: str):
+        if table_name not in self._names:
+            raise KeyError(table_name)
+        self._names.discard(table_name)
+        self._order.remove(table_name)
+        self._data.pop(table_name, None)
+        self._loaded.discard(table_name)
+
+    def __contains__(self, table_name) -> bool:
+        # membership does not load the table
+        return table_name in self._names
+
+    def __iter__(self):
+        return iter(list(self._order))
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+
+def _intern(value: Any) -> Any:
+    return sys.intern(value) if type(value) is str else value
+
+
+class _SlotsMapping(MutableMapping):
+    """
+    Mapping whose common keys are stored in __slots__ instead of a per-object dict;
+    any other key goes to an extra dict created on first use. Unset slots are missing keys.
+    Once bound to its owner (the M-Schema of a table, the table of a column), every item set or deleted
+    is reported to the owner, which keeps its indexes and render cache in sync.
+    """
+    __slots__ = ('_extra', '_owner', '_name')
+    _slot_keys = frozenset()
+    # keys whose string values are interned (few distinct values shared by many objects)
+    _interned_keys = frozenset()
+
+    def __init__(self, data: Optional[Dict] = None):
+        self._extra = None
+        self._owner = None
+        self._name = None
+        if data is not None:
+            for key, value in data.items():
+                self[key] = value
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._slot_keys:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def __setitem__(self, key: str, value: Any):
+        if key in self._slot_keys:
+            setattr(self, key, _intern(value) if key in self._interned_keys else value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+        if self._owner is not None:
+            self._changed(key)
+
+    def __delitem__(self, key: str):
+        if key in self._slot_keys:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        elif self._extra is not None and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+        if self._owner is not None:
+            self._changed(key)
+
+    def _bind(self, owner: Any, name: str):
+        self._owner = owner
+        self._name = name
+
+    def _changed(self, key: str):
+        """report to the owner that an item was set or deleted"""
+        raise NotImplementedError
+
+    def __iter__(self):
+        for key in self.__slots__:
+            if hasattr(self, key):
+                yield key
+        if self._extra is not None:
+            yield from list(self._extra.keys())
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return '{}({})'.format(type(self).__name__, dict(self.items()))
+
+    def copy(self) -> Dict:
+        """plain dict copy, as dict.copy() gave before these mappings replaced the dicts"""
+        return self.to_dict()
+
+
+class _ExamplesList(list):
+    """
+    Example values of a FieldInfo, as interned strings. Changing the list in place (append, remove...)
+    is reported to the column like an assignment, so the M-Schema indexes and render cache stay in sync.
+    """
+    __slots__ = ('_field',)
+
+    def __init__(self, values: Iterable, field: 'FieldInfo'):
+        super().__init__(_intern(v) for v in values)
+        self._field = field
+
+    def _changed(self):
+        if self._field._owner is not None:
+            self._field._changed('examples')
+
+    def append(self, value: Any):
+        super().append(_intern(value))
+        self._changed()
+
+    def extend(self, values: Iterable):
+        super().extend(_intern(v) for v in values)
+        self._changed()
+
+    def insert(self, index: int, value: Any):
+        super().insert(index, _intern(value))
+        self._changed()
+
+    def __iadd__(self, values: Iterable):
+        self.extend(values)
+        return self
+
+
+def _notify_after(name: str) -> Callable:
+    method = getattr(list, name)
+
+    def notifying(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        self._changed()
+        return result
+
+    notifying.__name__ = name
+    return notifying
+
+
+for _name in ['__setitem__', '__delitem__', '__imul__', 'remove', 'pop', 'clear', 'sort', 'reverse']:
+    setattr(_ExamplesList, _name, _notify_after(_name))
+
+
+class FieldInfo(_SlotsMapping):
+    """
+    Column of M-Schema (type, keys, comment, examples, category...). Example values are interned strings,
+    so the values repeated across columns and databases are stored once; field_info['examples'] is the live list,
+    and changing it in place updates the column like an assignment.
+
+    Unlike the plain dict it replaces, it is not a dict subclass: json.dumps needs to_dict() or
+    default=utils.json_default (write_json and MSchema.save/dump do so), and copy() returns a plain dict.
+    """
+    __slots__ = ('type', 'primary_key', 'nullable', 'default', 'autoincrement', 'unique', 'comment',
+                 'examples', 'category', 'dim_or_meas')
+    _slot_keys = frozenset(__slots__)
+    _interned_keys = frozenset(['type', 'category', 'dim_or_meas'])
+
+    def __setitem__(self, key: str, value: Any):
+        if key == 'examples' and value is not None:
+            value = _ExamplesList(value, self)
+        super().__setitem__(key, value)
+
+    def _changed(self, key: str):
+        self._owner._field_changed(self._name, key)
+
+    def to_dict(self) -> Dict:
+        field_dict = dict(self.items())
+        if field_dict.get('examples') is not None:
+            field_dict['examples'] = list(field_dict['examples'])
+        return field_dict
+
+
+class TableInfo(_SlotsMapping):
+    """Table of M-Schema: {field_name: FieldInfo} plus the table properties."""
+    __slots__ = ('fields', 'examples', 'comment')
+    _slot_keys = frozenset(__slots__)
+
+    def __setitem__(self, key: str, value: Any):
+        if key == 'fields':
+            value = {sys.intern(field_name): field_info if isinstance(field_info, FieldInfo) else FieldInfo(field_info)
+                     for field_name, field_info in value.items()}
+        super().__setitem__(key, value)
+
+    def _changed(self, key: str):
+        self._owner._table_changed(self._name, key)
+
+    def _field_changed(self, field_name: str, key: str):
+        if self._owner is not None:
+            self._owner._field_changed(self._name, field_name, key)
+
+    def to_dict(self) -> Dict:
+        table_dict = dict(self.items())
+        if 'fields' in table_dict:
+            table_dict['fields'] = {field_name: field_info.to_dict()
+                                    for field_name, field_info in table_dict['fields'].items()}
+        return table_dict
 
 
 class MSchema:
@@ -11,16 +275,125 @@ class MSchema:
         self.tables = {}
         self.foreign_keys = []
         self.type_engine = type_engine
+        # rendered tables: {table_name: {render options: (header, [(field_name, field line)], fragment)}};
+        # column selections are filtered from the rendered lines, so there is one entry per render options
+        self._render_cache = {}
+        # bumped by every change of a table, so a fragment rendered concurrently with a change is not cached
+        self._render_versions = {}
+        self._render_guard = threading.Lock()
+        # sqlite file the tables are lazily read from (see load)
+        self._store = None
+        self._store_path = None
+        self._store_lock = threading.Lock()
+        # secondary indexes, updated by add_table/add_field/set_column_property/add_foreign_key:
+        # {table_name: {'category'|'dim_or_meas'|'type_category': {value: {field_name: None}}}}
+        self._field_index = {}
+        # {table_name: {field_name: position}}, to return indexed fields in table order
+        self._field_positions = {}
+        # positions in foreign_keys of the keys going out of / referencing a table, by lowercase table name
+        self._fk_out = {}
+        self._fk_in = {}
+        self._index_guard = threading.RLock()
+
+    def invalidate_table_cache(self, table_name: Optional[str] = None):
+        """drop the rendered fragments of a table (None: of all tables); called by every setter of M-Schema"""
+        with self._render_guard:
+            if table_name is None:
+                for name in list(self._render_versions.keys()) + list(self._render_cache.keys()):
+                    self._render_versions[name] = self._render_versions.get(name, 0) + 1
+                self._render_cache = {}
+            else:
+                self._render_versions[table_name] = self._render_versions.get(table_name, 0) + 1
+                self._render_cache.pop(table_name, None)
+
+    def _indexed_values(self, field_info: Dict) -> List[Tuple[str, Any]]:
+        values = [('category', field_info.get('category', '')), ('dim_or_meas', field_info.get('dim_or_meas', ''))]
+        if self.type_engine is not None:
+            values.append(('type_category', self.type_engine.field_type_cate(field_info.get('type', '') or '')))
+        return values
+
+    def _index_field(self, table_name: str, field_name: str):
+        table_info = self.tables[table_name]
+        field_info = table_info['fields'][field_name]
+        if isinstance(field_info, FieldInfo):
+            field_info._bind(table_info, field_name)
+        with self._index_guard:
+            positions = self._field_positions.setdefault(table_name, {})
+            if field_name not in positions:
+                positions[field_name] = len(positions)
+            table_index = self._field_index.setdefault(table_name, {})
+            for key, value in self._indexed_values(field_info):
+                table_index.setdefault(key, {}).setdefault(value, {})[field_name] = None
+
+    def _unindex_field(self, table_name: str, field_name: str):
+        with self._index_guard:
+            for values in self._field_index.get(table_name, {}).values():
+                for fields in values.values():
+                    fields.pop(field_name, None)
+
+    def _index_table(self, table_name: str):
+        table_info = self.tables[table_name]
+        if isinstance(table_info, TableInfo):
+            table_info._bind(self, table_name)
+        with self._index_guard:
+            self._field_index.pop(table_name, None)
+            self._field_positions.pop(table_name, None)
+            for field_name in self.tables[table_name]['fields'].keys():
+                self._index_field(table_name, field_name)
+
+    def _index_foreign_key(self, position: int):
+        fk = self.foreign_keys[position]
+        with self._index_guard:
+            self._fk_out.setdefault(fk[0].lower(), []).append(position)
+            self._fk_in.setdefault(fk[3].lower(), []).append(position)
+
+    def rebuild_indexes(self):
+        """
+        rebuild the secondary indexes; the tables of a lazily loaded M-Schema not loaded yet are indexed
+        when they are loaded
+        """
+        with self._index_guard:
+            self._field_index = {}
+            self._field_positions = {}
+            self._fk_out = {}
+            self._fk_in = {}
+            for position in range(len(self.foreign_keys)):
+                self._index_foreign_key(position)
+            for table_name in self.tables.keys():
+                if not isinstance(self.tables, LazyTables) or self.tables.is_loaded(table_name):
+                    self._index_table(table_name)
+
+    def _table_changed(self, table_name: str, key: str):
+        """item set or deleted on a TableInfo"""
+        if key == 'fields':
+            self._index_table(table_name)
+        self.invalidate_table_cache(table_name)
+
+    def _field_changed(self, table_name: str, field_name: str, key: str):
+        """item set or deleted on a FieldInfo"""
+        if key in ['category', 'dim_or_meas', 'type']:
+            with self._index_guard:
+                self._unindex_field(table_name, field_name)
+                self._index_field(table_name, field_name)
+        self.invalidate_table_cache(table_name)
+
+    def set_table_loader(self, table_names: Iterable[str], loader: Callable[[str], None]):
+        """declare the tables without loading them: loader(table_name) fills a table on first access"""
+        self.tables = LazyTables(table_names, loader)
+        self.invalidate_table_cache()
+        self.rebuild_indexes()
 
     def add_table(self, name, fields={}, comment=None):
-        self.tables[name] = {"fields": fields.copy(), 'examples': [], 'comment': comment}
+        self.tables[sys.intern(name)] = TableInfo({"fields": fields, 'examples': [], 'comment': comment})
+        self.invalidate_table_cache(name)
+        self._index_table(name)
 
     def add_field(self, table_name: str, field_name: str, field_type: str = "",
             primary_key: bool = False, nullable: bool = True, default: Any = None,
             autoincrement: bool = False, unique: bool = False,
             comment: str = "",
             examples: list = [], category: str = '', dim_or_meas: Optional[str] = '', **kwargs):
-        self.tables[table_name]["fields"][field_name] = {
+        self.tables[table_name]["fields"][sys.intern(field_name)] = FieldInfo({
             "type": field_type,
             "primary_key": primary_key,
             "nullable": nullable,
@@ -28,13 +401,31 @@ class MSchema:
             "autoincrement": autoincrement,
             "unique": unique,
             "comment": comment,
-            "examples": examples.copy(),
+            "examples": examples,
             "category": category,
             "dim_or_meas": dim_or_meas,
-            **kwargs}
+            **kwargs})
+        self.invalidate_table_cache(table_name)
+        self._unindex_field(table_name, field_name)
+        self._index_field(table_name, field_name)
 
     def add_foreign_key(self, table_name, field_name, ref_schema, ref_table_name, ref_field_name):
-        self.foreign_keys.append([table_name, field_name, ref_schema, ref_table_name, ref_field_name])
+        with self._index_guard:
+            self.foreign_keys.append([table_name, field_name, ref_schema, ref_table_name, ref_field_name])
+            self._index_foreign_key(len(self.foreign_keys) - 1)
+
+    def get_foreign_keys(self, table_name: str) -> List[List]:
+        """foreign keys of a table: [table_name, field_name, ref_schema, ref_table_name, ref_field_name]"""
+        return [self.foreign_keys[i] for i in self._fk_out.get(table_name.lower(), [])
+                if self.foreign_keys[i][0] == table_name]
+
+    def get_referencing_foreign_keys(self, table_name: str) -> List[List]:
+        """foreign keys of other tables referencing a table"""
+        return [self.foreign_keys[i] for i in self._fk_in.get(table_name.lower(), [])
+                if self.foreign_keys[i][3] == table_name]
+
+    def is_foreign_key(self, table_name: str, field_name: str) -> bool:
+        return any(fk[1] == field_name for fk in self.get_foreign_keys(table_name))
 
     def get_abbr_field_type(self, field_type, simple_mode=True)->str:
         if not simple_mode:
@@ -46,6 +437,7 @@ class MSchema:
         """clear all table descriptions."""
         for table_name in self.tables.keys():
             self.tables[table_name]['comment'] = ''
+        self.invalidate_table_cache()
 
     def erase_all_column_comment(self):
         """clear all column descriptions."""
@@ -53,6 +445,7 @@ class MSchema:
             fields = self.tables[table_name]['fields']
             for field_name, field_info in fields.items():
                 self.tables[table_name]['fields'][field_name]['comment'] = ''
+        self.invalidate_table_cache()
 
     def has_table(self, table_name: str) -> bool:
         """check if given table_name exists in M-Schema"""
@@ -74,20 +467,44 @@ class MSchema:
         if not self.has_table(table_name):
             print("The table name {} does not exist in M-Schema.".format(table_name))
         else:
+            # the TableInfo reports the change (render cache, indexes)
             self.tables[table_name][key] = value
 
     def set_column_property(self, table_name: str, field_name: str, key: str, value: Any):
         if not self.has_column(table_name, field_name):
             print("The table name {} or column name {} does not exist in M-Schema.".format(table_name, field_name))
         else:
+            # the FieldInfo reports the change (render cache, indexes)
             self.tables[table_name]['fields'][field_name][key] = value
 
     def get_field_info(self, table_name: str, field_name: str) -> Dict:
+        """FieldInfo of the column ({} if missing); use to_dict() for a JSON-serializable copy"""
         try:
             return self.tables[table_name]['fields'][field_name]
         except:
             return {}
 
+    def table_fingerprint(self, table_name: str) -> str:
+        """
+        Hash of the table structure: column names, types and key/nullable/unique flags.
+        It changes whenever the table is altered, so it can be used to invalidate derived data.
+        """
+        fields = self.tables[table_name]['fields']
+        structure = [[field_name, field_info.get('type', ''), field_info.get('primary_key', False),
+                      field_info.get('nullable', True), field_info.get('unique', False)]
+                     for field_name, field_info in fields.items()]
+        content = json.dumps([table_name, structure], ensure_ascii=False)
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+    def column_fingerprint(self, table_name: str, field_name: str) -> str:
+        """Hash of the column structure: name, type, default and key/nullable/unique flags."""
+        field_info = self.tables[table_name]['fields'][field_name]
+        structure = [table_name, field_name, field_info.get('type', ''), field_info.get('default', None),
+                     field_info.get('primary_key', False), field_info.get('nullable', True),
+                     field_info.get('unique', False)]
+        content = json.dumps(structure, ensure_ascii=False)
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
     def get_category_fields(self, category: str, table_name: str) -> List:
         """
         Dato table_name e category, ottenere tutti i nomi dei campi di tipo category nella tabella corrente.
@@ -95,32 +512,60 @@ class MSchema:
         """
         assert category in self.type_engine.field_category_all_labels, \
                         'Invalid category {}'.format(category)
-        if self.has_table(table_name):
-            res = []
-            fields = self.tables[table_name]['fields']
-            for field_name, field_info in fields.items():
-                _ = field_info.get('category', '')
-                if _ == category:
-                    res.append(field_name)
-            return res
-        else:
-            return []
+        return self.get_indexed_fields(table_name, 'category', category)
 
     def get_dim_or_meas_fields(self, dim_or_meas: str, table_name: str) -> List:
         assert dim_or_meas in self.type_engine.dim_measure_labels, 'Invalid dim_or_meas {}'.format(dim_or_meas)
-        if self.has_table(table_name):
-            res = []
-            fields = self.tables[table_name]['fields']
-            for field_name, field_info in fields.items():
-                _ = field_info.get('dim_or_meas', '')
-                if _ == dim_or_meas:
-                    res.append(field_name)
-            return res
-        else:
+        return self.get_indexed_fields(table_name, 'dim_or_meas', dim_or_meas)
+
+    def get_type_category_fields(self, type_category: str, table_name: str) -> List:
+        """fields of a table whose type is of type_category (type_engine.field_type_cate)"""
+        return self.get_indexed_fields(table_name, 'type_category', type_category)
+
+    def get_indexed_fields(self, table_name: str, key: str, value: Any) -> List:
+        """fields of a table whose indexed property key ('category', 'dim_or_meas', 'type_category') is value"""
+        if not self.has_table(table_name):
             return []
+        # a lazily declared table is loaded (and indexed) on first access
+        self.tables[table_name]
+        with self._index_guard:
+            fields = list(self._field_index.get(table_name, {}).get(key, {}).get(value, {}).keys())
+            positions = self._field_positions.get(table_name, {})
+            return sorted(fields, key=lambda field_name: positions.get(field_name, 0))
 
     def single_table_mschema(self, table_name: str, selected_columns: Optional[List] = None, example_num=3, show_type_detail=False) -> str:
-        table_info = self.tables.get(table_name, {})
+        """
+        M-Schema of a table. The rendered lines are cached per render options until the table is changed
+        through the setters of M-Schema (tables modified in place must call invalidate_table_cache);
+        a column selection is filtered from the cached lines.
+        """
+        key = (self.schema, example_num, show_type_detail)
+        with self._render_guard:
+            cached = self._render_cache.get(table_name, {}).get(key, None)
+            version = self._render_versions.get(table_name, 0)
+        if cached is None:
+            table_info = self.tables.get(table_name, None)
+            if table_info is None:
+                raise KeyError(table_name)
+            header, field_lines = self._render_table(table_name, table_info, example_num, show_type_detail)
+            cached = (header, field_lines, self._join_table_lines(header, [line for _, line in field_lines]))
+            with self._render_guard:
+                if self._render_versions.get(table_name, 0) == version:
+                    self._render_cache.setdefault(table_name, {})[key] = cached
+        header, field_lines, fragment = cached
+        if selected_columns is None:
+            return fragment
+        selected_columns = set(selected_columns)
+        return self._join_table_lines(header, [line for field_name, line in field_lines
+                                               if field_name.lower() in selected_columns])
+
+    @staticmethod
+    def _join_table_lines(header: str, field_lines: List[str]) -> str:
+        return '\n'.join([header, '[', ',\n'.join(field_lines), ']'])
+
+    def _render_table(self, table_name: str, table_info: Dict, example_num: int,
+                      show_type_detail: bool) -> Tuple[str, List[Tuple[str, str]]]:
+        """table header and (field_name, field line) of every column"""
         output = []
         table_comment = table_info.get('comment', '')
         if table_comment is not None and table_comment != 'None' and len(table_comment) > 0:
@@ -137,9 +582,6 @@ class MSchema:
         field_lines = []
         # Elaborare ogni campo nella tabella
         for field_name, field_info in table_info['fields'].items():
-            if selected_columns is not None and field_name.lower() not in selected_columns:
-                continue
-
             raw_type = self.get_abbr_field_type(field_info['type'], not show_type_detail)
             field_line = f"({field_name}:{raw_type.upper()}"
             if len(field_info['comment']) > 0:
@@ -151,7 +593,7 @@ class MSchema:
                 field_line += f", Primary Key"
 
             # Se ci sono esempi, aggiungerli
-            if len(field_info.get('examples', [])) > 0 and example_num > 0:
+            if len(field_info.get('examples') or []) > 0 and example_num > 0:
                 examples = field_info['examples']
                 examples = [s for s in examples if s is not None]
                 examples = examples_to_str(examples)
@@ -176,12 +618,8 @@ class MSchema:
                 field_line += ""
             field_line += ")"
 
-            field_lines.append(field_line)
-        output.append('[')
-        output.append(',\n'.join(field_lines))
-        output.append(']')
-
-        return '\n'.join(output)
+            field_lines.append((field_name, field_line))
+        return output[0], field_lines
 
     def to_mschema(self, selected_tables: List = None, selected_columns: List = None,
                    example_num=3, show_type_detail=False) -> str:
@@ -196,14 +634,15 @@ class MSchema:
         output.append(f"【Schema】")
 
         if selected_tables is not None:
-            selected_tables = [s.lower() for s in selected_tables]
+            selected_tables = {s.lower() for s in selected_tables}
         if selected_columns is not None:
-            selected_columns = [s.lower() for s in selected_columns]
-            selected_tables = [s.split('.')[0].lower() for s in selected_columns]
+            selected_columns = {s.lower() for s in selected_columns}
+            selected_tables = {s.split('.')[0].lower() for s in selected_columns}
 
         # Elaborare ogni tabella in sequenza
-        for table_name, table_info in self.tables.items():
+        for table_name in self.tables.keys():
             if selected_tables is None or table_name.lower() in selected_tables:
+                table_info = self.tables[table_name]
                 column_names = list(table_info['fields'].keys())
                 if selected_columns is not None:
                     cur_selected_columns = [c for c in column_names if f"{table_name}.{c}".lower() in selected_columns]
@@ -214,7 +653,14 @@ class MSchema:
         # Aggiungere informazioni sulla chiave esterna; quando table_type è impostato su view, non mostrare le chiavi esterne
         if self.foreign_keys:
             output.append("【Foreign keys】")
-            for fk in self.foreign_keys:
+            if selected_tables is None:
+                foreign_keys = self.foreign_keys
+            else:
+                # only the foreign keys going out of the selected tables, in their original order
+                with self._index_guard:
+                    positions = sorted(i for table_name in selected_tables for i in self._fk_out.get(table_name, []))
+                foreign_keys = [self.foreign_keys[i] for i in positions]
+            for fk in foreign_keys:
                 ref_schema = fk[2]
                 table1, column1, _, table2, column2 = fk
                 if selected_tables is None or \
@@ -228,18 +674,115 @@ class MSchema:
         schema_dict = {
             "db_id": self.db_id,
             "schema": self.schema,
-            "tables": self.tables,
+            "tables": {table_name: table_info.to_dict() if isinstance(table_info, TableInfo) else table_info
+                       for table_name, table_info in self.tables.items()},
             "foreign_keys": self.foreign_keys
         }
         return schema_dict
 
     def save(self, file_path: str):
-        schema_dict = self.dump()
-        write_json(file_path, schema_dict)
+        """save as JSON, or as a sqlite file written table by table when the suffix is .sqlite/.sqlite3/.db"""
+        if file_path.lower().endswith(SQLITE_SUFFIXES):
+            self.save_sqlite(file_path)
+        else:
+            schema_dict = self.dump()
+            write_json(file_path, schema_dict)
 
-    def load(self, file_path: str):
+    def save_sqlite(self, file_path: str):
+        """
+        Save to a sqlite file with one JSON row per table, so only one table at a time is serialized
+        (and, for a lazily loaded M-Schema, loaded). The file is written aside and then replaced;
+        saving over the file the M-Schema is lazily loaded from reopens it once replaced.
+        """
+        tmp_path = file_path + '.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.execute("CREATE TABLE mschema_meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute("CREATE TABLE mschema_tables (position INTEGER, table_name TEXT PRIMARY KEY, data TEXT)")
+            conn.executemany("INSERT INTO mschema_meta VALUES (?, ?)",
+                             [(key, json.dumps(value, ensure_ascii=False)) for key, value in
+                              [("db_id", self.db_id), ("schema", self.schema), ("foreign_keys", self.foreign_keys)]])
+            for position, table_name in enumerate(self.tables.keys()):
+                data = self._read_stored_table(table_name)
+                if data is None:
+                    table_info = self.tables[table_name]
+                    table_dict = table_info.to_dict() if isinstance(table_info, TableInfo) else table_info
+                    data = json.dumps(table_dict, ensure_ascii=False, default=json_default)
+                conn.execute("INSERT INTO mschema_tables VALUES (?, ?, ?)", (position, table_name, data))
+            conn.commit()
+        finally:
+            conn.close()
+        with self._store_lock:
+            if self._store is not None and os.path.abspath(file_path) == self._store_path:
+                # the new file holds every table, those not loaded yet included
+                self._store.close()
+                os.replace(tmp_path, file_path)
+                self._store = sqlite3.connect(file_path, check_same_thread=False)
+            else:
+                os.replace(tmp_path, file_path)
+
+    def load(self, file_path: str, lazy: bool = True):
+        """
+        load a M-Schema saved by save. A sqlite file is opened lazily by default:
+        only the table names are read, and every table is read on first access.
+        """
+        if file_path.lower().endswith(SQLITE_SUFFIXES):
+            self.load_sqlite(file_path, lazy)
+            return
+        self.close()
         data = read_json(file_path)
         self.db_id = data.get("db_id", "Anonymous")
         self.schema = data.get("schema", None)
-        self.tables = data.get("tables", {})
+        self.tables = {sys.intern(table_name): TableInfo(table_info)
+                       for table_name, table_info in data.get("tables", {}).items()}
         self.foreign_keys = data.get("foreign_keys", [])
+        self.invalidate_table_cache()
+        self.rebuild_indexes()
+
+    def load_sqlite(self, file_path: str, lazy: bool = True):
+        self.close()
+        conn = sqlite3.connect(file_path, check_same_thread=False)
+        meta = {key: json.loads(value) for key, value in conn.execute("SELECT key, value FROM mschema_meta")}
+        self.db_id = meta.get("db_id", "Anonymous")
+        self.schema = meta.get("schema", None)
+        self.foreign_keys = meta.get("foreign_keys", [])
+        if lazy:
+            table_names = [row[0] for row in conn.execute("SELECT table_name FROM mschema_tables ORDER BY position")]
+            self._store = conn
+            self._store_path = os.path.abspath(file_path)
+            self.set_table_loader(table_names, self._load_stored_table)
+        else:
+            try:
+                self.tables = {sys.intern(table_name): TableInfo(json.loads(data)) for table_name, data in
+                               conn.execute("SELECT table_name, data FROM mschema_tables ORDER BY position")}
+            finally:
+                conn.close()
+            self.invalidate_table_cache()
+            self.rebuild_indexes()
+
+    def _read_stored_table(self, table_name: str) -> Optional[str]:
+        """stored JSON of a table not loaded yet from the sqlite file (None if loaded or not lazily loaded)"""
+        if not isinstance(self.tables, LazyTables) or self.tables.is_loaded(table_name):
+            return None
+        with self._store_lock:
+            if self._store is None:
+                return None
+            row = self._store.execute("SELECT data FROM mschema_tables WHERE table_name = ?", (table_name,)).fetchone()
+        return row[0] if row is not None else None
+
+    def _load_stored_table(self, table_name: str):
+        data = self._read_stored_table(table_name)
+        if data is None:
+            raise KeyError(table_name)
+        self.tables[table_name] = TableInfo(json.loads(data))
+        self._index_table(table_name)
+
+    def close(self):
+        """close the sqlite file of a lazily loaded M-Schema (tables not read yet are no longer available)"""
+        with self._store_lock:
+            if self._store is not None:
+                self._store.close()
+                self._store = None
+                self._store_path = None
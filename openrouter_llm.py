@@ -1,17 +1,24 @@
-from typing import Any, List, Mapping, Optional, Sequence, AsyncGenerator
+from typing import Any, AsyncGenerator, Generator, List, Mapping, Optional, Sequence
 import os
 import json
 import time
 import random
+import asyncio
 import requests
+import httpx
+from requests.adapters import HTTPAdapter
 import logging
 import sys
 from dotenv import load_dotenv
+from rate_limiter import get_rate_limiter
 from llama_index.core.llms import (
     LLM,
     ChatMessage,
     ChatResponse,
+    ChatResponseAsyncGen,
+    ChatResponseGen,
     CompletionResponse,
+    CompletionResponseAsyncGen,
     LLMMetadata,
     CompletionResponseGen
 )
@@ -21,6 +28,9 @@ class OpenRouterError(Exception):
     """Errore personalizzato per OpenRouter."""
     pass
 
+# Finestra di contesto usata quando quella del modello non è nota
+DEFAULT_CONTEXT_WINDOW = 4096
+
 class OpenRouterLLM(LLM):
     """OpenRouter LLM implementation for XiYan-DBDescGen."""
     
@@ -32,7 +42,12 @@ class OpenRouterLLM(LLM):
         initial_retry_delay: float = 1.0,
         max_retry_delay: float = 60.0,
         timeout: int = 30,
-        requests_per_minute: int = 30
+        requests_per_minute: int = 30,
+        tokens_per_minute: Optional[int] = None,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        context_window: Optional[int] = None,
+        num_output: int = 1000
     ) -> None:
         """Initialize OpenRouter LLM."""
         super().__init__()
@@ -49,7 +64,22 @@ class OpenRouterLLM(LLM):
         self._initial_retry_delay = initial_retry_delay
         self._max_retry_delay = max_retry_delay
         self._requests_per_minute = requests_per_minute
-        self._last_request_time = 0
+        # Finestra di contesto: esplicita, da .env, oppure letta dall'endpoint /models alla prima richiesta
+        context_window = context_window or os.getenv("OPENROUTER_CONTEXT_WINDOW")
+        self._context_window = int(context_window) if context_window else None
+        self._num_output = num_output
+        # Token bucket condiviso da tutte le istanze con la stessa API key
+        self._rate_limiter = get_rate_limiter(self._api_key, requests_per_minute, tokens_per_minute)
+
+        # Connessioni HTTP keep-alive riutilizzate tra le chiamate (sync e async)
+        self._max_connections = max_connections
+        self._max_keepalive_connections = max_keepalive_connections
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self._async_client = None
+        self._async_client_loop = None
         
         # Configura logger
         self._logger = logging.getLogger("OpenRouterLLM")
@@ -70,17 +100,69 @@ class OpenRouterLLM(LLM):
             console_handler.setFormatter(console_formatter)
             self._logger.addHandler(console_handler)
 
-    def _wait_for_rate_limit(self):
+    def _estimate_tokens(self, payload: dict) -> int:
+        """Stima approssimativa dei token di una richiesta (prompt + max_tokens)."""
+        prompt_chars = sum(len(msg["content"]) for msg in payload["messages"])
+        return prompt_chars // 4 + payload.get("max_tokens", 0)
+
+    def _wait_for_rate_limit(self, tokens: int = 0):
         """Attende se necessario per rispettare il rate limit."""
-        elapsed = time.time() - self._last_request_time
-        min_interval = 60.0 / self._requests_per_minute
-        
-        if elapsed < min_interval:
-            wait_time = min_interval - elapsed
-            self._logger.debug(f"Rate limiting: waiting {wait_time:.2f}s")
-            time.sleep(wait_time)
-        
-        self._last_request_time = time.time()
+        wait_time = self._rate_limiter.acquire(tokens)
+        if wait_time > 0:
+            self._logger.debug(f"Rate limiting: waited {wait_time:.2f}s")
+
+    async def _await_rate_limit(self, tokens: int = 0):
+        """Versione async di _wait_for_rate_limit."""
+        wait_time = await self._rate_limiter.aacquire(tokens)
+        if wait_time > 0:
+            self._logger.debug(f"Rate limiting: waited {wait_time:.2f}s")
+
+    def _record_response(self, response_json: dict, estimated_tokens: int):
+        """Aggiorna il rate limiter con i token effettivamente consumati."""
+        usage = response_json.get("usage") or {}
+        self._rate_limiter.record_usage(estimated_tokens, usage.get("total_tokens"))
+
+    async def _get_async_client(self) -> httpx.AsyncClient:
+        """
+        Client httpx condiviso, ricreato se cambia l'event loop corrente (ad es. a ogni asyncio.run).
+        Il client del loop precedente viene chiuso, così le sue connessioni non restano aperte.
+        """
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client_loop is not loop or self._async_client.is_closed:
+            previous_client, previous_loop = self._async_client, self._async_client_loop
+            self._async_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self._max_connections,
+                    max_keepalive_connections=self._max_keepalive_connections
+                ),
+                timeout=self._timeout
+            )
+            self._async_client_loop = loop
+            if previous_client is not None and not previous_client.is_closed:
+                await self._close_async_client(previous_client, previous_loop)
+        return self._async_client
+
+    async def _close_async_client(self, client: httpx.AsyncClient, loop: Optional[asyncio.AbstractEventLoop]):
+        """Chiude il client di un altro event loop: nel suo loop se è ancora attivo, altrimenti qui."""
+        try:
+            if loop is not None and loop.is_running() and not loop.is_closed():
+                asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+            else:
+                await client.aclose()
+        except Exception as e:
+            # i socket legati a un loop già chiuso vengono rilasciati dal garbage collector
+            self._logger.debug(f"Unable to close the previous async client: {str(e)}")
+
+    def close(self) -> None:
+        """Chiude le connessioni HTTP sincrone."""
+        self._session.close()
+
+    async def aclose(self) -> None:
+        """Chiude le connessioni HTTP asincrone."""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+            self._async_client_loop = None
 
     @property
     def _headers(self) -> dict:
@@ -91,12 +173,32 @@ class OpenRouterLLM(LLM):
             "HTTP-Referer": "https://DBDescGen",
         }
 
+    def _fetch_context_window(self) -> int:
+        """Legge la context_length del modello dall'endpoint /models di OpenRouter."""
+        try:
+            response = self._session.get(f"{self._base_url}/models", headers=self._headers, timeout=self._timeout)
+            response.raise_for_status()
+            for model in response.json().get("data", []):
+                if model.get("id") == self._model and model.get("context_length"):
+                    return int(model["context_length"])
+            self._logger.warning(f"Context window of model {self._model} not found, using {DEFAULT_CONTEXT_WINDOW}")
+        except Exception as e:
+            self._logger.warning(f"Unable to read the context window of {self._model}: {str(e)}")
+        return DEFAULT_CONTEXT_WINDOW
+
+    @property
+    def context_window(self) -> int:
+        """Finestra di contesto del modello, letta una sola volta."""
+        if self._context_window is None:
+            self._context_window = self._fetch_context_window()
+        return self._context_window
+
     @property
     def metadata(self) -> LLMMetadata:
         """Get LLM metadata."""
         return LLMMetadata(
-            context_window=4096,  # Può variare in base al modello
-            num_output=1000,
+            context_window=self.context_window,
+            num_output=self._num_output,
             model_name=self._model
         )
 
@@ -105,14 +207,8 @@ class OpenRouterLLM(LLM):
         delay = min(self._initial_retry_delay * (2 ** attempt), self._max_retry_delay)
         return delay + (0.1 * delay * (random.random() - 0.5))  # jitter ±5%
 
-    def _make_request(
-        self,
-        messages: Sequence[ChatMessage],
-        max_retries: Optional[int] = None,
-        **kwargs: Any
-    ) -> dict:
-        """Make a request to OpenRouter API with improved retry logic."""
-        max_retries = max_retries or self._max_retries
+    def _build_payload(self, messages: Sequence[ChatMessage], stream: bool = False, **kwargs: Any) -> dict:
+        """Costruisce il payload della richiesta chat/completions (stream=True per una risposta SSE)."""
         formatted_messages = [
             {
                 "role": msg.role,
@@ -125,8 +221,22 @@ class OpenRouterLLM(LLM):
             "model": self._model,
             "messages": formatted_messages,
             "temperature": kwargs.get('temperature', 0.7),
-            "max_tokens": kwargs.get('max_tokens', 1000)
+            "max_tokens": kwargs.get('max_tokens', self._num_output)
         }
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    def _make_request(
+        self,
+        messages: Sequence[ChatMessage],
+        max_retries: Optional[int] = None,
+        **kwargs: Any
+    ) -> dict:
+        """Make a request to OpenRouter API with improved retry logic."""
+        max_retries = max_retries or self._max_retries
+        payload = self._build_payload(messages, **kwargs)
+        estimated_tokens = self._estimate_tokens(payload)
         
         self._logger.debug(f"Prepared request payload: {json.dumps(payload, indent=2, ensure_ascii=False)}")
         
@@ -135,14 +245,14 @@ class OpenRouterLLM(LLM):
         
         for attempt in range(max_retries + 1):
             try:
-                self._wait_for_rate_limit()
+                self._wait_for_rate_limit(estimated_tokens)
                 
                 if attempt > 0:
                     delay = self._calculate_retry_delay(attempt - 1)
                     self._logger.info(f"Retry attempt {attempt}/{max_retries}, waiting {delay:.2f}s")
                     time.sleep(delay)
                 
-                response = requests.post(
+                response = self._session.post(
                     f"{self._base_url}/chat/completions",
                     headers=self._headers,
                     json=payload,
@@ -151,11 +261,12 @@ class OpenRouterLLM(LLM):
                 
                 self._logger.debug(f"Response status: {response.status_code}")
                 self._logger.debug(f"Response headers: {dict(response.headers)}")
+                self._rate_limiter.update_from_headers(response.headers)
                 
                 if response.status_code == 429:  # Rate limit
-                    retry_after = int(response.headers.get('Retry-After', 60))
-                    self._logger.warning(f"Rate limited, waiting {retry_after}s")
-                    time.sleep(retry_after)
+                    if 'Retry-After' not in response.headers:
+                        self._rate_limiter.pause(60)
+                    self._logger.warning(f"Rate limited, waiting {response.headers.get('Retry-After', 60)}s")
                     continue
                 
                 try:
@@ -166,6 +277,7 @@ class OpenRouterLLM(LLM):
                     raise OpenRouterError("Invalid JSON response from API")
                 
                 response.raise_for_status()
+                self._record_response(response_json, estimated_tokens)
                 
                 self._logger.info("Request successful")
                 return response_json
@@ -197,6 +309,297 @@ class OpenRouterLLM(LLM):
         
         raise OpenRouterError(f"Failed after {max_retries} retries. Last error: {last_error}")
                 
+    async def _amake_request(
+        self,
+        messages: Sequence[ChatMessage],
+        max_retries: Optional[int] = None,
+        **kwargs: Any
+    ) -> dict:
+        """Async version of _make_request, over the shared httpx connection pool."""
+        max_retries = max_retries or self._max_retries
+        payload = self._build_payload(messages, **kwargs)
+        estimated_tokens = self._estimate_tokens(payload)
+        client = await self._get_async_client()
+        
+        self._logger.debug(f"Prepared request payload: {json.dumps(payload, indent=2, ensure_ascii=False)}")
+        
+        last_error = None
+        self._logger.info(f"Starting async request to OpenRouter with {len(messages)} messages")
+        
+        for attempt in range(max_retries + 1):
+            response = None
+            try:
+                await self._await_rate_limit(estimated_tokens)
+                
+                if attempt > 0:
+                    delay = self._calculate_retry_delay(attempt - 1)
+                    self._logger.info(f"Retry attempt {attempt}/{max_retries}, waiting {delay:.2f}s")
+                    await asyncio.sleep(delay)
+                
+                response = await client.post(
+                    f"{self._base_url}/chat/completions",
+                    headers=self._headers,
+                    json=payload
+                )
+                
+                self._logger.debug(f"Response status: {response.status_code}")
+                self._rate_limiter.update_from_headers(response.headers)
+                
+                if response.status_code == 429:  # Rate limit
+                    if 'Retry-After' not in response.headers:
+                        self._rate_limiter.pause(60)
+                    self._logger.warning(f"Rate limited, waiting {response.headers.get('Retry-After', 60)}s")
+                    continue
+                
+                try:
+                    response_json = response.json()
+                    self._logger.debug(f"Response body: {json.dumps(response_json, indent=2, ensure_ascii=False)}")
+                except json.JSONDecodeError:
+                    self._logger.error(f"Invalid JSON response: {response.text}")
+                    raise OpenRouterError("Invalid JSON response from API")
+                
+                response.raise_for_status()
+                self._record_response(response_json, estimated_tokens)
+                
+                self._logger.info("Request successful")
+                return response_json
+                
+            except httpx.TimeoutException as e:
+                last_error = f"Timeout error: {str(e)}"
+                self._logger.warning(f"Request timeout on attempt {attempt + 1}/{max_retries}")
+            
+            except httpx.HTTPError as e:
+                last_error = f"Request error: {str(e)}"
+                self._logger.error(f"Request failed on attempt {attempt + 1}/{max_retries}: {str(e)}")
+                
+                if attempt == max_retries:
+                    break
+                
+                if response is None or response.status_code >= 500:
+                    continue  # Retry server and connection errors
+                elif response.status_code == 401:
+                    raise OpenRouterError("Invalid API key")
+                elif response.status_code == 403:
+                    raise OpenRouterError("API key lacks permission")
+                elif response.status_code >= 400:
+                    self._logger.error(f"API error (raw): {response.text}")
+                    raise OpenRouterError(f"API request failed: {str(e)}")
+        
+        raise OpenRouterError(f"Failed after {max_retries} retries. Last error: {last_error}")
+
+    @staticmethod
+    def _parse_sse_line(line: str) -> Optional[dict]:
+        """
+        Decodifica una riga di una risposta SSE: il chunk JSON di un evento "data:", None per righe vuote,
+        commenti (": OPENROUTER PROCESSING") e per la fine dello stream ("data: [DONE]").
+        """
+        line = line.strip()
+        if not line.startswith("data:"):
+            return None
+        data = line[len("data:"):].strip()
+        if not data or data == "[DONE]":
+            return None
+        try:
+            chunk = json.loads(data)
+        except json.JSONDecodeError:
+            raise OpenRouterError(f"Invalid JSON chunk in stream: {data}")
+        if "error" in chunk:
+            # errore arrivato dopo l'inizio dello stream (status già 200)
+            raise OpenRouterError(f"Stream error: {chunk['error'].get('message', chunk['error'])}")
+        return chunk
+
+    @staticmethod
+    def _chunk_delta(chunk: dict) -> str:
+        """Testo aggiunto da un chunk dello stream."""
+        choices = chunk.get("choices") or [{}]
+        return (choices[0].get("delta") or {}).get("content") or ""
+
+    def _stream_request(
+        self,
+        messages: Sequence[ChatMessage],
+        max_retries: Optional[int] = None,
+        **kwargs: Any
+    ) -> Generator[dict, None, None]:
+        """
+        Streaming version of _make_request: yield the JSON chunks of the SSE response.
+        Errors before the first chunk are retried as in _make_request; a stream interrupted midway is not retried.
+        """
+        max_retries = max_retries or self._max_retries
+        payload = self._build_payload(messages, stream=True, **kwargs)
+        estimated_tokens = self._estimate_tokens(payload)
+        
+        last_error = None
+        self._logger.info(f"Starting stream request to OpenRouter with {len(messages)} messages")
+        
+        for attempt in range(max_retries + 1):
+            response = None
+            try:
+                self._wait_for_rate_limit(estimated_tokens)
+                
+                if attempt > 0:
+                    delay = self._calculate_retry_delay(attempt - 1)
+                    self._logger.info(f"Retry attempt {attempt}/{max_retries}, waiting {delay:.2f}s")
+                    time.sleep(delay)
+                
+                response = self._session.post(
+                    f"{self._base_url}/chat/completions",
+                    headers=self._headers,
+                    json=payload,
+                    timeout=self._timeout,
+                    stream=True
+                )
+                
+                self._logger.debug(f"Response status: {response.status_code}")
+                self._rate_limiter.update_from_headers(response.headers)
+                
+                if response.status_code == 429:  # Rate limit
+                    if 'Retry-After' not in response.headers:
+                        self._rate_limiter.pause(60)
+                    self._logger.warning(f"Rate limited, waiting {response.headers.get('Retry-After', 60)}s")
+                    response.close()
+                    continue
+                
+                response.raise_for_status()
+                
+            except requests.Timeout as e:
+                last_error = f"Timeout error: {str(e)}"
+                self._logger.warning(f"Request timeout on attempt {attempt + 1}/{max_retries}")
+                continue
+            
+            except requests.RequestException as e:
+                last_error = f"Request error: {str(e)}"
+                self._logger.error(f"Request failed on attempt {attempt + 1}/{max_retries}: {str(e)}")
+                error_text = ""
+                if response is not None:
+                    error_text = response.text
+                    response.close()
+                
+                if attempt == max_retries:
+                    break
+                
+                if response is None or response.status_code >= 500:
+                    continue  # Retry server and connection errors
+                elif response.status_code == 401:
+                    raise OpenRouterError("Invalid API key")
+                elif response.status_code == 403:
+                    raise OpenRouterError("API key lacks permission")
+                elif response.status_code >= 400:
+                    self._logger.error(f"API error (raw): {error_text}")
+                    raise OpenRouterError(f"API request failed: {str(e)}")
+            
+            with response:
+                usage = None
+                for line in response.iter_lines():
+                    chunk = self._parse_sse_line(line.decode('utf-8'))
+                    if chunk is None:
+                        continue
+                    usage = chunk.get("usage") or usage
+                    yield chunk
+            self._rate_limiter.record_usage(estimated_tokens, (usage or {}).get("total_tokens"))
+            self._logger.info("Stream completed")
+            return
+        
+        raise OpenRouterError(f"Failed after {max_retries} retries. Last error: {last_error}")
+
+    async def _astream_request(
+        self,
+        messages: Sequence[ChatMessage],
+        max_retries: Optional[int] = None,
+        **kwargs: Any
+    ) -> AsyncGenerator[dict, None]:
+        """Async version of _stream_request, over the shared httpx connection pool."""
+        max_retries = max_retries or self._max_retries
+        payload = self._build_payload(messages, stream=True, **kwargs)
+        estimated_tokens = self._estimate_tokens(payload)
+        client = await self._get_async_client()
+        
+        last_error = None
+        self._logger.info(f"Starting async stream request to OpenRouter with {len(messages)} messages")
+        
+        for attempt in range(max_retries + 1):
+            response = None
+            try:
+                await self._await_rate_limit(estimated_tokens)
+                
+                if attempt > 0:
+                    delay = self._calculate_retry_delay(attempt - 1)
+                    self._logger.info(f"Retry attempt {attempt}/{max_retries}, waiting {delay:.2f}s")
+                    await asyncio.sleep(delay)
+                
+                request = client.build_request(
+                    "POST",
+                    f"{self._base_url}/chat/completions",
+                    headers=self._headers,
+                    json=payload
+                )
+                response = await client.send(request, stream=True)
+                
+                self._logger.debug(f"Response status: {response.status_code}")
+                self._rate_limiter.update_from_headers(response.headers)
+                
+                if response.status_code == 429:  # Rate limit
+                    if 'Retry-After' not in response.headers:
+                        self._rate_limiter.pause(60)
+                    self._logger.warning(f"Rate limited, waiting {response.headers.get('Retry-After', 60)}s")
+                    await response.aclose()
+                    continue
+                
+                response.raise_for_status()
+                
+            except httpx.TimeoutException as e:
+                last_error = f"Timeout error: {str(e)}"
+                self._logger.warning(f"Request timeout on attempt {attempt + 1}/{max_retries}")
+                continue
+            
+            except httpx.HTTPError as e:
+                last_error = f"Request error: {str(e)}"
+                self._logger.error(f"Request failed on attempt {attempt + 1}/{max_retries}: {str(e)}")
+                if response is not None:
+                    await response.aread()
+                    await response.aclose()
+                
+                if attempt == max_retries:
+                    break
+                
+                if response is None or response.status_code >= 500:
+                    continue  # Retry server and connection errors
+                elif response.status_code == 401:
+                    raise OpenRouterError("Invalid API key")
+                elif response.status_code == 403:
+                    raise OpenRouterError("API key lacks permission")
+                elif response.status_code >= 400:
+                    self._logger.error(f"API error (raw): {response.text}")
+                    raise OpenRouterError(f"API request failed: {str(e)}")
+            
+            try:
+                usage = None
+                async for line in response.aiter_lines():
+                    chunk = self._parse_sse_line(line)
+                    if chunk is None:
+                        continue
+                    usage = chunk.get("usage") or usage
+                    yield chunk
+            finally:
+                await response.aclose()
+            self._rate_limiter.record_usage(estimated_tokens, (usage or {}).get("total_tokens"))
+            self._logger.info("Stream completed")
+            return
+        
+        raise OpenRouterError(f"Failed after {max_retries} retries. Last error: {last_error}")
+
+    @staticmethod
+    def _parse_chat_response(response_data: dict) -> ChatResponse:
+        """Converte la risposta JSON dell'API in ChatResponse."""
+        if not response_data or "choices" not in response_data:
+            raise OpenRouterError("Invalid response from OpenRouter API")
+            
+        message_content = response_data["choices"][0]["message"]["content"]
+        role = response_data["choices"][0]["message"].get("role", "assistant")
+        
+        return ChatResponse(
+            message=ChatMessage(role=role, content=message_content)
+        )
+
     def complete(
         self, prompt: str, **kwargs: Any
     ) -> CompletionResponse:
@@ -210,61 +613,75 @@ class OpenRouterLLM(LLM):
     ) -> ChatResponse:
         """Chat with the LLM."""
         response_data = self._make_request(messages, **kwargs)
-        
-        if not response_data or "choices" not in response_data:
-            raise OpenRouterError("Invalid response from OpenRouter API")
-            
-        message_content = response_data["choices"][0]["message"]["content"]
-        role = response_data["choices"][0]["message"].get("role", "assistant")
-        
-        return ChatResponse(
-            message=ChatMessage(role=role, content=message_content)
-        )
+        return self._parse_chat_response(response_data)
 
     async def acomplete(
         self, prompt: str, **kwargs: Any
     ) -> CompletionResponse:
-        """Async complete not implemented."""
-        raise NotImplementedError("Async methods not implemented")
+        """Complete a prompt asynchronously."""
+        messages = [ChatMessage(role="user", content=prompt)]
+        chat_response = await self.achat(messages, **kwargs)
+        return CompletionResponse(text=chat_response.message.content)
 
     async def achat(
         self, messages: Sequence[ChatMessage], **kwargs: Any
     ) -> ChatResponse:
-        """Async chat not implemented."""
-        raise NotImplementedError("Async methods not implemented")
+        """Chat with the LLM asynchronously."""
+        response_data = await self._amake_request(messages, **kwargs)
+        return self._parse_chat_response(response_data)
 
     def complete_batch(
         self, prompts: List[str], **kwargs: Any
     ) -> List[CompletionResponse]:
-        """Batch completion not implemented."""
-        raise NotImplementedError("Batch methods not implemented")
+        """Complete several prompts, one after the other."""
+        return [self.complete(prompt, **kwargs) for prompt in prompts]
 
     async def acomplete_batch(
         self, prompts: List[str], **kwargs: Any
     ) -> List[CompletionResponse]:
-        """Async batch completion not implemented."""
-        raise NotImplementedError("Async methods not implemented")
+        """Complete several prompts concurrently."""
+        return list(await asyncio.gather(*[self.acomplete(prompt, **kwargs) for prompt in prompts]))
 
     def stream_complete(
         self, prompt: str, **kwargs: Any
     ) -> CompletionResponseGen:
-        """Stream completion not implemented."""
-        raise NotImplementedError("Streaming not implemented")
+        """Stream a completion: every response carries the text so far and the delta."""
+        messages = [ChatMessage(role="user", content=prompt)]
+        for chat_response in self.stream_chat(messages, **kwargs):
+            yield CompletionResponse(text=chat_response.message.content, delta=chat_response.delta)
 
     async def astream_complete(
         self, prompt: str, **kwargs: Any
-    ) -> CompletionResponseGen:
-        """Async stream completion not implemented."""
-        raise NotImplementedError("Streaming not implemented")
+    ) -> CompletionResponseAsyncGen:
+        """Stream a completion asynchronously."""
+        messages = [ChatMessage(role="user", content=prompt)]
+        chat_stream = await self.astream_chat(messages, **kwargs)
+
+        async def gen() -> CompletionResponseAsyncGen:
+            async for chat_response in chat_stream:
+                yield CompletionResponse(text=chat_response.message.content, delta=chat_response.delta)
+
+        return gen()
         
     def stream_chat(
         self, messages: Sequence[ChatMessage], **kwargs: Any
-    ) -> CompletionResponseGen:
-        """Stream chat implementation."""
-        raise NotImplementedError("Stream chat not implemented")
+    ) -> ChatResponseGen:
+        """Stream the chat response over SSE: every response carries the message so far and the delta."""
+        content = ""
+        for chunk in self._stream_request(messages, **kwargs):
+            delta = self._chunk_delta(chunk)
+            content += delta
+            yield ChatResponse(message=ChatMessage(role="assistant", content=content), delta=delta, raw=chunk)
 
     async def astream_chat(
         self, messages: Sequence[ChatMessage], **kwargs: Any
-    ) -> AsyncGenerator[ChatResponse, None]:
-        """Async stream chat implementation."""
-        raise NotImplementedError("Async stream chat not implemented")
\ No newline at end of file
+    ) -> ChatResponseAsyncGen:
+        """Stream the chat response asynchronously, over the shared httpx connection pool."""
+        async def gen() -> ChatResponseAsyncGen:
+            content = ""
+            async for chunk in self._astream_request(messages, **kwargs):
+                delta = self._chunk_delta(chunk)
+                content += delta
+                yield ChatResponse(message=ChatMessage(role="assistant", content=content), delta=delta, raw=chunk)
+
+        return gen()
@@ -0,0 +1,185 @@
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+from checkpoint_manager import STAGE_TABLE_DESC
+from schema_engine import SchemaEngine
+
+
+# end-of-stream marker passed between the stages
+_DONE = object()
+
+
+class SchemaPipeline:
+    """
+    Producer/consumer pipeline over the tables of a SchemaEngine:
+        reflect -> profile -> classify -> understand -> describe
+    Every stage has its own worker threads and hands the table names to the next one through a queue,
+    so a slow stage blocks the faster ones upstream (back-pressure) instead of piling up work.
+
+    The database understanding (db_info) needed by the understand and describe stages depends on the stage
+    producing the M-Schema it is computed on:
+    - classify=True: db_info is computed once the classify stage has gone through every table, on the same
+      M-Schema as fields_category followed by table_and_column_desc_generation. Until then the classified tables
+      wait in the queue of the understand stage, which is unbounded so that the stages upstream can finish:
+      reflect, profile and classify overlap, understand and describe start after the last classification.
+    - classify=False: the classify stage only passes the tables on, as in a run without fields_category, and
+      db_info is computed in a thread of its own while the first tables are reflected. Every queue is bounded
+      and table N is understood and described while table N+1 is profiled.
+
+    The comment mode is applied to the whole M-Schema before the first stage, as table_and_column_desc_generation does.
+    """
+    def __init__(self, schema_engine: SchemaEngine, language: str = 'CN', reflect_workers: int = 1,
+                 profile_workers: int = 2, classify_workers: int = 2, understand_workers: int = 2,
+                 describe_workers: int = 2, column_workers: int = 1, classify_batch_size: Optional[int] = None,
+                 classify: bool = True, queue_size: int = 4):
+        self.schema_engine = schema_engine
+        self.language = language
+        self.reflect_workers = max(1, reflect_workers)
+        self.profile_workers = max(1, profile_workers)
+        self.classify_workers = max(1, classify_workers)
+        self.understand_workers = max(1, understand_workers)
+        self.describe_workers = max(1, describe_workers)
+        self.column_workers = max(1, column_workers)
+        self.classify_batch_size = classify_batch_size
+        self.classify_enabled = classify
+        self.queue_size = queue_size
+        self._failures = {}
+        self._failures_guard = threading.Lock()
+        self._stop = threading.Event()
+
+    def stop(self):
+        """stop feeding new tables; the tables already in the pipeline are completed"""
+        self._stop.set()
+
+    def add_failures(self, failures: Dict[Tuple[str, Optional[str]], str]):
+        with self._failures_guard:
+            self._failures.update(failures)
+
+    def reflect(self, table_name: str):
+        # in lazy mode, the first access reflects and samples the table
+        self.schema_engine.mschema.tables[table_name]
+
+    def profile(self, table_name: str):
+        # the first column profiles the whole table (or loads it from the stats cache)
+        for field_name in self.schema_engine.mschema.tables[table_name]['fields'].keys():
+            self.schema_engine.get_column_stats(table_name, field_name)
+
+    def classify(self, table_name: str):
+        if self.classify_enabled:
+            self.add_failures(self.schema_engine.classify_table(table_name, self.classify_batch_size))
+
+    def needs_description(self, table_name: str) -> bool:
+        se = self.schema_engine
+        return self._describe and se.is_dirty_table(table_name) and \
+            se.checkpoint_get(STAGE_TABLE_DESC, table_name) is None
+
+    def understand(self, table_name: str, db_info_future: Future):
+        # the sample rows and the supplementary information are kept by the engine for the describe stage
+        if self.needs_description(table_name):
+            se = self.schema_engine
+            se.get_table_understanding(table_name, db_info_future.result(),
+                                       se.mschema.single_table_mschema(table_name))
+
+    def describe(self, table_name: str, db_info_future: Future):
+        if not self._describe or not self.schema_engine.is_dirty_table(table_name):
+            return
+        self.add_failures(self.schema_engine.describe_table(table_name, db_info_future.result(),
+                                                            self.language, self.column_workers))
+
+    def start_stage(self, name: str, func: Callable[[str], None], in_queue: queue.Queue,
+                    out_queue: Optional[queue.Queue], workers: int, next_workers: int,
+                    on_done: Optional[Callable[[], None]] = None) -> List[threading.Thread]:
+        """
+        Start the worker threads of a stage. A table failing in a stage is reported and not passed downstream.
+        The last worker to finish sends one end marker per worker of the next stage, then calls on_done.
+        """
+        remaining = [workers]
+        remaining_guard = threading.Lock()
+
+        def worker():
+            while True:
+                table_name = in_queue.get()
+                if table_name is _DONE:
+                    break
+                try:
+                    func(table_name)
+                except Exception as e:
+                    print("Pipeline stage {} failed for table {}: {}".format(name, table_name, e))
+                    self.add_failures({(table_name, None): "{}: {}".format(name, e)})
+                    continue
+                if out_queue is not None:
+                    out_queue.put(table_name)
+            with remaining_guard:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last and out_queue is not None:
+                for _ in range(next_workers):
+                    out_queue.put(_DONE)
+            if last and on_done is not None:
+                on_done()
+
+        threads = [threading.Thread(target=worker, name='pipeline-{}-{}'.format(name, i), daemon=True)
+                   for i in range(workers)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def run(self, table_names: Optional[List[str]] = None) -> Dict[Tuple[str, Optional[str]], str]:
+        """
+        Run the pipeline over the given tables (default: all tables of M-Schema).
+        Return the tables ((table_name, None)) and columns that failed in some stage.
+        """
+        se = self.schema_engine
+        table_names = table_names if table_names is not None else list(se.mschema.tables.keys())
+        self._failures = {}
+        self._describe = se.prepare_comments()
+
+        db_info_future = Future()
+
+        def understand_database():
+            if not self._describe:
+                db_info_future.set_result(None)
+                return
+            try:
+                db_info_future.set_result(se.get_db_info())
+            except Exception as e:
+                print("Database understanding failed: {}".format(e))
+                self.add_failures({(None, None): str(e)})
+                db_info_future.set_exception(e)
+
+        reflect_queue = queue.Queue(maxsize=self.queue_size)
+        profile_queue = queue.Queue(maxsize=self.queue_size)
+        classify_queue = queue.Queue(maxsize=self.queue_size)
+        # with classification db_info waits for the last classified table, so the tables classified until then
+        # must not block the classify stage
+        understand_queue = queue.Queue(maxsize=0 if self.classify_enabled else self.queue_size)
+        describe_queue = queue.Queue(maxsize=self.queue_size)
+
+        threads = []
+        if not self.classify_enabled:
+            # db_info does not depend on any stage: compute it while the first tables go through the pipeline
+            db_info_thread = threading.Thread(target=understand_database, name='pipeline-db-info', daemon=True)
+            db_info_thread.start()
+            threads.append(db_info_thread)
+        threads += self.start_stage('reflect', self.reflect, reflect_queue, profile_queue,
+                                    self.reflect_workers, self.profile_workers)
+        threads += self.start_stage('profile', self.profile, profile_queue, classify_queue,
+                                    self.profile_workers, self.classify_workers)
+        threads += self.start_stage('classify', self.classify, classify_queue, understand_queue,
+                                    self.classify_workers, self.understand_workers,
+                                    on_done=understand_database if self.classify_enabled else None)
+        threads += self.start_stage('understand', lambda t: self.understand(t, db_info_future), understand_queue,
+                                    describe_queue, self.understand_workers, self.describe_workers)
+        threads += self.start_stage('describe', lambda t: self.describe(t, db_info_future), describe_queue,
+                                    None, self.describe_workers, 0)
+
+        for table_name in table_names:
+            if self._stop.is_set():
+                break
+            reflect_queue.put(table_name)
+        for _ in range(self.reflect_workers):
+            reflect_queue.put(_DONE)
+        for thread in threads:
+            thread.join()
+        return self._failures
@@ -0,0 +1,232 @@
+# Funzione: Rate limiter a token bucket per le chiamate LLM.
+# Limita sia le richieste al minuto sia i token al minuto, consentendo raffiche fino alla capacità
+# del bucket. È sicuro tra thread e task asyncio ed è condiviso da tutte le istanze che usano
+# la stessa API key. Si adatta agli header Retry-After e x-ratelimit-* restituiti dal provider.
+# Se istanze con la stessa API key chiedono limiti diversi, il limiter condiviso applica i più restrittivi.
+
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Mapping, Optional
+
+
+class TokenBucket:
+    """Bucket di capacità fissa ricaricato a velocità costante."""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.tokens = float(capacity)
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.refill_per_second)
+        self._updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """
+        Preleva amount token e restituisce i secondi da attendere prima di poterli usare.
+        Il saldo può diventare negativo: le prenotazioni successive attendono in coda.
+        """
+        self._refill(now)
+        self.tokens -= amount
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.refill_per_second
+
+    def adjust(self, amount: float, now: float):
+        """Aggiunge (o toglie, se negativo) token al saldo corrente."""
+        self._refill(now)
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def set_rate(self, capacity: float, refill_per_second: float, now: float):
+        """Cambia capacità e velocità di ricarica, mantenendo il saldo accumulato fino a now."""
+        self._refill(now)
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.tokens = min(self.tokens, self.capacity)
+
+    def cap(self, remaining: float, now: float):
+        """Allinea il saldo al numero di token che il provider dichiara ancora disponibili."""
+        self._refill(now)
+        self.tokens = min(self.tokens, remaining)
+
+
+def _parse_reset(value: str) -> Optional[float]:
+    """
+    Converte un header di reset in secondi di attesa. Sono supportati i secondi ("12", "0.5"),
+    le durate ("1m30s", "250ms") e i timestamp epoch in secondi o millisecondi.
+    """
+    value = value.strip()
+    try:
+        number = float(value)
+    except ValueError:
+        number = None
+    if number is not None:
+        now = time.time()
+        if number > 1e12:  # epoch in millisecondi
+            return max(0.0, number / 1000 - now)
+        if number > 1e9:  # epoch in secondi
+            return max(0.0, number - now)
+        return max(0.0, number)
+
+    seconds = 0.0
+    units = {'ms': 0.001, 'h': 3600.0, 'm': 60.0, 's': 1.0}
+    digits = ''
+    i = 0
+    while i < len(value):
+        c = value[i]
+        if c.isdigit() or c == '.':
+            digits += c
+            i += 1
+            continue
+        unit = 'ms' if value[i:i + 2] == 'ms' else c
+        if unit not in units or not digits:
+            return None
+        seconds += float(digits) * units[unit]
+        digits = ''
+        i += len(unit)
+    return seconds if not digits else None
+
+
+def _parse_retry_after(value: str) -> Optional[float]:
+    """Retry-After può essere un numero di secondi o una data HTTP."""
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """Limite combinato di richieste al minuto e (opzionalmente) token al minuto."""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: Optional[int] = None,
+                 burst: Optional[int] = None):
+        self._lock = threading.Lock()
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute or None
+        self.burst = burst or requests_per_minute
+        self._requests = TokenBucket(self.burst, requests_per_minute / 60.0)
+        self._tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60.0) if tokens_per_minute else None
+        self._paused_until = 0.0
+
+    @property
+    def limits(self) -> tuple:
+        """(richieste al minuto, token al minuto, burst) correnti."""
+        return self.requests_per_minute, self.tokens_per_minute, self.burst
+
+    def restrict(self, requests_per_minute: int, tokens_per_minute: Optional[int] = None,
+                 burst: Optional[int] = None):
+        """Applica, limite per limite, il più restrittivo tra quello corrente e quello indicato."""
+        with self._lock:
+            now = time.monotonic()
+            self.requests_per_minute = min(self.requests_per_minute, requests_per_minute)
+            self.burst = min(self.burst, burst or requests_per_minute)
+            self._requests.set_rate(self.burst, self.requests_per_minute / 60.0, now)
+            if tokens_per_minute and (self.tokens_per_minute is None or tokens_per_minute < self.tokens_per_minute):
+                self.tokens_per_minute = tokens_per_minute
+                if self._tokens is None:
+                    self._tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60.0)
+                else:
+                    self._tokens.set_rate(tokens_per_minute, tokens_per_minute / 60.0, now)
+
+    def _reserve(self, tokens: int) -> float:
+        with self._lock:
+            now = time.monotonic()
+            wait = self._requests.reserve(1, now)
+            if self._tokens is not None and tokens > 0:
+                wait = max(wait, self._tokens.reserve(tokens, now))
+            return max(wait, self._paused_until - now)
+
+    def acquire(self, tokens: int = 0) -> float:
+        """Attende (bloccando il thread) finché la richiesta può partire. Restituisce l'attesa."""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def aacquire(self, tokens: int = 0) -> float:
+        """Come acquire, ma attende senza bloccare l'event loop."""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def record_usage(self, estimated_tokens: int, used_tokens: Optional[int]):
+        """Corregge il bucket dei token con il consumo reale riportato dalla risposta."""
+        if self._tokens is None or used_tokens is None:
+            return
+        with self._lock:
+            self._tokens.adjust(estimated_tokens - used_tokens, time.monotonic())
+
+    def pause(self, seconds: float):
+        """Sospende tutte le richieste per il numero di secondi indicato."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def update_from_headers(self, headers: Mapping[str, str]):
+        """
+        Adatta il limiter agli header della risposta: Retry-After sospende le richieste,
+        x-ratelimit-remaining(-requests/-tokens) allinea i bucket e, se il residuo è zero,
+        sospende fino a x-ratelimit-reset(-requests/-tokens).
+        """
+        headers = {k.lower(): v for k, v in headers.items()}
+        retry_after = headers.get('retry-after')
+        if retry_after is not None:
+            seconds = _parse_retry_after(retry_after)
+            if seconds is not None:
+                self.pause(seconds)
+
+        for bucket_name, suffixes in [('requests', ['-requests', '']), ('tokens', ['-tokens'])]:
+            bucket = self._requests if bucket_name == 'requests' else self._tokens
+            if bucket is None:
+                continue
+            for suffix in suffixes:
+                remaining = headers.get('x-ratelimit-remaining' + suffix)
+                if remaining is None:
+                    continue
+                try:
+                    remaining = float(remaining)
+                except ValueError:
+                    break
+                with self._lock:
+                    bucket.cap(remaining, time.monotonic())
+                reset = headers.get('x-ratelimit-reset' + suffix)
+                if remaining <= 0 and reset is not None:
+                    seconds = _parse_reset(reset)
+                    if seconds is not None:
+                        self.pause(seconds)
+                break
+
+
+_shared_limiters: Dict[str, RateLimiter] = {}
+_shared_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(api_key: str, requests_per_minute: int, tokens_per_minute: Optional[int] = None,
+                     burst: Optional[int] = None) -> RateLimiter:
+    """
+    Restituisce il rate limiter condiviso associato all'API key, creandolo alla prima richiesta.
+    Le istanze successive con la stessa chiave riusano il limiter già esistente: se chiedono limiti
+    diversi, il limiter applica i più restrittivi (la quota del provider è una sola) e lo segnala.
+    """
+    key = hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+    with _shared_limiters_lock:
+        if key not in _shared_limiters:
+            _shared_limiters[key] = RateLimiter(requests_per_minute, tokens_per_minute, burst)
+            return _shared_limiters[key]
+        limiter = _shared_limiters[key]
+        requested = (requests_per_minute, tokens_per_minute or None, burst or requests_per_minute)
+        if requested != limiter.limits:
+            previous = limiter.limits
+            limiter.restrict(requests_per_minute, tokens_per_minute, burst)
+            logging.warning(f"Rate limiter condiviso per la stessa API key con limiti diversi "
+                            f"(richiesti {requested}, esistenti {previous}): applicati {limiter.limits}")
+        return limiter
@@ -1,9 +1,13 @@
 """Script per riprovare la generazione dello schema da un checkpoint."""
 import logging
+import os
 from schema_engine import SchemaEngine
+from pipeline import SchemaPipeline
 from database import create_db_engine
 from openrouter_llm import OpenRouterLLM
 from checkpoint_manager import CheckpointManager
+from stats_cache import StatsCache
+from llm_cache import LLMResponseCache, set_llm_cache
 
 def main():
     # Configura logging
@@ -22,7 +26,9 @@ def main():
         
         # Inizializza checkpoint manager
         checkpoint_mgr = CheckpointManager()
-        checkpoint = checkpoint_mgr.load_checkpoint()
+        
+        # Cache delle risposte LLM: una nuova esecuzione non ripete le chiamate già fatte
+        set_llm_cache(LLMResponseCache(str(checkpoint_mgr.checkpoint_dir / 'llm_cache.sqlite')))
         
         # Inizializza LLM
         llm = OpenRouterLLM(requests_per_minute=20)  # Rate limit più conservativo
@@ -35,23 +41,35 @@ def main():
             db_engine,
             llm=llm,
             db_name='timetable2',
-            comment_mode='merge'
+            comment_mode='merge',
+            stats_cache=StatsCache(str(checkpoint_mgr.checkpoint_dir / 'column_stats.sqlite')),
+            checkpoint=checkpoint_mgr
         )
         
         logger.info("Avvio generazione descrizioni...")
         
-        if checkpoint:
-            logger.info(f"Ripresa da checkpoint: {len(checkpoint)} tabelle processate")
-            # TODO: Implementare ripresa da checkpoint
+        # Le fasi già registrate nel journal vengono ripristinate dallo SchemaEngine invece di essere rigenerate
+        stage_progress = checkpoint_mgr.get_stage_progress()
+        if stage_progress:
+            logger.info(f"Ripresa da checkpoint: {stage_progress}")
         
-        # Genera descrizioni
-        schema_engine.table_and_column_desc_generation()
+        # Genera descrizioni (con SCHEMA_PIPELINE=true la profilazione delle tabelle si sovrappone alle descrizioni)
+        if os.getenv('SCHEMA_PIPELINE', 'false').lower() in ('1', 'true', 'yes'):
+            failures = SchemaPipeline(schema_engine, classify=False).run()
+        else:
+            failures = schema_engine.table_and_column_desc_generation()
         
         # Salva schema
         output_file = './timetable2_schema.json'
         schema_engine.mschema.save(output_file)
         logger.info(f"Schema salvato in: {output_file}")
         
+        # Analisi completa: il journal non serve più e non deve essere riusato dalla prossima esecuzione
+        if failures:
+            logger.warning(f"{len(failures)} descrizioni non generate, il checkpoint viene mantenuto")
+            return False
+        checkpoint_mgr.clear()
+        
         logger.info("Processo completato con successo!")
         return True
         
@@ -1,21 +1,55 @@
 from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
-from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import datetime
+import decimal
+import re
+import json
+import hashlib
+import asyncio
+import random
+import threading
+import time
+import networkx as nx
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
 from sqlalchemy import create_engine, MetaData, Table, Column, String, Integer, select, text
 from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.engine.reflection import ObjectKind
 from llama_index.core import SQLDatabase
 from llama_index.core.llms import LLM
 from components import (
     field_category,
+    batch_field_category,
     generate_column_desc,
     generate_table_desc,
     understand_fields_by_category,
     understand_database,
+    understand_database_chunk,
+    understand_database_from_summaries,
     understand_date_time_min_gran,
     dummy_sql_generator
 )
-from utils import examples_to_str
+from utils import examples_to_str, estimate_tokens
 from type_engine import TypeEngine
 from mschema import MSchema
+from stats_cache import StatsCache
+from checkpoint_manager import (
+    CheckpointManager,
+    STAGE_STATS,
+    STAGE_CATEGORY,
+    STAGE_DB_INFO,
+    STAGE_SUPP_INFO,
+    STAGE_COLUMN_DESC,
+    STAGE_TABLE_DESC
+)
+from field_heuristics import heuristic_field_category, INTEGER_TYPES
+
+
+# column properties carried over from the previous M-Schema in incremental mode
+INCREMENTAL_CARRY_OVER_KEYS = ['comment', 'category', 'dim_or_meas', 'date_min_gran', 'examples',
+                               'examples_truncated', 'stats']
+# sampling mode on MySQL/sqlite: the key range is split into this many strata, each one sampled at a random position
+SAMPLE_KEY_RANGES = 10
 
 
 class SchemaEngine(SQLDatabase):
@@ -24,25 +58,124 @@ class SchemaEngine(SQLDatabase):
                  sample_rows_in_table_info: int = 3, indexes_in_table_info: bool = False,
                  custom_table_info: Optional[dict] = None, view_support: bool = False, max_string_length: int = 300,
                  mschema: Optional[MSchema] = None, llm: Optional[LLM] = None,
-                 db_name: Optional[str] = '', comment_mode: str = 'origin'):
+                 db_name: Optional[str] = '', comment_mode: str = 'origin', profile_batch_size: int = 200,
+                 stats_cache: Optional[StatsCache] = None, stats_invalidation: str = 'fingerprint',
+                 sample_row_budget: Optional[int] = None, max_enum_values: int = 100, max_workers: int = 1,
+                 max_llm_calls: Optional[int] = None, max_db_connections: Optional[int] = None,
+                 classify_batch_size: int = 1, heuristic_threshold: Optional[float] = None,
+                 example_sample_mode: str = 'exact', example_sample_rows: int = 1000,
+                 lazy_mschema: bool = False, prefetch_tables: bool = False,
+                 previous_mschema: Optional[Union[MSchema, str]] = None, incremental_row_count: bool = False,
+                 checkpoint: Optional[CheckpointManager] = None, connection_mode: str = 'transaction',
+                 read_only: bool = True, statement_timeout: Optional[float] = None,
+                 async_engine: Optional[AsyncEngine] = None, understand_database_mode: str = 'auto',
+                 understand_token_budget: Optional[int] = None):
         super().__init__(engine, schema, metadata, ignore_tables, include_tables, sample_rows_in_table_info,
                          indexes_in_table_info, custom_table_info, view_support, max_string_length)
 
         self._db_name = db_name
-        self._usable_tables = [table_name for table_name in self._usable_tables if self._inspector.has_table(table_name, schema)]
+        # the parent already listed the tables (and views) of the schema: no has_table round-trip per table
+        self._usable_tables = [table_name for table_name in self._usable_tables if table_name in self._all_tables]
         self._dialect = engine.dialect.name
         self._type_engine = TypeEngine()
         assert self._dialect in self._type_engine.supported_dialects, "Unsupported dialect {}.".format(self._dialect)
 
         self._llm = llm
-
+        # number of columns profiled by a single aggregate query
+        self._profile_batch_size = profile_batch_size
+        # cached column statistics are invalidated by the table fingerprint ('fingerprint'),
+        # or additionally by the table row count ('row_count')
+        assert stats_invalidation in ['fingerprint', 'row_count'], \
+            "Invalid stats invalidation {}.".format(stats_invalidation)
+        self._stats_cache = stats_cache if stats_cache is not None else StatsCache()
+        # databases sharing a cache file are told apart by their URL: db_name is not unique across servers
+        self._stats_cache_db = engine.url.render_as_string(hide_password=True)
+        self._stats_invalidation = stats_invalidation
+        self._row_counts = {}
+        self._row_estimates = {}
+        # sampling mode: tables larger than sample_row_budget rows are profiled on a random sample
+        self._sample_row_budget = sample_row_budget
+        self._sample_sources = {}
+        # upper bound on the candidate values collected for an Enum column
+        self._max_enum_values = max_enum_values
+        # number of columns classified concurrently by fields_category
+        self._max_workers = max_workers
+        # number of columns classified by one prompt in fields_category (1: one prompt per column)
+        self._classify_batch_size = classify_batch_size
+        # rule-based classifications at least this confident skip the LLM (None: always ask the LLM);
+        # keys, foreign keys, constant and ISO date/time columns score 0.9 or more, the statistical
+        # Enum/Text/Measure rules 0.85
+        self._heuristic_threshold = heuristic_threshold
+        # example values of init_mschema: exact distinct values per column ('exact'),
+        # or distinct values among the first example_sample_rows rows of one scan per table ('fast')
+        assert example_sample_mode in ['exact', 'fast'], \
+            "Invalid example sample mode {}.".format(example_sample_mode)
+        self._example_sample_mode = example_sample_mode
+        self._example_sample_rows = example_sample_rows
+        # 'transaction': every query runs in its own engine.begin() block;
+        # 'session': queries reuse idle autocommit (and read-only) connections until close_connections()
+        assert connection_mode in ['transaction', 'session'], \
+            "Invalid connection mode {}.".format(connection_mode)
+        self._connection_mode = connection_mode
+        self._read_only = read_only
+        self._session_connections = []
+        self._session_connections_guard = threading.Lock()
+        # server-side timeout in seconds of every query (None: no timeout); cancelled queries are recorded as skipped
+        self._statement_timeout = statement_timeout
+        self._skipped_queries = []
+        self._skipped_queries_guard = threading.Lock()
+        # engine on an asyncio driver (asyncpg, aiomysql, aiosqlite) used by the a* methods
+        self._async_engine = async_engine
+        self._adb_slots = {}
+        self._async_table_locks = {}
+        self._max_db_connections = max_db_connections
+        # database understanding: the whole M-Schema in one prompt ('single'), map-reduce over groups of
+        # tables related by foreign keys ('chunked'), or chunked only when the M-Schema exceeds the budget ('auto')
+        assert understand_database_mode in ['single', 'chunked', 'auto'], \
+            "Invalid database understanding mode {}.".format(understand_database_mode)
+        self._understand_database_mode = understand_database_mode
+        # tokens of M-Schema per prompt (None: derived from the context window of the LLM)
+        self._understand_token_budget = understand_token_budget
+        # journal of the pipeline stage results, used to resume an interrupted run; it is scoped to this
+        # database/schema and its records are keyed by the structure fingerprint of their table
+        self._checkpoint = checkpoint
+        self._checkpoint_fingerprints = {}
+        # supplementary information of the tables understood but not described yet
+        self._supp_infos = {}
+        if checkpoint is not None:
+            checkpoint.set_scope('{}/{}'.format(db_name or engine.url.database or '', schema or ''))
+        self._table_locks = {}
+        self._table_locks_guard = threading.Lock()
+        # global limits on LLM calls and DB queries in flight, shared by all worker threads
+        self._llm_slots = threading.BoundedSemaphore(max_llm_calls) if max_llm_calls else None
+        self._db_slots = threading.BoundedSemaphore(max_db_connections) if max_db_connections else None
+
+        self._prefetch_thread = None
         if mschema is not None:
             self._mschema = mschema
         else:
             self._mschema = MSchema(db_id=db_name, schema=schema, type_engine=self._type_engine)
-            self.init_mschema()
+            if lazy_mschema:
+                # tables are reflected and sampled on first access
+                self._mschema.set_table_loader(self._usable_tables, self.load_table)
+                if prefetch_tables:
+                    self.start_prefetch()
+            else:
+                self.init_mschema()
 
         self.comment_mode = comment_mode
+        # incremental mode: tables and columns unchanged since previous_mschema are carried over,
+        # only the dirty ones are profiled, classified and described again
+        self._incremental_row_count = incremental_row_count
+        self._dirty_tables = None
+        self._dirty_columns = None
+        if comment_mode == 'incremental':
+            assert previous_mschema is not None, "Incremental comment mode requires a previous M-Schema."
+            if isinstance(previous_mschema, str):
+                file_path = previous_mschema
+                previous_mschema = MSchema(type_engine=self._type_engine)
+                previous_mschema.load(file_path)
+            self.apply_previous_mschema(previous_mschema)
 
     @property
     def mschema(self) -> MSchema:
@@ -53,6 +186,48 @@ class SchemaEngine(SQLDatabase):
     def type_engine(self) -> TypeEngine:
         return self._type_engine
 
+    def get_checkpoint_fingerprint(self, table_name: Optional[str]) -> str:
+        """
+        Structure fingerprint of a table (of the whole schema if table_name is None) stored with its journal records.
+        The structure does not change during a run, so the fingerprint is computed once per table.
+        """
+        fingerprint = self._checkpoint_fingerprints.get(table_name)
+        if fingerprint is None:
+            if table_name is not None:
+                fingerprint = self._mschema.table_fingerprint(table_name)
+            else:
+                content = json.dumps([[t, self.get_checkpoint_fingerprint(t)] for t in self._mschema.tables.keys()])
+                fingerprint = hashlib.sha1(content.encode('utf-8')).hexdigest()
+            self._checkpoint_fingerprints[table_name] = fingerprint
+        return fingerprint
+
+    def checkpoint_get(self, stage: str, table_name: Optional[str], field_name: Optional[str] = None,
+                       fingerprint: Optional[str] = None) -> Any:
+        """
+        Result of a pipeline stage recorded by a previous run, None if not recorded or recorded with
+        another fingerprint (by default the structure fingerprint of the table).
+        """
+        if self._checkpoint is None:
+            return None
+        if fingerprint is None:
+            fingerprint = self.get_checkpoint_fingerprint(table_name)
+        return self._checkpoint.get(stage, table_name, field_name, fingerprint=fingerprint)
+
+    def checkpoint_record(self, stage: str, table_name: Optional[str], field_name: Optional[str], data: Any,
+                          fingerprint: Optional[str] = None):
+        if self._checkpoint is not None:
+            if fingerprint is None:
+                fingerprint = self.get_checkpoint_fingerprint(table_name)
+            self._checkpoint.record(stage, table_name, field_name, data, fingerprint=fingerprint)
+
+    def llm_slot(self):
+        """context manager holding one of the max_llm_calls slots"""
+        return self._llm_slots if self._llm_slots is not None else nullcontext()
+
+    def db_slot(self):
+        """context manager holding one of the max_db_connections slots"""
+        return self._db_slots if self._db_slots is not None else nullcontext()
+
     def get_pk_constraint(self, table_name: str) -> Dict:
         return self._inspector.get_pk_constraint(table_name, self._schema)['constrained_columns']
 
@@ -82,41 +257,231 @@ class SchemaEngine(SQLDatabase):
         # 索引字段
         return self._inspector.get_indexes(table_name, self._schema)
 
+    def open_session_connection(self):
+        """autocommit connection, read-only where the dialect supports it"""
+        options = {'isolation_level': 'AUTOCOMMIT'}
+        if self._read_only and self._dialect == self._type_engine.postgres_dialect:
+            options['postgresql_readonly'] = True
+        connection = self._engine.connect().execution_options(**options)
+        if self._read_only:
+            if self._dialect == self._type_engine.mysql_dialect:
+                connection.exec_driver_sql('SET SESSION TRANSACTION READ ONLY')
+            elif self._dialect == self._type_engine.sqlite_dialect:
+                connection.exec_driver_sql('PRAGMA query_only = ON')
+        return connection
+
+    def release_session_connection(self, connection):
+        """undo the session settings and give the connection back to the pool"""
+        try:
+            original_timeout = connection.info.pop('original_statement_timeout', None)
+            connection.info.pop('statement_timeout', None)
+            if original_timeout is not None and not connection.invalidated:
+                connection.exec_driver_sql("SET statement_timeout = '{}'".format(original_timeout))
+            if self._read_only and not connection.invalidated:
+                if self._dialect == self._type_engine.mysql_dialect:
+                    connection.exec_driver_sql('SET SESSION TRANSACTION READ WRITE')
+                elif self._dialect == self._type_engine.sqlite_dialect:
+                    connection.exec_driver_sql('PRAGMA query_only = OFF')
+        except Exception as e:
+            print("An exception occurred while releasing a connection.\n", e)
+        finally:
+            connection.close()
+
+    @contextmanager
+    def connection(self):
+        """
+        Connection used by a query, according to connection_mode. In session mode idle connections are kept
+        checked out and reused by the next query of any thread, skipping the pool checkout and the
+        BEGIN/COMMIT round-trips; there are never more of them than queries running at the same time.
+        """
+        if self._connection_mode != 'session':
+            with self._engine.begin() as connection:
+                yield connection
+            return
+
+        with self._session_connections_guard:
+            connection = self._session_connections.pop() if self._session_connections else None
+        if connection is None:
+            connection = self.open_session_connection()
+        try:
+            yield connection
+        finally:
+            if connection.invalidated:
+                self.release_session_connection(connection)
+            else:
+                with self._session_connections_guard:
+                    self._session_connections.append(connection)
+
+    def close_connections(self):
+        """give the idle session connections back to the pool"""
+        with self._session_connections_guard:
+            connections = self._session_connections
+            self._session_connections = []
+        for connection in connections:
+            self.release_session_connection(connection)
+
     def add_semicolon_to_sql(self, sql_query: str):
         if not sql_query.strip().endswith(';'):
             sql_query += ';'
         return sql_query
 
-    def fetch(self, sql_query: str):
+    @contextmanager
+    def statement_timeout(self, connection, sql_query: str, timeout: Optional[float]):
+        """
+        Enforce a server-side timeout on one query and yield the SQL to run:
+        SET (LOCAL) statement_timeout on Postgres, a MAX_EXECUTION_TIME optimizer hint on MySQL for a leading SELECT
+        (KILL QUERY from another connection for any other statement) and a progress handler interrupting
+        the statement on sqlite.
+        """
+        if timeout is None or timeout <= 0:
+            yield sql_query
+            return
+
+        timeout_ms = max(1, int(timeout * 1000))
+        if self._dialect == self._type_engine.postgres_dialect:
+            if connection.get_execution_options().get('isolation_level') == 'AUTOCOMMIT':
+                # session connection: a session setting, restored by release_session_connection
+                if connection.info.get('statement_timeout') != timeout_ms:
+                    if 'original_statement_timeout' not in connection.info:
+                        connection.info['original_statement_timeout'] = \
+                            connection.exec_driver_sql('SHOW statement_timeout').scalar()
+                    connection.exec_driver_sql('SET statement_timeout = {}'.format(timeout_ms))
+                    connection.info['statement_timeout'] = timeout_ms
+            else:
+                connection.exec_driver_sql('SET LOCAL statement_timeout = {}'.format(timeout_ms))
+            yield sql_query
+        elif self._dialect == self._type_engine.mysql_dialect:
+            hinted_query = re.sub(r'^\s*select\b', 'SELECT /*+ MAX_EXECUTION_TIME({}) */'.format(timeout_ms),
+                                  sql_query, count=1, flags=re.IGNORECASE)
+            if hinted_query != sql_query:
+                yield hinted_query
+            else:
+                # SHOW, DESCRIBE, WITH ... SELECT etc. do not take the hint (nor max_execution_time)
+                with self.kill_query_after(connection, timeout):
+                    yield sql_query
+        elif self._dialect == self._type_engine.sqlite_dialect:
+            dbapi_connection = connection.connection.dbapi_connection
+            if hasattr(dbapi_connection, 'set_progress_handler'):
+                set_progress_handler = dbapi_connection.set_progress_handler
+            else:
+                # asyncio adapter (aiosqlite): install the handler on the driver connection
+                set_progress_handler = lambda handler, n: dbapi_connection.run_async(
+                    lambda driver_connection: driver_connection.set_progress_handler(handler, n))
+            deadline = time.monotonic() + timeout
+            # a non-zero return value interrupts the running statement
+            set_progress_handler(lambda: int(time.monotonic() > deadline), 10000)
+            try:
+                yield sql_query
+            finally:
+                set_progress_handler(None, 0)
+        else:
+            yield sql_query
+
+    @contextmanager
+    def kill_query_after(self, connection, timeout: float):
+        """
+        MySQL: cancel the statement running on connection with KILL QUERY from another connection once
+        timeout has elapsed. The kill never outlives the block, so it cannot hit the next query of the connection.
+        """
+        connection_id = connection.exec_driver_sql('SELECT CONNECTION_ID()').scalar()
+        done = [False]
+        guard = threading.Lock()
+
+        def kill():
+            with guard:
+                if done[0]:
+                    return
+                try:
+                    with self._engine.connect() as killer:
+                        killer.exec_driver_sql('KILL QUERY {}'.format(int(connection_id)))
+                except Exception as e:
+                    print("Unable to cancel the query of connection {}.\n".format(connection_id), e)
+
+        timer = threading.Timer(timeout, kill)
+        timer.daemon = True
+        timer.start()
+        try:
+            yield
+        finally:
+            timer.cancel()
+            with guard:
+                done[0] = True
+
+    def is_timeout_error(self, e: Exception) -> bool:
+        orig = getattr(e, 'orig', e)
+        if self._dialect == self._type_engine.postgres_dialect:
+            return getattr(orig, 'pgcode', None) == '57014' or getattr(orig, 'sqlstate', None) == '57014'
+        elif self._dialect == self._type_engine.mysql_dialect:
+            # 3024: MAX_EXECUTION_TIME exceeded, 1317: interrupted by KILL QUERY
+            return len(getattr(orig, 'args', ())) > 0 and orig.args[0] in (3024, 1317)
+        elif self._dialect == self._type_engine.sqlite_dialect:
+            return 'interrupted' in str(orig)
+        return False
+
+    def record_skipped_query(self, sql_query: str, timeout: float):
+        print(f"SQL execution timeout ({timeout} seconds) {sql_query}.")
+        with self._skipped_queries_guard:
+            self._skipped_queries.append({"sql": sql_query, "timeout": timeout})
+
+    @property
+    def skipped_queries(self) -> List[Dict]:
+        """queries cancelled by the statement timeout"""
+        return list(self._skipped_queries)
+
+    def handle_query_exception(self, e: Exception, sql_query: str, timeout: Optional[float]):
+        if timeout is not None and self.is_timeout_error(e):
+            self.record_skipped_query(sql_query, timeout)
+        else:
+            print("An exception occurred during SQL execution.\n", e)
+
+    def fetch(self, sql_query: str, timeout: Optional[float] = None):
         sql_query = self.add_semicolon_to_sql(sql_query)
+        timeout = timeout if timeout is not None else self._statement_timeout
 
-        with self._engine.begin() as connection:
+        with self.db_slot(), self.connection() as connection:
             try:
-                cursor = connection.execute(text(sql_query))
-                records = cursor.fetchall()
+                with self.statement_timeout(connection, sql_query, timeout) as sql:
+                    cursor = connection.execute(text(sql))
+                    records = cursor.fetchall()
             except Exception as e:
-                print("An exception occurred during SQL execution.\n", e)
+                self.handle_query_exception(e, sql_query, timeout)
                 records = None
             return records
 
-    def fetch_truncated(self, sql_query: str, max_rows: Optional[int] = None, max_str_len: int = 30) -> Dict:
+    @staticmethod
+    def can_stream_results(connection) -> bool:
+        """
+        psycopg2 opens server-side cursors as named cursors, which only exist inside a transaction:
+        on the autocommit connections of session mode the query is bounded by its LIMIT instead.
+        """
+        return connection.get_execution_options().get('isolation_level') != 'AUTOCOMMIT'
+
+    def fetch_truncated(self, sql_query: str, max_rows: Optional[int] = None, max_str_len: int = 30,
+                        timeout: Optional[float] = None) -> Dict:
         sql_query = self.add_semicolon_to_sql(sql_query)
-        with self._engine.begin() as connection:
+        timeout = timeout if timeout is not None else self._statement_timeout
+        with self.db_slot(), self.connection() as connection:
             try:
-                cursor = connection.execute(text(sql_query))
-                result = cursor.fetchall()
+                with self.statement_timeout(connection, sql_query, timeout) as sql:
+                    # server-side cursor, so that only the first max_rows rows are transferred
+                    cursor = connection.execute(text(sql), execution_options={
+                        'stream_results': self.can_stream_results(connection)})
+                    if max_rows:
+                        result = cursor.fetchmany(max_rows)
+                    else:
+                        result = cursor.fetchall()
+                    fields = list(cursor.keys())
+                    cursor.close()
                 truncated_results = []
-                if max_rows:
-                    result = result[:max_rows]
                 for row in result:
                     truncated_row = tuple(
                         self.truncate_word(column, length=max_str_len)
                         for column in row
                     )
                     truncated_results.append(truncated_row)
-                return {"truncated_results": truncated_results, "fields": list(cursor.keys())}
+                return {"truncated_results": truncated_results, "fields": fields}
             except Exception as e:
-                print("An exception occurred during SQL execution.\n", e)
+                self.handle_query_exception(e, sql_query, timeout)
                 records = None
                 return {"truncated_results": records, "fields": []}
 
@@ -140,20 +505,17 @@ class SchemaEngine(SQLDatabase):
 
     def execute(self, sql_query: str, timeout=10) -> Any:
         sql_query = self.add_semicolon_to_sql(sql_query)
-        def run_query():
-            with self._engine.begin() as connection:
-                cursor = connection.execute(text(sql_query))
-                return True
-        with ThreadPoolExecutor(max_workers=1) as executor:
-            future = executor.submit(run_query)
+        with self.db_slot(), self.connection() as connection:
             try:
-                result = future.result(timeout=timeout)
-                return result
-            except TimeoutError:
-                print(f"SQL execution timeout ({timeout} seconds) {sql_query}.")
-                return None
+                # the timeout is enforced by the database, which also cancels the query
+                with self.statement_timeout(connection, sql_query, timeout) as sql:
+                    connection.execute(text(sql))
+                return True
             except Exception as e:
-                print("Exception occurred during SQL execution.", e)
+                if timeout is not None and self.is_timeout_error(e):
+                    self.record_skipped_query(sql_query, timeout)
+                else:
+                    print("Exception occurred during SQL execution.", e)
                 return None
 
     def get_protected_table_name(self, table_name: str) -> str:
@@ -175,100 +537,314 @@ class SchemaEngine(SQLDatabase):
         else:
             raise NotImplementedError
 
+    def reflect_tables(self, table_names: List[str]) -> Dict[str, Dict]:
+        """
+        Bulk-read the catalog information of the given tables with the get_multi_* inspector APIs:
+        one query per kind of object instead of one round-trip per table and per kind.
+        """
+        kw = dict(schema=self._schema, filter_names=table_names, kind=ObjectKind.ANY)
+        columns = self._inspector.get_multi_columns(**kw)
+        pk_constraints = self._inspector.get_multi_pk_constraint(**kw)
+        unique_constraints = self._inspector.get_multi_unique_constraints(**kw)
+        indexes = self._inspector.get_multi_indexes(**kw)
+        foreign_keys = self._inspector.get_multi_foreign_keys(**kw)
+        try:
+            table_comments = self._inspector.get_multi_table_comment(**kw)
+        except: # sqlite does not support adding comments
+            table_comments = {}
+
+        # get_multi_* results are keyed by (schema, table_name)
+        reflected = {}
+        for (_, table_name), fields in columns.items():
+            key = (self._schema, table_name)
+            reflected[table_name] = {
+                'comment': (table_comments.get(key) or {}).get('text'),
+                'pk': (pk_constraints.get(key) or {}).get('constrained_columns') or [],
+                'unique_constraints': unique_constraints.get(key, []),
+                'indexes': indexes.get(key, []),
+                'foreign_keys': foreign_keys.get(key, []),
+                'columns': fields,
+            }
+        return reflected
+
+    def reflect_table(self, table_name: str) -> Dict:
+        """per-table inspector round-trips, used when the dialect has no bulk reflection"""
+        return {
+            'comment': self.get_table_comment(table_name),
+            'pk': self.get_pk_constraint(table_name),
+            'unique_constraints': self.get_unique_constraints(table_name),
+            'indexes': self.get_indexes(table_name),
+            'foreign_keys': self.get_foreign_keys(table_name),
+            'columns': self._inspector.get_columns(table_name, schema=self._schema),
+        }
+
     def init_mschema(self):
+        try:
+            reflected = self.reflect_tables(self._usable_tables)
+        except Exception as e:
+            print("Bulk reflection failed, falling back to per-table reflection.\n", e)
+            reflected = {}
         for table_name in self._usable_tables:
-            table_comment = self.get_table_comment(table_name)
-            table_comment = '' if table_comment is None else table_comment.strip()
-            self._mschema.add_table(table_name, fields={}, comment=table_comment)
-            pks = self.get_pk_constraint(table_name)
-
-            # 数据表的唯一键
-            unique_keys = []
-            unique_constraints = self.get_unique_constraints(table_name)
-            for u_con in unique_constraints:
-                column_names = u_con['column_names']
-                unique_keys.append(column_names)
-            self._mschema.tables[table_name]['unique_keys'] = unique_keys
-
-            # 数据表索引
-            indexes = self.get_indexes(table_name)
-            keys = []
-            for index in indexes:
-                is_unique = index.get("unique", False)
-                keys.append(index['column_names'])
-            self._mschema.tables[table_name]['keys'] = keys
-
-            fks = self.get_foreign_keys(table_name)
-            constrained_columns = []
-            for fk in fks:
-                referred_schema = fk['referred_schema']
-                for c, r in zip(fk['constrained_columns'], fk['referred_columns']):
-                    self._mschema.add_foreign_key(table_name, c, referred_schema, fk['referred_table'], r)
-                    constrained_columns.append(c)
-
-            fields = self._inspector.get_columns(table_name, schema=self._schema)
-            for field in fields:
-                field_type = f"{field['type']!s}"
-                field_name = field['name']
-                if field_name in pks:
-                    primary_key = True
-                    if len(pks) == 1:
-                        is_unique = True
-                    else:
-                        is_unique = False
+            if table_name not in reflected:
+                reflected[table_name] = self.reflect_table(table_name)
+            self.add_reflected_table(table_name, reflected[table_name])
+
+    def load_table(self, table_name: str):
+        """table loader of the lazy M-Schema"""
+        try:
+            reflected = self.reflect_tables([table_name]).get(table_name)
+        except Exception as e:
+            print("Bulk reflection failed, falling back to per-table reflection.\n", e)
+            reflected = None
+        if reflected is None:
+            reflected = self.reflect_table(table_name)
+        self.add_reflected_table(table_name, reflected)
+
+    def start_prefetch(self) -> threading.Thread:
+        """load the tables of the lazy M-Schema in a background thread"""
+        def prefetch():
+            for table_name in list(self._mschema.tables.keys()):
+                try:
+                    self._mschema.tables[table_name]
+                except Exception as e:
+                    print("Prefetch of table {} failed.\n".format(table_name), e)
+        thread = threading.Thread(target=prefetch, name='mschema-prefetch', daemon=True)
+        thread.start()
+        self._prefetch_thread = thread
+        return thread
+
+    def add_reflected_table(self, table_name: str, reflected: Dict):
+        table_comment = reflected['comment']
+        table_comment = '' if table_comment is None else table_comment.strip()
+        self._mschema.add_table(table_name, fields={}, comment=table_comment)
+        pks = reflected['pk']
+
+        # 数据表的唯一键
+        unique_keys = []
+        for u_con in reflected['unique_constraints']:
+            column_names = u_con['column_names']
+            unique_keys.append(column_names)
+        self._mschema.tables[table_name]['unique_keys'] = unique_keys
+
+        # 数据表索引
+        keys = []
+        for index in reflected['indexes']:
+            is_unique = index.get("unique", False)
+            keys.append(index['column_names'])
+        self._mschema.tables[table_name]['keys'] = keys
+
+        table_examples = self.get_table_examples(table_name, reflected['columns'])
+        for field in reflected['columns']:
+            field_type = f"{field['type']!s}"
+            field_name = field['name']
+            if field_name in pks:
+                primary_key = True
+                if len(pks) == 1:
+                    is_unique = True
                 else:
-                    primary_key = False
-                    if [field_name] in unique_keys:
-                        is_unique = True
-                    else:
-                        is_unique = False
-                field_comment = field.get("comment", None)
-                field_comment = "" if field_comment is None else field_comment.strip()
-                autoincrement = field.get('autoincrement', False)
-                default = field.get('default', None)
-                if default is not None:
-                    default = f'{default}'
-
-                examples = []
+                    is_unique = False
+            else:
+                primary_key = False
+                if [field_name] in unique_keys:
+                    is_unique = True
+                else:
+                    is_unique = False
+            field_comment = field.get("comment", None)
+            field_comment = "" if field_comment is None else field_comment.strip()
+            autoincrement = field.get('autoincrement', False)
+            default = field.get('default', None)
+            if default is not None:
+                default = f'{default}'
+
+            examples = examples_to_str(table_examples.get(field_name, []))
+            if None in examples:
+                examples.remove(None)
+            if '' in examples:
+                examples.remove('')
+
+            self._mschema.add_field(table_name, field_name, field_type=field_type, primary_key=primary_key,
+                nullable=field['nullable'], default=default, autoincrement=autoincrement, unique=is_unique,
+                comment=field_comment, examples=examples)
+
+        # 外键在表构建完成后加入: 加载失败后重试时不会重复
+        existing_fks = [fk[1:] for fk in self._mschema.get_foreign_keys(table_name)]
+        for fk in reflected['foreign_keys']:
+            referred_schema = fk['referred_schema']
+            for c, r in zip(fk['constrained_columns'], fk['referred_columns']):
+                if [c, referred_schema, fk['referred_table'], r] not in existing_fks:
+                    self._mschema.add_foreign_key(table_name, c, referred_schema, fk['referred_table'], r)
+
+    def get_text_cast_snip(self, field_name: str) -> str:
+        """dialect-specific expression casting a column to text"""
+        if self._dialect == self._type_engine.postgres_dialect:
+            return '{}::TEXT'.format(self.get_protected_field_name(field_name))
+        elif self._dialect == self._type_engine.mysql_dialect:
+            return 'CAST({} AS CHAR)'.format(self.get_protected_field_name(field_name))
+        elif self._dialect == self._type_engine.sqlite_dialect:
+            return 'CAST({} AS TEXT)'.format(self.get_protected_field_name(field_name))
+        else:
+            raise NotImplementedError
+
+    def get_field_examples(self, table_name: str, field_name: str, num: int = 5) -> List:
+        """distinct non-null values of a single column"""
+        examples = []
+        try:
+            sql = f"select distinct {self.get_protected_field_name(field_name)} from {self.get_protected_table_name(table_name)} where {self.get_protected_field_name(field_name)} is not null limit {num};"
+            examples = [s[0] for s in self.fetch(sql)]
+        except:
+            pass
+        return examples
+
+    def get_table_examples_exact(self, table_name: str, fields: List[Dict], num: int = 5) -> Dict[str, List]:
+        """
+        Distinct values of all the columns with a UNION ALL of per-column DISTINCT ... LIMIT subqueries,
+        one query per profile_batch_size columns. Values are cast to text so that the branches share one type.
+        """
+        examples = {}
+        table = self.get_protected_table_name(table_name)
+        for start in range(0, len(fields), self._profile_batch_size):
+            batch = fields[start: start + self._profile_batch_size]
+            subqueries = []
+            for idx, field in enumerate(batch):
+                field_name = self.get_protected_field_name(field['name'])
+                subqueries.append('select {} as field_idx, {} as field_value from (select distinct {} from {} '
+                                  'where {} is not null limit {}) as examples_{}'.format(
+                    idx, self.get_text_cast_snip(field['name']), field_name, table, field_name, num, idx))
+            res = self.fetch(' union all '.join(subqueries))
+            if res is None:
+                continue
+            batch_examples = {field['name']: [] for field in batch}
+            for field_idx, value in res:
+                batch_examples[batch[field_idx]['name']].append(value)
+            for field in batch:
+                values = batch_examples[field['name']]
+                # 与原生类型一致: 日期时间列只保留一个示例
+                python_type = self._get_python_type(field['type'])
+                if python_type is not None and issubclass(python_type, datetime.date):
+                    values = values[:1]
+                examples[field['name']] = [self._text_example_to_str(v, python_type) for v in values]
+        return examples
+
+    def get_table_examples_fast(self, table_name: str, fields: List[Dict], num: int = 5) -> Dict[str, List]:
+        """
+        Distinct values of all the columns from one bounded scan of example_sample_rows rows,
+        deduplicated in Python. Rare values may be missed, but a wide table costs a single cheap query.
+        """
+        field_names = [field['name'] for field in fields]
+        sql = 'select {} from {} limit {}'.format(', '.join(self.get_protected_field_name(f) for f in field_names),
+            self.get_protected_table_name(table_name), self._example_sample_rows)
+        res = self.fetch(sql)
+        if res is None:
+            return {}
+        examples = {field_name: [] for field_name in field_names}
+        seen = {field_name: set() for field_name in field_names}
+        for row in res:
+            for field_name, value in zip(field_names, row):
+                if value is None or len(examples[field_name]) >= num:
+                    continue
                 try:
-                    sql = f"select distinct {self.get_protected_field_name(field_name)} from {self.get_protected_table_name(table_name)} where {self.get_protected_field_name(field_name)} is not null limit 5;"
-                    examples = [s[0] for s in self.fetch(sql)]
-                except:
-                    pass
-                examples = examples_to_str(examples)
-                if None in examples:
-                    examples.remove(None)
-                if '' in examples:
-                    examples.remove('')
-
-                self._mschema.add_field(table_name, field_name, field_type=field_type, primary_key=primary_key,
-                    nullable=field['nullable'], default=default, autoincrement=autoincrement, unique=is_unique,
-                    comment=field_comment, examples=examples)
+                    if value in seen[field_name]:
+                        continue
+                    seen[field_name].add(value)
+                except TypeError: # unhashable values
+                    if value in examples[field_name]:
+                        continue
+                examples[field_name].append(value)
+        return examples
+
+    def get_table_examples(self, table_name: str, fields: List[Dict], num: int = 5) -> Dict[str, List]:
+        """
+        Example values of all the columns of a table, sampled per table according to example_sample_mode.
+        Columns the batched query could not serve fall back to one query per column.
+        """
+        if len(fields) == 0:
+            return {}
+        try:
+            if self._example_sample_mode == 'fast':
+                examples = self.get_table_examples_fast(table_name, fields, num)
+            else:
+                examples = self.get_table_examples_exact(table_name, fields, num)
+        except Exception as e:
+            print("Batched example sampling failed on table {}.\n".format(table_name), e)
+            examples = {}
+        for field in fields:
+            if field['name'] not in examples:
+                examples[field['name']] = self.get_field_examples(table_name, field['name'], num)
+        return examples
+
+    @staticmethod
+    def _get_python_type(field_type) -> Optional[type]:
+        try:
+            return field_type.python_type
+        except Exception:
+            return None
+
+    @staticmethod
+    def _text_example_to_str(value: str, python_type: Optional[type]) -> str:
+        """
+        Spell a value cast to text by the database the way str() spells the native value the driver returns:
+        decimals and floats as Python floats, Postgres booleans as True/False, timestamps with the UTC
+        offset as +HH:MM. Values that cannot be parsed are kept as they are.
+        """
+        if value is None or python_type is None:
+            return value
+        try:
+            if python_type is bool:
+                return {'true': 'True', 't': 'True', 'false': 'False', 'f': 'False'}.get(value.lower(), value)
+            if python_type is decimal.Decimal or python_type is float:
+                return str(float(value))
+            if python_type is datetime.datetime:
+                # Postgres spells a whole-hour offset as +HH
+                offset = ':00' if re.search(r'[+-]\d{2}$', value) else ''
+                return str(datetime.datetime.fromisoformat(value + offset))
+        except (AttributeError, TypeError, ValueError):
+            pass
+        return value
+
+    def get_column_count_sql(self, table_name: str, field_name: str) -> str:
+        return 'select count({}) from {};'.format(self.get_protected_field_name(field_name),
+                                                  self.get_protected_table_name(table_name))
 
     def get_column_count(self, table_name: str, field_name: str) -> int:
-        sql = 'select count({}) from {};'.format(self.get_protected_field_name(field_name),
-                                                 self.get_protected_table_name(table_name))
-        r = self.fetch(sql)
+        r = self.fetch(self.get_column_count_sql(table_name, field_name))
         if r is not None:
             total_num = r[0][0]
         else:
             total_num = -1
         return total_num
 
+    def get_column_unique_count_sql(self, table_name: str, field_name: str) -> str:
+        return 'select count(distinct {}) from {};'.format(self.get_protected_field_name(field_name),
+                                                           self.get_protected_table_name(table_name))
+
     def get_column_unique_count(self, table_name: str, field_name: str) -> int:
-        sql = 'select count(distinct {}) from {};'.format(self.get_protected_field_name(field_name),
-                                                          self.get_protected_table_name(table_name))
-        r = self.fetch(sql)
+        r = self.fetch(self.get_column_unique_count_sql(table_name, field_name))
         if r is not None:
             unique_num = r[0][0]
         else:
             unique_num = -1
         return unique_num
 
-    def get_column_value_examples(self, table_name: str, field_name: str, max_rows: Optional[int] = None, max_str_len: int = 30)-> List:
-        sql = 'select distinct {} from {} where {} is not null;'.format(self.get_protected_field_name(field_name),
-            self.get_protected_table_name(table_name), self.get_protected_field_name(field_name))
-        res = self.fetch_truncated(sql, max_rows, max_str_len)
+    def get_column_value_examples_sql(self, table_name: str, field_name: str, max_rows: Optional[int] = None,
+                                      source: Optional[str] = None) -> str:
+        if source is None:
+            source = self.get_protected_table_name(table_name)
+        sql = 'select distinct {} from {} where {} is not null'.format(self.get_protected_field_name(field_name),
+            source, self.get_protected_field_name(field_name))
+        if max_rows is not None and max_rows > 0:
+            sql += ' limit {}'.format(max_rows)
+        return sql
+
+    def get_column_value_examples(self, table_name: str, field_name: str, max_rows: Optional[int] = None,
+                                  max_str_len: int = 30, exact: bool = False) -> List:
+        """distinct values of a column, from the sampled source in sampling mode unless exact"""
+        query_key = 'value_examples:{}:{}:{}{}'.format(field_name, max_rows, max_str_len, ':exact' if exact else '')
+        res = self.get_cached_query_result(table_name, query_key)
+        if res is None:
+            source = None if exact else self.get_profile_source(table_name)
+            sql = self.get_column_value_examples_sql(table_name, field_name, max_rows, source)
+            res = self.fetch_truncated(sql, max_rows, max_str_len)
+            self.put_cached_query_result(table_name, query_key, res)
         res = res['truncated_results']
         if res is not None:
             return [r[0] for r in res]
@@ -292,20 +868,24 @@ class SchemaEngine(SQLDatabase):
         assert agg_func.upper() in ['MAX', 'MIN', 'AVG', 'SUM'], \
             "Invalid aggregate function {}.".format(agg_func)
 
+    def get_column_agg_value_sql(self, table_name: str, field_name: str, agg_func: str) -> str:
+        self.check_agg_func(agg_func)
+        return 'select {}({}) from {} where {} is not null;'.format(agg_func, self.get_protected_field_name(field_name),
+            self.get_protected_table_name(table_name), self.get_protected_field_name(field_name))
+
     def get_column_agg_value(self, table_name: str, field_name: str, field_type: str, agg_func: str):
         self.check_agg_func(agg_func)
         if self._type_engine.field_type_cate(field_type) != self._type_engine.field_type_number_label:
             return None
 
-        sql = 'select {}({}) from {} where {} is not null;'.format(agg_func, self.get_protected_field_name(field_name),
-            self.get_protected_table_name(table_name), self.get_protected_field_name(field_name))
-        r = self.fetch(sql)
+        r = self.fetch(self.get_column_agg_value_sql(table_name, field_name, agg_func))
         if r is not None:
             return r[0][0]
         else:
             return None
 
-    def get_column_agg_char_length(self, table_name: str, field_name: str, agg_func: str) -> int:
+    def get_char_length_snip(self, field_name: str) -> str:
+        """dialect-specific expression computing the character length of a column"""
         if self._dialect == self._type_engine.postgres_dialect:
             snip = '{}::TEXT'.format(self.get_protected_field_name(field_name))
         elif self._dialect == self._type_engine.mysql_dialect:
@@ -315,25 +895,508 @@ class SchemaEngine(SQLDatabase):
         else:
             raise NotImplementedError
 
-        self.check_agg_func(agg_func)
         if self._dialect == self._type_engine.sqlite_dialect:
-            sql = 'select {}(length({})) from {} where {} is not null;'.format(agg_func, snip,
-                self.get_protected_table_name(table_name),self.get_protected_field_name(field_name))
+            return 'length({})'.format(snip)
         else:
-            sql = 'select {}(char_length({})) from {} where {} is not null;'.format(agg_func, snip,
-                self.get_protected_table_name(table_name), self.get_protected_field_name(field_name))
-        r = self.fetch(sql)
+            return 'char_length({})'.format(snip)
+
+    def get_column_agg_char_length_sql(self, table_name: str, field_name: str, agg_func: str) -> str:
+        self.check_agg_func(agg_func)
+        return 'select {}({}) from {} where {} is not null;'.format(agg_func, self.get_char_length_snip(field_name),
+            self.get_protected_table_name(table_name), self.get_protected_field_name(field_name))
+
+    def get_column_agg_char_length(self, table_name: str, field_name: str, agg_func: str) -> int:
+        r = self.fetch(self.get_column_agg_char_length_sql(table_name, field_name, agg_func))
         if r is not None and r[0][0] is not None:
             return r[0][0]
         else:
             return -1
 
+    @staticmethod
+    def _stats_value(value: Any) -> Any:
+        """keep the statistic JSON serializable while printing exactly as the raw value would"""
+        if value is None or isinstance(value, (bool, int, float, str)):
+            return value
+        return str(value)
+
+    def get_table_row_estimate_sql(self, table_name: str) -> Optional[str]:
+        """catalog query estimating the number of rows, None when the dialect has no such statistics"""
+        escaped_name = table_name.replace("'", "''")
+        if self._dialect == self._type_engine.postgres_dialect:
+            schema_snip = "'{}'".format(self._schema.replace("'", "''")) if self._schema else 'current_schema()'
+            sql = "select c.reltuples::bigint from pg_class c join pg_namespace n on n.oid = c.relnamespace " \
+                  "where c.relname = '{}' and n.nspname = {};".format(escaped_name, schema_snip)
+        elif self._dialect == self._type_engine.mysql_dialect:
+            schema_snip = "'{}'".format(self._schema.replace("'", "''")) if self._schema else 'database()'
+            sql = "select table_rows from information_schema.tables " \
+                  "where table_schema = {} and table_name = '{}';".format(schema_snip, escaped_name)
+        else:
+            return None
+        return sql
+
+    def get_table_row_estimate(self, table_name: str) -> int:
+        """
+        Approximate number of rows from the catalog statistics (pg_class / information_schema),
+        falling back to an exact count when the catalog has no estimate. Queried once per SchemaEngine.
+        """
+        if table_name not in self._row_estimates:
+            sql = self.get_table_row_estimate_sql(table_name)
+            r = self.fetch(sql) if sql is not None else None
+            if r is not None and len(r) > 0 and r[0][0] is not None and r[0][0] >= 0:
+                self._row_estimates[table_name] = int(r[0][0])
+            else:
+                self._row_estimates[table_name] = self.get_table_row_count(table_name)
+        return self._row_estimates[table_name]
+
+    def get_sample_key(self, table_name: str) -> Optional[str]:
+        """the single integer primary key of the table, None if it has none"""
+        pks = [(field_name, field_info.get('type', '')) for field_name, field_info in
+               self._mschema.tables[table_name]['fields'].items() if field_info.get('primary_key', False)]
+        if len(pks) == 1 and self._type_engine.field_type_abbr(pks[0][1].upper()) in INTEGER_TYPES:
+            return pks[0][0]
+        return None
+
+    def get_sample_sql(self, table_name: str, fraction: float) -> str:
+        """
+        Subquery returning a random sample of about `fraction` of the rows, bounded by the row budget.
+        Postgres samples random blocks (TABLESAMPLE SYSTEM). MySQL and sqlite have no block sampling:
+        with an integer primary key, the key range is split into SAMPLE_KEY_RANGES strata and each one contributes
+        a short run of rows from a random position of the key index, so only the sampled rows are read and
+        tables grouped by insertion order are still covered end to end; otherwise a random filter scans the whole
+        table. The positions are drawn once per table, so all the statistics of a table share the same sample.
+        """
+        table = self.get_protected_table_name(table_name)
+        sample_key = self.get_sample_key(table_name) \
+            if self._dialect in [self._type_engine.mysql_dialect, self._type_engine.sqlite_dialect] else None
+        key_bounds = None
+        if sample_key is not None:
+            key = self.get_protected_field_name(sample_key)
+            # min() and max() in separate subqueries, so that each one reads a single entry of the index
+            r = self.fetch('select (select min({key}) from {table}), (select max({key}) from {table})'.format(
+                key=key, table=table))
+            if r and r[0][0] is not None:
+                key_bounds = (int(r[0][0]), int(r[0][1]))
+        if key_bounds is not None:
+            min_key, max_key = key_bounds
+            budget = self._sample_row_budget
+            ranges = max(1, min(SAMPLE_KEY_RANGES, budget))
+            width = (max_key - min_key + ranges) // ranges
+            runs = []
+            for i in range(ranges):
+                rows = budget // ranges + (1 if i < budget % ranges else 0)
+                low, high = min_key + i * width, min(min_key + (i + 1) * width, max_key + 1)
+                if low >= high:
+                    break
+                start = low + random.randrange(max(high - low - rows + 1, 1))
+                runs.append('select * from (select * from {table} where {key} >= {start} and {key} < {high} '
+                            'order by {key} limit {rows}) as sample_range_{i}'.format(
+                                table=table, key=key, start=start, high=high, rows=rows, i=i))
+            sql = ' union all '.join(runs)
+        elif self._dialect == self._type_engine.postgres_dialect:
+            sql = 'select * from {} tablesample system ({:.6f})'.format(table, fraction * 100)
+        elif self._dialect == self._type_engine.mysql_dialect:
+            sql = 'select * from {} where rand() < {:.8f}'.format(table, fraction)
+        elif self._dialect == self._type_engine.sqlite_dialect:
+            sql = 'select * from {} where abs(random()) < {:.8f} * 9223372036854775807'.format(table, fraction)
+        else:
+            raise NotImplementedError
+        return '(select * from ({}) as sample_rows limit {}) as profile_sample'.format(sql, self._sample_row_budget)
+
+    def get_profile_source(self, table_name: str) -> Optional[str]:
+        """
+        The sampled subquery used in place of the table in sampling mode,
+        or None when the table is profiled exactly.
+        """
+        if self._sample_row_budget is None:
+            return None
+        if table_name not in self._sample_sources:
+            self.set_profile_source(table_name, self.get_table_row_estimate(table_name))
+        return self._sample_sources[table_name]
+
+    def set_profile_source(self, table_name: str, total_rows: int):
+        if total_rows <= self._sample_row_budget:
+            self._sample_sources[table_name] = None
+        else:
+            self._sample_sources[table_name] = self.get_sample_sql(table_name, self._sample_row_budget / total_rows)
+
+    @staticmethod
+    def estimate_unique_count(sample_unique: int, sample_count: int, total_count: int) -> int:
+        """
+        Extrapolate COUNT(DISTINCT) from a sample. It interpolates between a low-cardinality column,
+        whose values all appear in the sample, and a key-like column, whose distinct count grows linearly.
+        """
+        if sample_count <= 0 or total_count <= sample_count:
+            return sample_unique
+        ratio = sample_unique / sample_count
+        estimate = sample_unique * (1 + (total_count / sample_count - 1) * ratio)
+        return int(min(round(estimate), total_count))
+
+    def get_table_profile_sql(self, table_name: str, field_names: List[str], source: Optional[str] = None) -> str:
+        """
+        Build a single SELECT computing COUNT, COUNT(DISTINCT), MAX/MIN/AVG (number columns only)
+        and MAX/MIN char length for every given column of the table.
+        With a sampled `source`, the number of sampled rows is selected first.
+        """
+        agg_list = [] if source is None else ['count(*)']
+        for field_name in field_names:
+            field = self.get_protected_field_name(field_name)
+            field_type = self._mschema.get_field_info(table_name, field_name).get('type', '')
+            agg_list.append('count({})'.format(field))
+            agg_list.append('count(distinct {})'.format(field))
+            if self._type_engine.field_type_cate(field_type) == self._type_engine.field_type_number_label:
+                agg_list.extend(['{}({})'.format(agg_func, field) for agg_func in ['max', 'min', 'avg']])
+            length_snip = self.get_char_length_snip(field_name)
+            agg_list.extend(['{}({})'.format(agg_func, length_snip) for agg_func in ['max', 'min']])
+        if source is None:
+            source = self.get_protected_table_name(table_name)
+        return 'select {} from {};'.format(', '.join(agg_list), source)
+
+    def profile_column(self, table_name: str, field_name: str) -> Dict:
+        """Column statistics computed with one query per aggregate, used when the table-level query fails."""
+        field_type = self._mschema.get_field_info(table_name, field_name).get('type', '')
+        return {
+            "count": self.get_column_count(table_name, field_name),
+            "unique_count": self.get_column_unique_count(table_name, field_name),
+            "max": self._stats_value(self.get_column_agg_value(table_name, field_name, field_type, 'max')),
+            "min": self._stats_value(self.get_column_agg_value(table_name, field_name, field_type, 'min')),
+            "avg": self._stats_value(self.get_column_agg_value(table_name, field_name, field_type, 'avg')),
+            "max_len": self.get_column_agg_char_length(table_name, field_name, 'max'),
+            "min_len": self.get_column_agg_char_length(table_name, field_name, 'min'),
+        }
+
+    def profile_table(self, table_name: str) -> Dict[str, Dict]:
+        """
+        Profile all columns of a table with one combined SELECT (one per `profile_batch_size` columns,
+        to stay below the select-list limits of the dialects) and store the stats in M-Schema.
+        """
+        field_names = list(self._mschema.tables[table_name]['fields'].keys())
+        source = self.get_profile_source(table_name)
+        total_rows = self.get_table_row_estimate(table_name) if source is not None else None
+        table_stats = {}
+        for i in range(0, len(field_names), self._profile_batch_size):
+            batch = field_names[i: i + self._profile_batch_size]
+            r = self.fetch(self.get_table_profile_sql(table_name, batch, source))
+            if source is not None and r is not None and len(r) > 0 and r[0][0] == 0:
+                # block sampling may pick no row at all, profile this batch exactly
+                r = self.fetch(self.get_table_profile_sql(table_name, batch))
+                sample_rows = None
+            else:
+                sample_rows = None if source is None or r is None or len(r) == 0 else r[0][0]
+            if r is None or len(r) == 0:
+                for field_name in batch:
+                    table_stats[field_name] = self.profile_column(table_name, field_name)
+                continue
+            table_stats.update(self.parse_table_profile_row(table_name, batch, r[0], sample_rows, total_rows))
+
+        self.store_table_stats(table_name, table_stats)
+        return table_stats
+
+    def parse_table_profile_row(self, table_name: str, field_names: List[str], row: Tuple,
+                                sample_rows: Optional[int] = None, total_rows: Optional[int] = None) -> Dict[str, Dict]:
+        """column statistics from the result row of get_table_profile_sql, scaled up when computed on a sample"""
+        number_label = self._type_engine.field_type_number_label
+        table_stats = {}
+        values = iter(row[1:] if sample_rows is not None else row)
+        for field_name in field_names:
+            field_type = self._mschema.get_field_info(table_name, field_name).get('type', '')
+            stats = {"count": next(values), "unique_count": next(values),
+                     "max": None, "min": None, "avg": None}
+            if self._type_engine.field_type_cate(field_type) == number_label:
+                stats["max"] = self._stats_value(next(values))
+                stats["min"] = self._stats_value(next(values))
+                stats["avg"] = self._stats_value(next(values))
+            max_len, min_len = next(values), next(values)
+            stats["max_len"] = max_len if max_len is not None else -1
+            stats["min_len"] = min_len if min_len is not None else -1
+            if sample_rows is not None:
+                total_count = int(round(stats["count"] * total_rows / sample_rows))
+                stats["unique_count"] = self.estimate_unique_count(stats["unique_count"], stats["count"], total_count)
+                stats["count"] = total_count
+                stats["approximate"] = True
+                stats["sample_rows"] = sample_rows
+            table_stats[field_name] = stats
+        return table_stats
+
+    def store_table_stats(self, table_name: str, table_stats: Dict[str, Dict]):
+        """store the column statistics in M-Schema, the checkpoint journal and the stats cache"""
+        for field_name, stats in table_stats.items():
+            self._mschema.set_column_property(table_name, field_name, 'stats', stats)
+            self.checkpoint_record(STAGE_STATS, table_name, field_name, stats, self.get_stats_fingerprint(table_name))
+        self._stats_cache.put_many({self.get_stats_cache_key(table_name, field_name): stats
+                                    for field_name, stats in table_stats.items()},
+                                   *self.get_stats_validity(table_name))
+
+    def get_table_row_count(self, table_name: str) -> int:
+        """number of rows of the table, queried once per SchemaEngine"""
+        if table_name not in self._row_counts:
+            r = self.fetch(self.get_table_row_count_sql(table_name))
+            self._row_counts[table_name] = r[0][0] if r is not None else -1
+        return self._row_counts[table_name]
+
+    def get_table_row_count_sql(self, table_name: str) -> str:
+        return 'select count(*) from {};'.format(self.get_protected_table_name(table_name))
+
+    def get_stats_cache_key(self, table_name: str, field_name: str) -> Tuple:
+        return StatsCache.make_key(self._stats_cache_db, self._schema, table_name, field_name)
+
+    def get_stats_validity(self, table_name: str) -> Tuple[str, Optional[int]]:
+        """(fingerprint, row_count) that cached statistics of the table must match"""
+        fingerprint = self._mschema.table_fingerprint(table_name)
+        if self._sample_row_budget is not None:
+            fingerprint += ':sample{}'.format(self._sample_row_budget)
+        if self._stats_invalidation == 'row_count':
+            return fingerprint, self.get_table_row_count(table_name)
+        return fingerprint, None
+
+    def get_stats_fingerprint(self, table_name: str) -> str:
+        """fingerprint of the column statistics recorded in the checkpoint journal, as strict as the stats cache"""
+        fingerprint, row_count = self.get_stats_validity(table_name)
+        return fingerprint if row_count is None else '{}:rows{}'.format(fingerprint, row_count)
+
+    def load_cached_table_stats(self, table_name: str) -> bool:
+        """Fill M-Schema with the cached statistics of the table; return False if any column is missing or stale."""
+        fingerprint, row_count = self.get_stats_validity(table_name)
+        table_stats = {}
+        for field_name in self._mschema.tables[table_name]['fields'].keys():
+            stats = self._stats_cache.get(self.get_stats_cache_key(table_name, field_name), fingerprint, row_count)
+            if stats is None:
+                return False
+            table_stats[field_name] = stats
+        for field_name, stats in table_stats.items():
+            self._mschema.set_column_property(table_name, field_name, 'stats', stats)
+        return True
+
+    def get_query_cache_key(self, table_name: str, query_key: str) -> Tuple:
+        return StatsCache.make_key(self._stats_cache_db, self._schema, table_name, query_key)
+
+    def get_cached_query_result(self, table_name: str, query_key: str) -> Optional[Dict]:
+        """
+        fetch_truncated result of a sampling query (value examples, sample rows) cached by a previous run,
+        None if missing or stale. Results are validated like the column statistics.
+        """
+        return self._stats_cache.get_result(self.get_query_cache_key(table_name, query_key),
+                                            *self.get_stats_validity(table_name))
+
+    def put_cached_query_result(self, table_name: str, query_key: str, res: Dict):
+        # failed queries are not cached
+        if res['truncated_results'] is not None:
+            self._stats_cache.put_result(self.get_query_cache_key(table_name, query_key), res,
+                                         *self.get_stats_validity(table_name))
+
+    def get_table_lock(self, table_name: str) -> threading.Lock:
+        """lock serializing the profiling of a table between worker threads"""
+        with self._table_locks_guard:
+            if table_name not in self._table_locks:
+                self._table_locks[table_name] = threading.Lock()
+            return self._table_locks[table_name]
+
+    def get_column_stats(self, table_name: str, field_name: str) -> Dict:
+        """Column statistics stored in M-Schema, taken from the stats cache or profiling the whole table on first access."""
+        stats = self._mschema.get_field_info(table_name, field_name).get('stats', None)
+        if stats is None:
+            with self.get_table_lock(table_name):
+                stats = self._mschema.get_field_info(table_name, field_name).get('stats', None)
+                if stats is not None:
+                    return stats
+                # the stats cache validates its entries (fingerprint or row count) and comes first
+                if self.load_cached_table_stats(table_name):
+                    return self._mschema.get_field_info(table_name, field_name).get('stats', {})
+                stats = self.checkpoint_get(STAGE_STATS, table_name, field_name, self.get_stats_fingerprint(table_name))
+                if stats is not None:
+                    self._mschema.set_column_property(table_name, field_name, 'stats', stats)
+                    return stats
+                stats = self.profile_table(table_name).get(field_name, {})
+        return stats
+
     def get_all_field_examples(self, table_name: str,  max_rows: Optional[int] = None):
         sql = f"""SELECT DISTINCT * FROM {self.get_protected_table_name(table_name)}"""  # group by {dimension_fields}
         if max_rows is not None and max_rows > 0:
             sql += ' LIMIT {};'.format(max_rows)
         return sql
 
+    # asyncio API: the profiling and sampling queries on the async engine, so that an event loop
+    # can interleave them with in-flight LLM calls
+    def adb_slot(self):
+        """asyncio counterpart of db_slot, one semaphore per event loop"""
+        if self._max_db_connections is None:
+            return nullcontext()
+        loop = asyncio.get_running_loop()
+        if loop not in self._adb_slots:
+            self._adb_slots[loop] = asyncio.Semaphore(self._max_db_connections)
+        return self._adb_slots[loop]
+
+    def get_async_table_lock(self, table_name: str) -> asyncio.Lock:
+        key = (asyncio.get_running_loop(), table_name)
+        if key not in self._async_table_locks:
+            self._async_table_locks[key] = asyncio.Lock()
+        return self._async_table_locks[key]
+
+    async def arun_query(self, sql_query: str, timeout: Optional[float], run):
+        """run(connection, sql) on a connection of the async engine, within the statement timeout"""
+        assert self._async_engine is not None, "The async API requires an async_engine."
+        sql_query = self.add_semicolon_to_sql(sql_query)
+        timeout = timeout if timeout is not None else self._statement_timeout
+
+        def run_with_timeout(connection):
+            with self.statement_timeout(connection, sql_query, timeout) as sql:
+                return run(connection, sql)
+
+        async with self.adb_slot(), self._async_engine.begin() as connection:
+            return await connection.run_sync(run_with_timeout)
+
+    async def afetch(self, sql_query: str, timeout: Optional[float] = None):
+        try:
+            return await self.arun_query(sql_query, timeout,
+                                         lambda connection, sql: connection.execute(text(sql)).fetchall())
+        except Exception as e:
+            self.handle_query_exception(e, sql_query, timeout if timeout is not None else self._statement_timeout)
+            return None
+
+    async def afetch_truncated(self, sql_query: str, max_rows: Optional[int] = None, max_str_len: int = 30,
+                               timeout: Optional[float] = None) -> Dict:
+        def run(connection, sql):
+            cursor = connection.execute(text(sql), execution_options={'stream_results': True})
+            result = cursor.fetchmany(max_rows) if max_rows else cursor.fetchall()
+            fields = list(cursor.keys())
+            cursor.close()
+            return result, fields
+
+        try:
+            result, fields = await self.arun_query(sql_query, timeout, run)
+        except Exception as e:
+            self.handle_query_exception(e, sql_query, timeout if timeout is not None else self._statement_timeout)
+            return {"truncated_results": None, "fields": []}
+        truncated_results = [tuple(self.truncate_word(column, length=max_str_len) for column in row)
+                             for row in result]
+        return {"truncated_results": truncated_results, "fields": fields}
+
+    async def aget_column_count(self, table_name: str, field_name: str) -> int:
+        r = await self.afetch(self.get_column_count_sql(table_name, field_name))
+        return r[0][0] if r is not None else -1
+
+    async def aget_column_unique_count(self, table_name: str, field_name: str) -> int:
+        r = await self.afetch(self.get_column_unique_count_sql(table_name, field_name))
+        return r[0][0] if r is not None else -1
+
+    async def aget_column_agg_value(self, table_name: str, field_name: str, field_type: str, agg_func: str):
+        self.check_agg_func(agg_func)
+        if self._type_engine.field_type_cate(field_type) != self._type_engine.field_type_number_label:
+            return None
+        r = await self.afetch(self.get_column_agg_value_sql(table_name, field_name, agg_func))
+        return r[0][0] if r is not None else None
+
+    async def aget_column_agg_char_length(self, table_name: str, field_name: str, agg_func: str) -> int:
+        r = await self.afetch(self.get_column_agg_char_length_sql(table_name, field_name, agg_func))
+        return r[0][0] if r is not None and r[0][0] is not None else -1
+
+    async def aget_table_row_count(self, table_name: str) -> int:
+        if table_name not in self._row_counts:
+            r = await self.afetch(self.get_table_row_count_sql(table_name))
+            self._row_counts[table_name] = r[0][0] if r is not None else -1
+        return self._row_counts[table_name]
+
+    async def aget_table_row_estimate(self, table_name: str) -> int:
+        if table_name not in self._row_estimates:
+            sql = self.get_table_row_estimate_sql(table_name)
+            r = await self.afetch(sql) if sql is not None else None
+            if r is not None and len(r) > 0 and r[0][0] is not None and r[0][0] >= 0:
+                self._row_estimates[table_name] = int(r[0][0])
+            else:
+                self._row_estimates[table_name] = await self.aget_table_row_count(table_name)
+        return self._row_estimates[table_name]
+
+    async def aget_profile_source(self, table_name: str) -> Optional[str]:
+        if self._sample_row_budget is None:
+            return None
+        if table_name not in self._sample_sources:
+            self.set_profile_source(table_name, await self.aget_table_row_estimate(table_name))
+        return self._sample_sources[table_name]
+
+    async def aget_column_value_examples(self, table_name: str, field_name: str, max_rows: Optional[int] = None,
+                                         max_str_len: int = 30, exact: bool = False) -> List:
+        query_key = 'value_examples:{}:{}:{}{}'.format(field_name, max_rows, max_str_len, ':exact' if exact else '')
+        if self._stats_invalidation == 'row_count':
+            await self.aget_table_row_count(table_name)
+        res = self.get_cached_query_result(table_name, query_key)
+        if res is None:
+            source = None if exact else await self.aget_profile_source(table_name)
+            sql = self.get_column_value_examples_sql(table_name, field_name, max_rows, source)
+            res = await self.afetch_truncated(sql, max_rows, max_str_len)
+            self.put_cached_query_result(table_name, query_key, res)
+        res = res['truncated_results']
+        return [r[0] for r in res] if res is not None else []
+
+    async def aget_table_sample(self, table_name: str, max_rows: int = 10) -> Tuple[str, str]:
+        sql = self.get_all_field_examples(table_name, max_rows=max_rows)
+        query_key = 'table_sample:{}'.format(max_rows)
+        if self._stats_invalidation == 'row_count':
+            await self.aget_table_row_count(table_name)
+        res = self.get_cached_query_result(table_name, query_key)
+        if res is None:
+            res = await self.afetch_truncated(sql, max_rows=max_rows)
+            self.put_cached_query_result(table_name, query_key, res)
+        return sql, self.trunc_result_to_markdown(res)
+
+    async def aprofile_column(self, table_name: str, field_name: str) -> Dict:
+        field_type = self._mschema.get_field_info(table_name, field_name).get('type', '')
+        values = await asyncio.gather(
+            self.aget_column_count(table_name, field_name),
+            self.aget_column_unique_count(table_name, field_name),
+            self.aget_column_agg_value(table_name, field_name, field_type, 'max'),
+            self.aget_column_agg_value(table_name, field_name, field_type, 'min'),
+            self.aget_column_agg_value(table_name, field_name, field_type, 'avg'),
+            self.aget_column_agg_char_length(table_name, field_name, 'max'),
+            self.aget_column_agg_char_length(table_name, field_name, 'min'))
+        return {"count": values[0], "unique_count": values[1], "max": self._stats_value(values[2]),
+                "min": self._stats_value(values[3]), "avg": self._stats_value(values[4]),
+                "max_len": values[5], "min_len": values[6]}
+
+    async def aprofile_table(self, table_name: str) -> Dict[str, Dict]:
+        """async profile_table: the batches of the table are profiled concurrently"""
+        field_names = list(self._mschema.tables[table_name]['fields'].keys())
+        source = await self.aget_profile_source(table_name)
+        total_rows = await self.aget_table_row_estimate(table_name) if source is not None else None
+
+        async def profile_batch(batch: List[str]) -> Dict[str, Dict]:
+            r = await self.afetch(self.get_table_profile_sql(table_name, batch, source))
+            if source is not None and r is not None and len(r) > 0 and r[0][0] == 0:
+                r = await self.afetch(self.get_table_profile_sql(table_name, batch))
+                sample_rows = None
+            else:
+                sample_rows = None if source is None or r is None or len(r) == 0 else r[0][0]
+            if r is None or len(r) == 0:
+                stats = await asyncio.gather(*[self.aprofile_column(table_name, f) for f in batch])
+                return dict(zip(batch, stats))
+            return self.parse_table_profile_row(table_name, batch, r[0], sample_rows, total_rows)
+
+        table_stats = {}
+        for batch_stats in await asyncio.gather(*[profile_batch(field_names[i: i + self._profile_batch_size])
+                                                  for i in range(0, len(field_names), self._profile_batch_size)]):
+            table_stats.update(batch_stats)
+        if self._stats_invalidation == 'row_count':
+            await self.aget_table_row_count(table_name)
+        self.store_table_stats(table_name, table_stats)
+        return table_stats
+
+    async def aget_column_stats(self, table_name: str, field_name: str) -> Dict:
+        """async get_column_stats"""
+        stats = self._mschema.get_field_info(table_name, field_name).get('stats', None)
+        if stats is None:
+            async with self.get_async_table_lock(table_name):
+                stats = self._mschema.get_field_info(table_name, field_name).get('stats', None)
+                if stats is not None:
+                    return stats
+                if self._stats_invalidation == 'row_count':
+                    await self.aget_table_row_count(table_name)
+                if self.load_cached_table_stats(table_name):
+                    return self._mschema.get_field_info(table_name, field_name).get('stats', {})
+                stats = self.checkpoint_get(STAGE_STATS, table_name, field_name, self.get_stats_fingerprint(table_name))
+                if stats is not None:
+                    self._mschema.set_column_property(table_name, field_name, 'stats', stats)
+                    return stats
+                stats = (await self.aprofile_table(table_name)).get(field_name, {})
+        return stats
+
     def get_single_field_info_str(self, table_name: str, field_name: str)->str:
         """
         某一列的相关信息：列名、类型、列描述、是否主键、最大/最小值等
@@ -341,13 +1404,14 @@ class SchemaEngine(SQLDatabase):
         field_info = self._mschema.get_field_info(table_name, field_name)
         field_type = field_info.get('type', '')
 
-        unique_num = self.get_column_unique_count(table_name, field_name)
-        total_num = self.get_column_count(table_name, field_name)
-        max_value = self.get_column_agg_value(table_name, field_name, field_type, 'max')
-        min_value = self.get_column_agg_value(table_name, field_name, field_type, 'min')
-        avg_value = self.get_column_agg_value(table_name, field_name, field_type, 'avg')
-        max_len = self.get_column_agg_char_length(table_name, field_name, 'max')
-        min_len = self.get_column_agg_char_length(table_name, field_name, 'min')
+        stats = self.get_column_stats(table_name, field_name)
+        unique_num = stats.get('unique_count', -1)
+        total_num = stats.get('count', -1)
+        max_value = stats.get('max', None)
+        min_value = stats.get('min', None)
+        avg_value = stats.get('avg', None)
+        max_len = stats.get('max_len', -1)
+        min_len = stats.get('min_len', -1)
 
         comment = field_info.get('comment', '')
         primary_key = field_info.get("primary_key", False)
@@ -365,6 +1429,8 @@ class SchemaEngine(SQLDatabase):
         field_info_str.append(f'UNIQUE: {unique}')
         field_info_str.append(f'NULLABLE: {nullable}')
         date_min_gran = field_info.get('date_min_gran', None)
+        if stats.get('approximate', False):
+            field_info_str.append(f'以下统计值为基于{stats.get("sample_rows", 0)}行随机抽样的近似估计')
         if total_num >= 0:
             field_info_str.append(f'COUNT: {total_num}')
         if unique_num >= 0:
@@ -390,47 +1456,258 @@ class SchemaEngine(SQLDatabase):
 
         return '\n'.join(field_info_str)
 
-    def fields_category(self):
-        tables = self._mschema.tables
-        for table_name in tables.keys():
-            print("Table Name: ", table_name)
-            fields = tables[table_name]['fields']
-            for field_name, field_info in fields.items():
-                print("Field Name: ", field_name)
-                field_type = field_info['type']
-                field_type_cate = self._type_engine.field_type_cate(field_type)
-                field_info_str = self.get_single_field_info_str(table_name, field_name)
+    def get_field_properties(self, table_name: str, field_name: str, res: Dict,
+                             min_gran: Optional[str] = None) -> Dict[str, Any]:
+        """M-Schema properties of a classified column, in the order they have to be set."""
+        properties = {}
+        if res['category'] == self._type_engine.field_category_date_label and \
+                min_gran in self._type_engine.date_time_min_grans:
+            properties["date_min_gran"] = min_gran
+
+        category = res['category']
+        # 对于枚举类型的字段，获取它所有的枚举候选值
+        # (always from the whole table: a sample could miss some of the values)
+        if category == self._type_engine.field_category_enum_label:
+            examples = self.get_column_value_examples(table_name, field_name, max_rows=self._max_enum_values + 1,
+                                                      exact=True)
+            # more distinct values than the cap (empty strings included): keep the first ones
+            # and mark the list as truncated
+            truncated = len(examples) > self._max_enum_values
+            examples = [s for s in examples[:self._max_enum_values] if len(str(s)) > 0]
+            properties["examples"] = examples
+            properties["examples_truncated"] = truncated
+        properties["category"] = res['category']
+        properties["dim_or_meas"] = res['dim_or_meas']
+        return properties
+
+    def is_foreign_key(self, table_name: str, field_name: str) -> bool:
+        return self._mschema.is_foreign_key(table_name, field_name)
+
+    def heuristic_classify(self, table_name: str, field_name: str) -> Optional[Dict]:
+        """
+        Rule-based classification of a column from its metadata, statistics and M-Schema examples.
+        Return None when no rule reaches heuristic_threshold and the LLM has to be asked.
+        """
+        if self._heuristic_threshold is None:
+            return None
+        field_info = self._mschema.get_field_info(table_name, field_name)
+        res, confidence = heuristic_field_category(field_info, self.get_column_stats(table_name, field_name),
+                                                   field_info.get('examples') or [], self._type_engine,
+                                                   self.is_foreign_key(table_name, field_name))
+        if res is None or confidence < self._heuristic_threshold:
+            return None
+        print("Table Name: {}, Field Name: {}, rule-based classification ({:.2f}): {}".format(
+            table_name, field_name, confidence, res))
+        return res
+
+    def classify_field(self, table_name: str, field_name: str) -> Dict[str, Any]:
+        """
+        Classify one column (category, dimension/measure, min time granularity, enum candidates).
+        Return the M-Schema properties to write back, in the order they have to be set.
+        """
+        res = self.heuristic_classify(table_name, field_name)
+        if res is not None and (res['category'] != self._type_engine.field_category_date_label or
+                                res['min_gran'] is not None):
+            return self.get_field_properties(table_name, field_name, res, res['min_gran'])
+
+        field_info = self._mschema.get_field_info(table_name, field_name)
+        field_type = field_info['type']
+        field_type_cate = self._type_engine.field_type_cate(field_type)
+        field_info_str = self.get_single_field_info_str(table_name, field_name)
+        if res is None:
+            with self.llm_slot():
                 res = field_category(field_type_cate, self._type_engine, self._llm, field_info_str=field_info_str)
-                print(field_info_str)
+            print("Table Name: {}, Field Name: {}".format(table_name, field_name))
+            print(field_info_str)
+            print(res)
+
+        min_gran = None
+        if res['category'] == self._type_engine.field_category_date_label:
+            with self.llm_slot():
+                min_gran = understand_date_time_min_gran(field_info_str, llm=self._llm)
+            print("最小时间颗粒度：", min_gran)
+        return self.get_field_properties(table_name, field_name, res, min_gran)
+
+    def classify_fields_batch(self, table_name: str, field_names: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Classify several columns of a table with one batched prompt.
+        Columns whose answer cannot be parsed, and whose min time granularity is missing,
+        fall back to the per-column prompts.
+        """
+        bool_label = self._type_engine.field_type_bool_label
+        batch = []
+        heuristic_answers = {}
+        for field_name in field_names:
+            res = self.heuristic_classify(table_name, field_name)
+            if res is not None and (res['category'] != self._type_engine.field_category_date_label or
+                                    res['min_gran'] is not None):
+                heuristic_answers[field_name] = res
+                continue
+            field_type = self._mschema.get_field_info(table_name, field_name)['type']
+            field_type_cate = self._type_engine.field_type_cate(field_type)
+            if field_type_cate != bool_label:
+                batch.append((field_name, field_type_cate, self.get_single_field_info_str(table_name, field_name)))
+        answers = []
+        if len(batch) > 0:
+            with self.llm_slot():
+                answers = batch_field_category(batch, self._type_engine, self._llm)
+        answers = {field_name: res for (field_name, _, _), res in zip(batch, answers)}
+        answers.update(heuristic_answers)
+
+        results = {}
+        for field_name in field_names:
+            res = answers.get(field_name, None)
+            if res is None or (res['category'] == self._type_engine.field_category_date_label and
+                               res['min_gran'] not in self._type_engine.date_time_min_grans):
+                # bool columns and unusable answers
+                results[field_name] = self.classify_field(table_name, field_name)
+            else:
+                print("Table Name: {}, Field Name: {}".format(table_name, field_name))
                 print(res)
-                if res['category'] == self._type_engine.field_category_date_label:
-                    min_gran = understand_date_time_min_gran(field_info_str, llm=self._llm)
-                    print("最小时间颗粒度：", min_gran)
-                    if min_gran in self._type_engine.date_time_min_grans:
-                        self._mschema.set_column_property(table_name, field_name, "date_min_gran", min_gran)
-
-                category = res['category']
-                # 对于枚举类型的字段，获取它所有的枚举候选值
-                if category == self._type_engine.field_category_enum_label:
-                    examples = self.get_column_value_examples(table_name, field_name)
-                    examples = [s for s in examples if len(str(examples)) > 0]
-                    self._mschema.set_column_property(table_name, field_name, "examples", examples)
-                self._mschema.set_column_property(table_name, field_name, "category", res['category'])
-                self._mschema.set_column_property(table_name, field_name, "dim_or_meas", res['dim_or_meas'])
-
-
-    def table_and_column_desc_generation(self, language: str='CN'):
-        """"
-        table and column description generation
+                results[field_name] = self.get_field_properties(table_name, field_name, res, res['min_gran'])
+        return results
 
-        Four modes:
-        no_comment: Without any description information
-        origin: Keeps consistent with the database
-        generation: Clears existing description information and generates entirely new descriptions using the model
-        merge: Generates descriptions for fields without descriptions; does not generate new descriptions for fields that already have them
+    def get_incremental_fingerprint(self, table_name: str) -> str:
+        """table fingerprint compared by the incremental mode, including the row count if incremental_row_count"""
+        fingerprint = self._mschema.table_fingerprint(table_name)
+        if self._incremental_row_count:
+            fingerprint += ':rows{}'.format(self.get_table_row_count(table_name))
+        return fingerprint
+
+    def apply_previous_mschema(self, previous: MSchema):
+        """
+        Compare every table with the previously generated M-Schema. Unchanged tables and columns get their
+        description, classification and statistics carried over; the changed or new ones are marked dirty.
+        """
+        self._dirty_tables = set()
+        self._dirty_columns = set()
+        for table_name in self._mschema.tables.keys():
+            fields = self._mschema.tables[table_name]['fields']
+            fingerprint = self.get_incremental_fingerprint(table_name)
+            self._mschema.set_table_property(table_name, 'fingerprint', fingerprint)
+            if not previous.has_table(table_name):
+                self._dirty_tables.add(table_name)
+                self._dirty_columns.update((table_name, field_name) for field_name in fields.keys())
+                continue
+
+            previous_fingerprint = previous.tables[table_name].get('fingerprint', None)
+            if previous_fingerprint is None:
+                previous_fingerprint = previous.table_fingerprint(table_name)
+            table_changed = previous_fingerprint != fingerprint
+            if table_changed:
+                self._dirty_tables.add(table_name)
+            else:
+                self._mschema.set_table_property(table_name, 'comment', previous.tables[table_name].get('comment', ''))
+
+            for field_name in fields.keys():
+                # a changed row count invalidates the statistics of every column
+                if previous.has_column(table_name, field_name) and \
+                        (not table_changed or not self._incremental_row_count) and \
+                        previous.column_fingerprint(table_name, field_name) == \
+                        self._mschema.column_fingerprint(table_name, field_name):
+                    previous_info = previous.get_field_info(table_name, field_name)
+                    for key in INCREMENTAL_CARRY_OVER_KEYS:
+                        if key in previous_info:
+                            self._mschema.set_column_property(table_name, field_name, key, previous_info[key])
+                else:
+                    self._dirty_tables.add(table_name)
+                    self._dirty_columns.add((table_name, field_name))
+        print("Incremental mode: {} of {} tables and {} columns changed.".format(
+            len(self._dirty_tables), len(self._mschema.tables), len(self._dirty_columns)))
+
+    def is_dirty_table(self, table_name: str) -> bool:
+        return self._dirty_tables is None or table_name in self._dirty_tables
+
+    def is_dirty_column(self, table_name: str, field_name: str) -> bool:
+        return self._dirty_columns is None or (table_name, field_name) in self._dirty_columns
+
+    def get_fields_to_classify(self, table_name: str) -> List[str]:
+        """
+        Columns of the table still to be classified: columns restored from the checkpoint journal
+        and, in incremental mode, the unchanged columns are left out.
         """
+        if not self.is_dirty_table(table_name):
+            return []
+        field_names = []
+        for field_name in self._mschema.tables[table_name]['fields'].keys():
+            if not self.is_dirty_column(table_name, field_name):
+                continue
+            # already classified by an interrupted run
+            properties = self.checkpoint_get(STAGE_CATEGORY, table_name, field_name)
+            if properties is not None:
+                for key, value in properties.items():
+                    self._mschema.set_column_property(table_name, field_name, key, value)
+                continue
+            field_names.append(field_name)
+        return field_names
+
+    def apply_classification(self, table_name: str, field_names: List[str], results: Dict[str, Dict[str, Any]]):
+        """write the classification results back to M-Schema and the checkpoint journal"""
+        for field_name in field_names:
+            for key, value in results[field_name].items():
+                self._mschema.set_column_property(table_name, field_name, key, value)
+            self.checkpoint_record(STAGE_CATEGORY, table_name, field_name, results[field_name])
+
+    def classify_table(self, table_name: str, batch_size: Optional[int] = None) -> Dict[Tuple[str, str], str]:
+        """Classify the columns of one table, batch_size columns per prompt. Return the failing columns."""
+        batch_size = max(1, batch_size if batch_size is not None else self._classify_batch_size)
+        field_names = self.get_fields_to_classify(table_name)
+        failures = {}
+        for i in range(0, len(field_names), batch_size):
+            batch = field_names[i: i + batch_size]
+            try:
+                if batch_size == 1:
+                    results = {batch[0]: self.classify_field(table_name, batch[0])}
+                else:
+                    results = self.classify_fields_batch(table_name, batch)
+            except Exception as e:
+                for field_name in batch:
+                    print("Field classification failed for {}.{}: {}".format(table_name, field_name, e))
+                    failures[(table_name, field_name)] = str(e)
+                continue
+            self.apply_classification(table_name, batch, results)
+        return failures
+
+    def fields_category(self, max_workers: Optional[int] = None,
+                        batch_size: Optional[int] = None) -> Dict[Tuple[str, str], str]:
+        """
+        Classify every column of M-Schema, running up to max_workers tasks concurrently.
+        With batch_size > 1, up to batch_size columns of the same table are classified by one prompt.
+        Results are written back in M-Schema column order; a failing column is skipped and
+        reported in the returned {(table_name, field_name): error message} dict.
+        """
+        max_workers = max_workers if max_workers is not None else self._max_workers
+        batch_size = max(1, batch_size if batch_size is not None else self._classify_batch_size)
+        tasks = []
+        for table_name in self._mschema.tables.keys():
+            field_names = self.get_fields_to_classify(table_name)
+            for i in range(0, len(field_names), batch_size):
+                tasks.append((table_name, field_names[i: i + batch_size]))
+
+        failures = {}
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = []
+            for table_name, field_names in tasks:
+                if batch_size == 1:
+                    futures.append(executor.submit(
+                        lambda t, f: {f: self.classify_field(t, f)}, table_name, field_names[0]))
+                else:
+                    futures.append(executor.submit(self.classify_fields_batch, table_name, field_names))
+            for (table_name, field_names), future in zip(tasks, futures):
+                try:
+                    results = future.result()
+                except Exception as e:
+                    for field_name in field_names:
+                        print("Field classification failed for {}.{}: {}".format(table_name, field_name, e))
+                        failures[(table_name, field_name)] = str(e)
+                    continue
+                self.apply_classification(table_name, field_names, results)
+        return failures
+
+    def prepare_comments(self) -> bool:
+        """Apply the comment mode to M-Schema. Return whether descriptions have to be generated."""
         if self.comment_mode == 'origin':
-            return
+            return False
         elif self.comment_mode == 'merge':
             pass
         elif self.comment_mode == 'generation':
@@ -439,66 +1716,261 @@ class SchemaEngine(SQLDatabase):
         elif self.comment_mode == 'no_comment':
             self._mschema.erase_all_column_comment()
             self._mschema.erase_all_table_comment()
-            return
+            return False
+        elif self.comment_mode == 'incremental':
+            for table_name in self._dirty_tables:
+                self._mschema.set_table_property(table_name, 'comment', '')
+            for table_name, field_name in self._dirty_columns:
+                self._mschema.set_column_property(table_name, field_name, 'comment', '')
+            if len(self._dirty_tables) == 0:
+                return False
         else:
             raise NotImplementedError(f"Unsupported comment mode {self.comment_mode}.")
-
-        db_mschema = self._mschema.to_mschema()
-        """1、初步理解数据库的基本信息和每张表的内容"""
-        db_info = understand_database(db_mschema, self._llm)
+        return True
+
+    def get_understanding_token_budget(self) -> int:
+        """tokens of M-Schema that fit in one database understanding prompt"""
+        if self._understand_token_budget is not None:
+            return self._understand_token_budget
+        metadata = self._llm.metadata
+        # room for the prompt template and a margin for the rough token estimate
+        budget = int((metadata.context_window - metadata.num_output) * 0.8) - 200
+        return max(budget, 256)
+
+    def get_table_groups(self) -> List[List[str]]:
+        """
+        groups of tables related by foreign keys (connected components), in M-Schema order
+        """
+        graph = nx.Graph()
+        table_names = list(self._mschema.tables.keys())
+        graph.add_nodes_from(table_names)
+        for table_name, _, ref_schema, ref_table_name, _ in self._mschema.foreign_keys:
+            if ref_schema == self._mschema.schema and table_name in graph and ref_table_name in graph:
+                graph.add_edge(table_name, ref_table_name)
+        order = {table_name: i for i, table_name in enumerate(table_names)}
+        groups = [sorted(component, key=order.get) for component in nx.connected_components(graph)]
+        return sorted(groups, key=lambda group: order[group[0]])
+
+    def get_db_mschema_chunks(self, token_budget: int) -> List[str]:
+        """
+        M-Schema split into chunks of at most token_budget tokens: groups of related tables are packed together,
+        a group larger than the budget is split table by table (a single table larger than the budget is its own chunk).
+        """
+        table_tokens = {table_name: estimate_tokens(self._mschema.to_mschema(selected_tables=[table_name]))
+                        for table_name in self._mschema.tables.keys()}
+        chunks, chunk, chunk_tokens = [], [], 0
+        for group in self.get_table_groups():
+            group_tokens = sum(table_tokens[table_name] for table_name in group)
+            # keep a group in one chunk when it fits
+            units = [group] if group_tokens <= token_budget else [[table_name] for table_name in group]
+            for unit in units:
+                unit_tokens = sum(table_tokens[table_name] for table_name in unit)
+                if len(chunk) > 0 and chunk_tokens + unit_tokens > token_budget:
+                    chunks.append(chunk)
+                    chunk, chunk_tokens = [], 0
+                chunk += unit
+                chunk_tokens += unit_tokens
+        if len(chunk) > 0:
+            chunks.append(chunk)
+        return [self._mschema.to_mschema(selected_tables=chunk) for chunk in chunks]
+
+    def understand_database_chunked(self, token_budget: int) -> str:
+        """map-reduce database understanding: chunks are summarized by up to max_workers threads, then merged"""
+        db_mschema_chunks = self.get_db_mschema_chunks(token_budget)
+        print("Database understanding over {} chunks".format(len(db_mschema_chunks)))
+
+        def summarize(db_mschema_chunk: str) -> str:
+            with self.llm_slot():
+                return understand_database_chunk(db_mschema_chunk, self._llm)
+
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            summaries = list(executor.map(summarize, db_mschema_chunks))
+        with self.llm_slot():
+            return understand_database_from_summaries(summaries, self._llm, token_budget)
+
+    def get_db_info(self) -> str:
+        """overall understanding of the database, restored from the checkpoint journal if recorded"""
+        db_info = self.checkpoint_get(STAGE_DB_INFO, None)
+        if db_info is None:
+            db_mschema = self._mschema.to_mschema()
+            token_budget = self.get_understanding_token_budget() \
+                if self._understand_database_mode != 'single' else None
+            if self._understand_database_mode == 'chunked' or \
+                    (token_budget is not None and estimate_tokens(db_mschema) > token_budget):
+                db_info = self.understand_database_chunked(token_budget)
+            else:
+                with self.llm_slot():
+                    db_info = understand_database(db_mschema, self._llm)
+            self.checkpoint_record(STAGE_DB_INFO, None, None, db_info)
         self._mschema.db_info = db_info
         print("DB INFO: ", db_info)
+        return db_info
 
-        for table_name, table_info in self._mschema.tables.items():
-            fields = table_info['fields']
-            table_comment = table_info.get('comment', '')
-            if len(table_comment) >= 10:
-                need_table_comment = False
-            else:
-                need_table_comment = True
+    def table_and_column_desc_generation(self, language: str='CN', table_workers: Optional[int] = None,
+                                         column_workers: Optional[int] = None) -> Dict[Tuple[str, Optional[str]], str]:
+        """"
+        table and column description generation
+
+        Tables are processed by up to table_workers threads, and inside a table the column descriptions
+        by up to column_workers threads (both default to max_workers). LLM calls and DB queries in flight
+        are further bounded by max_llm_calls and max_db_connections.
+        Return the tables ((table_name, None)) and columns whose description generation failed.
 
-            table_mschema = self._mschema.single_table_mschema(table_name)
+        Five modes:
+        no_comment: Without any description information
+        origin: Keeps consistent with the database
+        generation: Clears existing description information and generates entirely new descriptions using the model
+        merge: Generates descriptions for fields without descriptions; does not generate new descriptions for fields that already have them
+        incremental: Keeps the descriptions of the tables and columns unchanged since the previous M-Schema; regenerates the changed ones
+        """
+        if not self.prepare_comments():
+            return {}
 
-            sql = self.get_all_field_examples(table_name, max_rows=10)
-            res = self.fetch_truncated(sql, max_rows=10)
-            res = self.trunc_result_to_markdown(res)
+        max_workers = self._max_workers
+        table_workers = table_workers if table_workers is not None else max_workers
+        column_workers = column_workers if column_workers is not None else max_workers
 
-            """2、按照维度和度量分类，理解各个维度/度量字段之间的区别与联系，供参考"""
-            supp_info = {}
-            dim_fields = self._mschema.get_dim_or_meas_fields(self._type_engine.dimension_label, table_name)
-            mea_fields = self._mschema.get_dim_or_meas_fields(self._type_engine.measure_label, table_name)
-            if len(dim_fields) > 0:
+        """1、初步理解数据库的基本信息和每张表的内容"""
+        db_info = self.get_db_info()
+
+        failures = {}
+        table_names = [table_name for table_name in self._mschema.tables.keys() if self.is_dirty_table(table_name)]
+        with ThreadPoolExecutor(max_workers=max(1, table_workers)) as executor:
+            futures = [executor.submit(self.describe_table, table_name, db_info, language, column_workers)
+                       for table_name in table_names]
+            for table_name, future in zip(table_names, futures):
+                try:
+                    failures.update(future.result())
+                except Exception as e:
+                    print("Description generation failed for table {}: {}".format(table_name, e))
+                    failures[(table_name, None)] = str(e)
+        return failures
+
+    def get_table_sample(self, table_name: str, max_rows: int = 10) -> Tuple[str, str]:
+        """sample rows of the table: the SQL used and its result as a markdown table"""
+        sql = self.get_all_field_examples(table_name, max_rows=max_rows)
+        query_key = 'table_sample:{}'.format(max_rows)
+        res = self.get_cached_query_result(table_name, query_key)
+        if res is None:
+            res = self.fetch_truncated(sql, max_rows=max_rows)
+            self.put_cached_query_result(table_name, query_key, res)
+        res = self.trunc_result_to_markdown(res)
+        return sql, res
+
+    def understand_table(self, table_name: str, db_info: str, table_mschema: str, sql: str, res: str) -> Dict[str, str]:
+        """按照维度和度量分类，理解各个维度/度量字段之间的区别与联系，供参考"""
+        supp_info = {}
+        dim_fields = self._mschema.get_dim_or_meas_fields(self._type_engine.dimension_label, table_name)
+        mea_fields = self._mschema.get_dim_or_meas_fields(self._type_engine.measure_label, table_name)
+        if len(dim_fields) > 0:
+            with self.llm_slot():
                 supp_info[self._type_engine.dimension_label] = understand_fields_by_category(db_info, table_name,
                     table_mschema, self._llm, sql, res, dim_fields, self._type_engine.dimension_label)
-            if len(mea_fields) > 0:
+        if len(mea_fields) > 0:
+            with self.llm_slot():
                 supp_info[self._type_engine.measure_label] = understand_fields_by_category(db_info, table_name,
                     table_mschema, self._llm, sql, res, mea_fields, self._type_engine.measure_label)
-            print("Supplementary information：")
-            print(supp_info)
-
-            """3、对每一列生成列描述"""
-            for field_name, field_info in fields.items():
-                field_info_str = self.get_single_field_info_str(table_name, field_name)
-                dim_or_meas = field_info.get("dim_or_meas", '')
-                field_desc = field_info.get('comment', '')
-                if len(field_desc) == 0:  # 原来没有字段描述，重新生成
-                    field_desc = generate_column_desc(field_name, field_info_str, table_mschema,
-                                                      self._llm, sql, res, supp_info.get(dim_or_meas, ""),
-                                                      language=language)
-                    print("Table Name: {}, Field Name: {}".format(table_name, field_name))
-                    print("Column Description: {}".format(field_desc))
-                    self._mschema.set_column_property(table_name, field_name, 'comment', field_desc)
-
-            """4、表描述生成"""
-            table_mschema = self._mschema.single_table_mschema(table_name)
-            if need_table_comment:
+        print("Supplementary information：")
+        print(supp_info)
+        return supp_info
+
+    def get_table_understanding(self, table_name: str, db_info: str,
+                                table_mschema: str) -> Tuple[str, str, Dict[str, str]]:
+        """
+        Sample rows of the table (SQL and markdown result) and its supplementary dimension/measure information,
+        restored from the checkpoint journal if recorded. The result is kept until describe_table uses it,
+        so that SchemaPipeline can understand a table in an earlier stage than the one describing it.
+        """
+        sql, res = self.get_table_sample(table_name)
+        supp_info = self._supp_infos.get(table_name)
+        if supp_info is None:
+            supp_info = self.checkpoint_get(STAGE_SUPP_INFO, table_name)
+        if supp_info is None:
+            supp_info = self.understand_table(table_name, db_info, table_mschema, sql, res)
+            self.checkpoint_record(STAGE_SUPP_INFO, table_name, None, supp_info)
+        self._supp_infos[table_name] = supp_info
+        return sql, res, supp_info
+
+    def describe_column(self, table_name: str, field_name: str, table_mschema: str, sql: str, res: str,
+                        supp_info: Dict[str, str], language: str = 'CN') -> str:
+        """generate the description of a column that has none"""
+        field_info = self._mschema.get_field_info(table_name, field_name)
+        field_info_str = self.get_single_field_info_str(table_name, field_name)
+        dim_or_meas = field_info.get("dim_or_meas", '')
+        with self.llm_slot():
+            field_desc = generate_column_desc(field_name, field_info_str, table_mschema,
+                                              self._llm, sql, res, supp_info.get(dim_or_meas, ""),
+                                              language=language)
+        print("Table Name: {}, Field Name: {}".format(table_name, field_name))
+        print("Column Description: {}".format(field_desc))
+        return field_desc
+
+    def describe_table(self, table_name: str, db_info: str, language: str = 'CN',
+                       column_workers: int = 1) -> Dict[Tuple[str, Optional[str]], str]:
+        """
+        Generate the missing column descriptions (up to column_workers concurrently) and the table description.
+        Stages already recorded in the checkpoint journal are restored instead of generated again.
+        Return the columns whose description generation failed.
+        """
+        table_info = self._mschema.tables[table_name]
+        fields = table_info['fields']
+        table_comment = table_info.get('comment', '')
+        if len(table_comment) >= 10:
+            need_table_comment = False
+        else:
+            need_table_comment = True
+
+        table_mschema = self._mschema.single_table_mschema(table_name)
+        # only the columns still waiting for a description are restored: the others keep their comment
+        for field_name, field_info in fields.items():
+            if len(field_info.get('comment', '')) > 0 or not self.is_dirty_column(table_name, field_name):
+                continue
+            field_desc = self.checkpoint_get(STAGE_COLUMN_DESC, table_name, field_name)
+            if field_desc is not None:
+                self._mschema.set_column_property(table_name, field_name, 'comment', field_desc)
+        table_desc = self.checkpoint_get(STAGE_TABLE_DESC, table_name)
+        if table_desc is not None:
+            # the table description is the last stage: the table was completed by a previous run
+            self._mschema.set_table_property(table_name, 'comment', table_desc)
+            return {}
+
+        """2、按照维度和度量分类，理解各个维度/度量字段之间的区别与联系，供参考"""
+        sql, res, supp_info = self.get_table_understanding(table_name, db_info, table_mschema)
+        self._supp_infos.pop(table_name, None)
+
+        """3、对每一列生成列描述"""
+        failures = {}
+        # 原来没有字段描述，重新生成
+        field_names = [field_name for field_name, field_info in fields.items()
+                       if len(field_info.get('comment', '')) == 0]
+        with ThreadPoolExecutor(max_workers=max(1, column_workers)) as executor:
+            futures = [executor.submit(self.describe_column, table_name, field_name, table_mschema,
+                                       sql, res, supp_info, language) for field_name in field_names]
+            for field_name, future in zip(field_names, futures):
+                try:
+                    field_desc = future.result()
+                except Exception as e:
+                    print("Description generation failed for {}.{}: {}".format(table_name, field_name, e))
+                    failures[(table_name, field_name)] = str(e)
+                    continue
+                self._mschema.set_column_property(table_name, field_name, 'comment', field_desc)
+                self.checkpoint_record(STAGE_COLUMN_DESC, table_name, field_name, field_desc)
+
+        """4、表描述生成"""
+        table_mschema = self._mschema.single_table_mschema(table_name)
+        if need_table_comment:
+            with self.llm_slot():
                 table_desc = generate_table_desc(table_name, table_mschema, self._llm, sql, res, language=language)
-                print("Table Description: {}".format(table_desc))
-                self._mschema.set_table_property(table_name, 'comment', table_desc)
+            print("Table Description: {}".format(table_desc))
+            self._mschema.set_table_property(table_name, 'comment', table_desc)
+        if len(failures) == 0:
+            self.checkpoint_record(STAGE_TABLE_DESC, table_name, None, self._mschema.tables[table_name].get('comment', ''))
+        return failures
 
     def sql_generator(self, question: str, evidence: str = '') -> str:
         db_mschema = self._mschema.to_mschema()
-        pred_sql = dummy_sql_generator(self._dialect, db_mschema=db_mschema,
-            question=question, evidence=evidence, llm=self._llm)
+        with self.llm_slot():
+            pred_sql = dummy_sql_generator(self._dialect, db_mschema=db_mschema,
+                question=question, evidence=evidence, llm=self._llm)
 
         return pred_sql
\ No newline at end of file
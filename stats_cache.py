@@ -0,0 +1,197 @@
+# Funzione: Cache delle statistiche delle colonne calcolate da SchemaEngine.
+# Le statistiche sono indicizzate per (db, schema, tabella, colonna) e tenute in memoria;
+# opzionalmente vengono salvate anche in un file sqlite, così che una nuova esecuzione
+# su un database invariato non debba ripetere le query di profilazione.
+# Con la stessa validazione vengono salvati anche i risultati delle query di campionamento
+# (valori di esempio delle colonne e righe di esempio delle tabelle).
+
+import datetime
+import decimal
+import json
+import sqlite3
+import threading
+import logging
+from typing import Any, Dict, Optional, Tuple
+from utils import json_default
+
+# chiave che marca, nel JSON dei risultati delle query, un valore di un tipo Python non nativo di JSON
+TYPE_KEY = '__type__'
+
+
+def encode_result(value: Any) -> Any:
+    """
+    Valore JSON di un risultato di query che conserva i tipi Python restituiti dai driver (tuple delle righe,
+    date, Decimal...), che finiscono nei prompt così come sono; gli altri tipi passano per json_default.
+    """
+    if isinstance(value, dict):
+        return {key: encode_result(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [encode_result(item) for item in value]
+    if isinstance(value, tuple):
+        return {TYPE_KEY: 'tuple', 'value': [encode_result(item) for item in value]}
+    # datetime prima di date, di cui è sottoclasse
+    if isinstance(value, datetime.datetime):
+        return {TYPE_KEY: 'datetime', 'value': value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {TYPE_KEY: 'date', 'value': value.isoformat()}
+    if isinstance(value, datetime.time):
+        return {TYPE_KEY: 'time', 'value': value.isoformat()}
+    if isinstance(value, datetime.timedelta):
+        return {TYPE_KEY: 'timedelta', 'value': value.total_seconds()}
+    if isinstance(value, decimal.Decimal):
+        return {TYPE_KEY: 'decimal', 'value': str(value)}
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {TYPE_KEY: 'bytes', 'value': bytes(value).hex()}
+    return value
+
+
+def decode_result(value: Dict) -> Any:
+    """object_hook di json.loads inverso di encode_result"""
+    decoders = {
+        'tuple': tuple,
+        'datetime': datetime.datetime.fromisoformat,
+        'date': datetime.date.fromisoformat,
+        'time': datetime.time.fromisoformat,
+        'timedelta': lambda seconds: datetime.timedelta(seconds=seconds),
+        'decimal': decimal.Decimal,
+        'bytes': bytes.fromhex,
+    }
+    if len(value) == 2 and value.get(TYPE_KEY) in decoders and 'value' in value:
+        return decoders[value[TYPE_KEY]](value['value'])
+    return value
+
+
+class StatsCache:
+    """Cache delle statistiche delle colonne, in memoria e opzionalmente su file sqlite."""
+
+    def __init__(self, cache_path: Optional[str] = None):
+        self._memory = {}
+        self._results = {}
+        self._lock = threading.Lock()
+        self._conn = None
+        if cache_path is not None:
+            self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS column_stats ("
+                "db TEXT, schema_name TEXT, table_name TEXT, column_name TEXT, "
+                "fingerprint TEXT, row_count INTEGER, stats TEXT, "
+                "PRIMARY KEY (db, schema_name, table_name, column_name))"
+            )
+            # i risultati delle query sono salvati in JSON con i tipi Python dei valori (encode_result):
+            # un file di cache non può eseguire codice alla lettura
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS query_results ("
+                "db TEXT, schema_name TEXT, table_name TEXT, query TEXT, "
+                "fingerprint TEXT, row_count INTEGER, result TEXT, "
+                "PRIMARY KEY (db, schema_name, table_name, query))"
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(db: Optional[str], schema: Optional[str], table_name: str, field_name: str) -> Tuple:
+        """db identifica il database (SchemaEngine usa l'URL dell'engine senza password)"""
+        return (db or '', schema or '', table_name, field_name)
+
+    def get(self, key: Tuple, fingerprint: str, row_count: Optional[int] = None) -> Optional[Dict]:
+        """
+        Restituisce le statistiche in cache, oppure None se mancano o non sono più valide.
+        Una voce è valida se il fingerprint dello schema coincide e, quando row_count è fornito,
+        anche il numero di righe della tabella coincide.
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None and self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT fingerprint, row_count, stats FROM column_stats "
+                    "WHERE db = ? AND schema_name = ? AND table_name = ? AND column_name = ?", key
+                ).fetchone()
+                if row is not None:
+                    entry = {"fingerprint": row[0], "row_count": row[1], "stats": json.loads(row[2])}
+                    self._memory[key] = entry
+
+        if entry is None or entry["fingerprint"] != fingerprint:
+            return None
+        if row_count is not None and entry["row_count"] != row_count:
+            return None
+        return entry["stats"]
+
+    def put_many(self, items: Dict[Tuple, Dict], fingerprint: str, row_count: Optional[int] = None):
+        """Salva le statistiche di più colonne (di solito un'intera tabella) in una sola transazione."""
+        with self._lock:
+            for key, stats in items.items():
+                self._memory[key] = {"fingerprint": fingerprint, "row_count": row_count, "stats": stats}
+            if self._conn is not None:
+                try:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO column_stats VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        [(*key, fingerprint, row_count, json.dumps(stats, ensure_ascii=False))
+                         for key, stats in items.items()]
+                    )
+                    self._conn.commit()
+                except Exception as e:
+                    logging.error(f"Errore nel salvataggio della cache delle statistiche: {str(e)}")
+
+    def put(self, key: Tuple, stats: Dict, fingerprint: str, row_count: Optional[int] = None):
+        self.put_many({key: stats}, fingerprint, row_count)
+
+    def get_result(self, key: Tuple, fingerprint: str, row_count: Optional[int] = None) -> Optional[Any]:
+        """
+        Restituisce il risultato in cache di una query di campionamento, indicizzato per
+        (db, schema, tabella, query), con la stessa validazione delle statistiche.
+        """
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is None and self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT fingerprint, row_count, result FROM query_results "
+                    "WHERE db = ? AND schema_name = ? AND table_name = ? AND query = ?", key
+                ).fetchone()
+                if row is not None:
+                    try:
+                        entry = {"fingerprint": row[0], "row_count": row[1],
+                                 "result": json.loads(row[2], object_hook=decode_result)}
+                    except Exception as e:
+                        logging.warning(f"Risultato in cache non leggibile ignorato: {str(e)}")
+                        return None
+                    self._results[key] = entry
+
+        if entry is None or entry["fingerprint"] != fingerprint:
+            return None
+        if row_count is not None and entry["row_count"] != row_count:
+            return None
+        return entry["result"]
+
+    def put_result(self, key: Tuple, result: Any, fingerprint: str, row_count: Optional[int] = None):
+        """Salva il risultato di una query di campionamento."""
+        with self._lock:
+            self._results[key] = {"fingerprint": fingerprint, "row_count": row_count, "result": result}
+            if self._conn is not None:
+                try:
+                    self._conn.execute("INSERT OR REPLACE INTO query_results VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                       (*key, fingerprint, row_count,
+                                        json.dumps(encode_result(result), ensure_ascii=False, default=json_default)))
+                    self._conn.commit()
+                except Exception as e:
+                    logging.error(f"Errore nel salvataggio della cache delle query: {str(e)}")
+
+    def invalidate(self, db: Optional[str], schema: Optional[str], table_name: Optional[str] = None):
+        """Rimuove le voci di un database, o di una sola tabella se table_name è fornito."""
+        prefix = (db or '', schema or '') if table_name is None else (db or '', schema or '', table_name)
+        with self._lock:
+            for entries in [self._memory, self._results]:
+                for key in [k for k in entries.keys() if k[:len(prefix)] == prefix]:
+                    del entries[key]
+            if self._conn is not None:
+                for table in ['column_stats', 'query_results']:
+                    if table_name is None:
+                        self._conn.execute(f"DELETE FROM {table} WHERE db = ? AND schema_name = ?", prefix)
+                    else:
+                        self._conn.execute(f"DELETE FROM {table} WHERE db = ? AND schema_name = ? "
+                                           "AND table_name = ?", prefix)
+                self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,124 @@
+"""Test del journal dei checkpoint e della sua ripresa da parte di SchemaEngine."""
+import json
+from checkpoint_manager import CheckpointManager, STAGE_COLUMN_DESC, STAGE_STATS, STAGE_TABLE_DESC
+from schema_engine import SchemaEngine
+from stats_cache import StatsCache
+from test_schema_engine import FakeLLM, QueryCounter, make_engine
+
+
+def descriptions(mschema):
+    """commenti e categorie di tutte le tabelle e colonne"""
+    return {table_name: (table['comment'], {field_name: (field_info['comment'], field_info['category'])
+                                            for field_name, field_info in table['fields'].items()})
+            for table_name, table in mschema.tables.items()}
+
+
+def test_journal_reload(tmp_path):
+    """Il journal riletto restituisce i risultati registrati; una riga finale incompleta viene ignorata."""
+    checkpoint = CheckpointManager(str(tmp_path / 'checkpoints'))
+    checkpoint.record(STAGE_STATS, 'products', 'name', {'count': 1})
+    checkpoint.record(STAGE_TABLE_DESC, 'products', None, 'desc')
+    checkpoint.close()
+    with open(checkpoint.journal_file, 'a', encoding='utf-8') as f:
+        f.write('{"stage": "stats", "tab')
+
+    checkpoint = CheckpointManager(str(tmp_path / 'checkpoints'))
+    assert checkpoint.get(STAGE_STATS, 'products', 'name') == {'count': 1}
+    assert checkpoint.get(STAGE_TABLE_DESC, 'products') == 'desc'
+    checkpoint.record(STAGE_STATS, 'orders', 'id', {'count': 2})
+    assert CheckpointManager(str(tmp_path / 'checkpoints')).get(STAGE_STATS, 'orders', 'id') == {'count': 2}
+
+
+def test_journal_scope_and_fingerprint(tmp_path):
+    """Le righe di un altro database o di una tabella con un'altra impronta vengono scartate."""
+    checkpoint = CheckpointManager(str(tmp_path / 'checkpoints'), scope='db1/')
+    checkpoint.record(STAGE_TABLE_DESC, 'products', None, 'desc', fingerprint='f1')
+    checkpoint.close()
+
+    assert CheckpointManager(str(tmp_path / 'checkpoints'), scope='db2/').get(STAGE_TABLE_DESC, 'products') is None
+    checkpoint = CheckpointManager(str(tmp_path / 'checkpoints'), scope='db1/')
+    assert checkpoint.get(STAGE_TABLE_DESC, 'products', fingerprint='f1') == 'desc'
+    assert checkpoint.get(STAGE_TABLE_DESC, 'products', fingerprint='f2') is None
+    # la lettura non modifica il journal: la riga resta finché record() non la sovrascrive
+    assert checkpoint.get(STAGE_TABLE_DESC, 'products', fingerprint='f1') == 'desc'
+    checkpoint.record(STAGE_TABLE_DESC, 'products', None, 'new desc', fingerprint='f2')
+    assert checkpoint.get(STAGE_TABLE_DESC, 'products', fingerprint='f1') is None
+    assert checkpoint.get(STAGE_TABLE_DESC, 'products', fingerprint='f2') == 'new desc'
+
+    checkpoint.clear()
+    assert not checkpoint.journal_file.exists()
+    assert CheckpointManager(str(tmp_path / 'checkpoints'), scope='db1/').get_stage_progress() == {}
+
+
+def test_legacy_checkpoint_migration(tmp_path):
+    """Le righe migrate dal vecchio checkpoint JSON restano valide dopo set_scope."""
+    checkpoint_dir = tmp_path / 'checkpoints'
+    checkpoint_dir.mkdir()
+    with open(checkpoint_dir / 'analysis_checkpoint.json', 'w', encoding='utf-8') as f:
+        json.dump({'products': {'name': {'type': 'TEXT', 'info': 'info'}}}, f)
+
+    checkpoint = CheckpointManager(str(checkpoint_dir))
+    checkpoint.set_scope('db1/')
+    assert checkpoint.is_field_processed('products', 'name')
+    checkpoint.close()
+    assert CheckpointManager(str(checkpoint_dir), scope='db2/').is_field_processed('products', 'name')
+
+
+def test_resume_description_generation(tmp_path):
+    """Una nuova esecuzione riprende le descrizioni dal journal senza richiamare l'LLM."""
+    engine = make_engine(tmp_path)
+    checkpoint_dir = str(tmp_path / 'checkpoints')
+    se = SchemaEngine(engine, db_name='test', llm=FakeLLM(), comment_mode='generation',
+                      checkpoint=CheckpointManager(checkpoint_dir))
+    se.fields_category()
+    assert se.table_and_column_desc_generation(language='EN') == {}
+    expected = descriptions(se.mschema)
+
+    llm = FakeLLM()
+    se = SchemaEngine(engine, db_name='test', llm=llm, comment_mode='generation',
+                      checkpoint=CheckpointManager(checkpoint_dir))
+    se.fields_category()
+    assert se.table_and_column_desc_generation(language='EN') == {}
+    assert descriptions(se.mschema) == expected
+    assert llm.prompts == []
+
+
+def test_resume_after_schema_change(tmp_path):
+    """Le descrizioni registrate per una tabella poi modificata vengono rigenerate."""
+    engine = make_engine(tmp_path)
+    checkpoint_dir = str(tmp_path / 'checkpoints')
+    se = SchemaEngine(engine, db_name='test', llm=FakeLLM(), comment_mode='generation',
+                      checkpoint=CheckpointManager(checkpoint_dir))
+    se.fields_category()
+    se.table_and_column_desc_generation(language='EN')
+    products_comment = se.mschema.tables['products']['comment']
+
+    with engine.begin() as connection:
+        connection.exec_driver_sql('alter table orders add column notes text')
+    llm = FakeLLM()
+    se = SchemaEngine(engine, db_name='test', llm=llm, comment_mode='generation',
+                      checkpoint=CheckpointManager(checkpoint_dir))
+    se.fields_category()
+    se.table_and_column_desc_generation(language='EN')
+    assert se.mschema.tables['products']['comment'] == products_comment
+    assert se.mschema.get_field_info('orders', 'notes')['category'] != ''
+    assert se.mschema.get_field_info('orders', 'notes')['comment'].startswith('column-')
+    assert any('notes' in prompt for prompt in llm.prompts)
+
+
+def test_stats_cache_before_journal(tmp_path):
+    """Le statistiche del journal non scavalcano l'invalidazione della cache per numero di righe."""
+    engine = make_engine(tmp_path)
+    checkpoint_dir = str(tmp_path / 'checkpoints')
+    cache_path = str(tmp_path / 'stats.sqlite')
+    se = SchemaEngine(engine, db_name='test', checkpoint=CheckpointManager(checkpoint_dir),
+                      stats_cache=StatsCache(cache_path), stats_invalidation='row_count')
+    assert se.get_column_stats('products', 'name')['count'] == 50
+
+    with engine.begin() as connection:
+        connection.exec_driver_sql("insert into products (id, name) values (1000, 'new')")
+    se = SchemaEngine(engine, db_name='test', checkpoint=CheckpointManager(checkpoint_dir),
+                      stats_cache=StatsCache(cache_path), stats_invalidation='row_count')
+    counter = QueryCounter(engine)
+    assert se.get_column_stats('products', 'name')['count'] == 51
+    assert counter.count('count(distinct') == 1
@@ -0,0 +1,62 @@
+"""Test delle funzioni di components.py con un LLM deterministico."""
+from type_engine import TypeEngine
+from utils import estimate_tokens, truncate_to_tokens
+from components import batch_field_category, merge_database_summaries, parse_json_list_from_llm_response
+from test_schema_engine import FakeLLM
+
+
+def test_parse_json_list():
+    assert parse_json_list_from_llm_response('```json\n[{"a": 1}]\n```') == [{"a": 1}]
+    assert parse_json_list_from_llm_response('answer: [1, 2]') == [1, 2]
+    assert parse_json_list_from_llm_response('no list here') is None
+    assert parse_json_list_from_llm_response('[not json]') is None
+
+
+def test_batch_field_category():
+    """Una sola chiamata per più colonne; le risposte non ammesse per il tipo restano None."""
+    type_engine = TypeEngine()
+    llm = FakeLLM()
+    fields = [('name', type_engine.field_type_string_label, 'info'),
+              ('price', type_engine.field_type_number_label, 'info')]
+    results = batch_field_category(fields, type_engine, llm)
+    assert len(llm.prompts) == 1
+    assert results == [{"category": 'Code', "dim_or_meas": 'Dimension', "min_gran": None}] * 2
+
+
+def test_batch_field_category_invalid_answers():
+    type_engine = TypeEngine()
+
+    class MeasureLLM(FakeLLM):
+        def answer(self, prompt: str) -> str:
+            return '[{"field_name": "name", "category": "measure"}, {"field_name": "created_at", "min_gran": "day"}]'
+
+    fields = [('name', type_engine.field_type_string_label, 'info'),
+              ('created_at', type_engine.field_type_date_label, 'info'),
+              ('missing', type_engine.field_type_number_label, 'info')]
+    results = batch_field_category(fields, type_engine, MeasureLLM())
+    # measure non è ammesso per una stringa, la colonna mancante non ha risposta
+    assert results[0] is None and results[2] is None
+    assert results[1] == {"category": 'DateTime', "dim_or_meas": 'Dimension', "min_gran": 'DAY'}
+
+
+def test_estimate_tokens():
+    assert estimate_tokens('a' * 400) == 101
+    # i caratteri non ASCII contano almeno un token ciascuno
+    assert estimate_tokens('数据库' * 100) >= 300
+    text = 'abc 数据库 ' * 50
+    assert estimate_tokens(truncate_to_tokens(text, 40)) <= 40
+    assert truncate_to_tokens(text, estimate_tokens(text)) == text
+
+
+def test_merge_database_summaries_long_summaries():
+    """Riassunti più lunghi di metà budget vengono tagliati e fusi a coppie, senza ricorsione infinita."""
+    llm = FakeLLM()
+    merged = merge_database_summaries(['a' * 1200, 'b' * 1200], llm, token_budget=256)
+    assert merged.startswith('info-')
+    assert len(llm.prompts) == 1
+
+    llm = FakeLLM()
+    merge_database_summaries(['数据库' * 400 for _ in range(5)], llm, token_budget=256)
+    # due coppie fuse nel primo giro, poi i due risultati con il quinto riassunto
+    assert len(llm.prompts) == 3
+    assert merge_database_summaries(['only one'], FakeLLM(), token_budget=1) == 'only one'
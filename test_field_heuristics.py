@@ -0,0 +1,64 @@
+"""Test della classificazione delle colonne basata su regole."""
+from type_engine import TypeEngine
+from field_heuristics import heuristic_field_category, match_date_time_examples
+from schema_engine import SchemaEngine
+from test_schema_engine import FakeLLM, make_engine
+
+te = TypeEngine()
+
+
+def classify(field_info, stats=None, examples=None, is_foreign_key=False):
+    res, confidence = heuristic_field_category(field_info, stats or {}, examples or [], te, is_foreign_key)
+    return (res['category'] if res is not None else None), confidence
+
+
+def test_match_date_time_examples():
+    assert match_date_time_examples(['2020-01-01 10:00:00', '2021-12-31T23:59:59']) == 'SECOND'
+    assert match_date_time_examples(['2020-01-01', '2020/02/03']) is None
+    assert match_date_time_examples(['2020-01', '2020-12']) == 'MONTH'
+    assert match_date_time_examples(['2020-13-01']) is None
+    assert match_date_time_examples([None, '']) is None
+
+
+def test_keys_and_constants():
+    assert classify({'type': 'INTEGER', 'autoincrement': True}) == ('Code', 0.95)
+    assert classify({'type': 'VARCHAR(10)', 'primary_key': True, 'unique': True}) == ('Code', 0.95)
+    assert classify({'type': 'INTEGER'}, is_foreign_key=True) == ('Code', 0.9)
+    assert classify({'type': 'VARCHAR(10)'}, {'count': 10, 'unique_count': 1}) == ('Enum', 0.9)
+    assert classify({'type': 'TEXT'}, {'count': 10, 'unique_count': 10}, ['2020-01-01']) == ('DateTime', 0.9)
+
+
+def test_statistical_rules():
+    assert classify({'type': 'VARCHAR(10)'}, {'count': 1000, 'unique_count': 5, 'max_len': 8}) == ('Enum', 0.85)
+    assert classify({'type': 'TEXT'}, {'count': 10, 'unique_count': 9, 'max_len': 500}) == ('Text', 0.85)
+    assert classify({'type': 'REAL'}, {'count': 10, 'unique_count': 9}) == ('Measure', 0.85)
+    # gli interi non sono misure per sola cardinalità, e le colonne native date/bool sono lasciate all'LLM
+    assert classify({'type': 'INTEGER'}, {'count': 10, 'unique_count': 9}) == (None, 0.0)
+    assert classify({'type': 'TIMESTAMP'}, {'count': 10, 'unique_count': 1}) == (None, 0.0)
+    assert classify({'type': 'BOOLEAN'}, {'count': 10, 'unique_count': 1}) == (None, 0.0)
+
+
+def test_heuristic_threshold(tmp_path):
+    """Le regole sono usate solo se heuristic_threshold è impostata, e solo quelle abbastanza sicure."""
+    engine = make_engine(tmp_path)
+    assert SchemaEngine(engine, db_name='test').heuristic_classify('products', 'id') is None
+
+    se = SchemaEngine(engine, db_name='test', heuristic_threshold=0.9)
+    assert se.heuristic_classify('products', 'id')['category'] == 'Code'
+    assert se.heuristic_classify('products', 'price') is None
+    se = SchemaEngine(engine, db_name='test', heuristic_threshold=0.85)
+    assert se.heuristic_classify('products', 'price')['category'] == 'Measure'
+
+
+def test_heuristic_skips_llm(tmp_path):
+    """Le colonne classificate dalle regole non generano prompt."""
+    engine = make_engine(tmp_path)
+    llm = FakeLLM()
+    se = SchemaEngine(engine, db_name='test', llm=llm)
+    assert se.fields_category() == {}
+    heuristic_llm = FakeLLM()
+    se = SchemaEngine(engine, db_name='test', llm=heuristic_llm, heuristic_threshold=0.85)
+    assert se.fields_category() == {}
+    assert len(heuristic_llm.prompts) < len(llm.prompts)
+    assert se.mschema.get_field_info('orders', 'product_id')['category'] == 'Code'
+    assert se.mschema.get_field_info('products', 'price')['category'] == 'Measure'
@@ -0,0 +1,67 @@
+"""Test della cache delle risposte LLM (LLMResponseCache)."""
+import time
+from llm_cache import LLMResponseCache
+
+
+def test_cache_persisted(tmp_path):
+    """Le risposte sopravvivono alla riapertura; quelle vuote non vengono salvate."""
+    cache_path = str(tmp_path / 'llm_cache.sqlite')
+    key = LLMResponseCache.make_key('model', 'prompt', {'temperature': 0})
+    assert key != LLMResponseCache.make_key('model', 'prompt', {'temperature': 1})
+    cache = LLMResponseCache(cache_path)
+    cache.put(key, 'answer')
+    cache.put('empty', '')
+    cache.close()
+
+    cache = LLMResponseCache(cache_path)
+    assert cache.get(key) == 'answer'
+    assert cache.get('empty') is None
+    assert LLMResponseCache(cache_path, enabled=False).get(key) is None
+
+
+def test_cache_ttl(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / 'llm_cache.sqlite'), ttl=0.01)
+    cache.put('key', 'answer')
+    time.sleep(0.02)
+    assert cache.get('key') is None
+
+
+def test_disk_reads_batch_access_updates(tmp_path):
+    """Le letture da disco non scrivono a ogni accesso: gli accessed_at sono salvati a blocchi."""
+    cache_path = str(tmp_path / 'llm_cache.sqlite')
+    cache = LLMResponseCache(cache_path)
+    for i in range(3):
+        cache.put(f'key{i}', f'answer{i}')
+    cache.close()
+
+    # voci appena scritte: nessun aggiornamento
+    cache = LLMResponseCache(cache_path)
+    assert [cache.get(f'key{i}') for i in range(3)] == ['answer0', 'answer1', 'answer2']
+    assert cache._conn.total_changes == 0
+    cache.close()
+
+    cache = LLMResponseCache(cache_path, touch_interval=0.0, touch_batch_size=3)
+    cache.get('key0')
+    cache.get('key1')
+    assert cache._conn.total_changes == 0
+    cache.get('key2')
+    assert cache._conn.total_changes == 3
+
+
+def test_eviction_uses_pending_accesses(tmp_path):
+    """L'espulsione per numero di voci tiene conto degli accessi non ancora salvati."""
+    cache_path = str(tmp_path / 'llm_cache.sqlite')
+    cache = LLMResponseCache(cache_path)
+    cache.put('old', 'a')
+    time.sleep(0.01)
+    cache.put('recent', 'b')
+    cache.close()
+
+    cache = LLMResponseCache(cache_path, max_disk_entries=2, touch_interval=0.0)
+    assert cache.get('old') == 'a'
+    cache.put('new', 'c')
+    cache.close()
+
+    cache = LLMResponseCache(cache_path)
+    assert cache.get('old') == 'a' and cache.get('new') == 'c'
+    assert cache.get('recent') is None
@@ -0,0 +1,148 @@
+"""Test di MSchema: rendering, indici, salvataggio e caricamento."""
+import datetime
+import decimal
+import json
+import os
+from mschema import MSchema
+from type_engine import TypeEngine
+from utils import read_json, write_json
+
+
+def make_mschema() -> MSchema:
+    mschema = MSchema(db_id='test', type_engine=TypeEngine())
+    mschema.add_table('products', fields={}, comment='products table')
+    mschema.add_field('products', 'id', field_type='INTEGER', primary_key=True, examples=['1', '2'])
+    mschema.add_field('products', 'Name', field_type='TEXT', comment='name', examples=['a', 'b'])
+    mschema.add_field('products', 'price', field_type='REAL', examples=['1.5'])
+    mschema.add_table('orders', fields={}, comment='')
+    mschema.add_field('orders', 'id', field_type='INTEGER', primary_key=True)
+    mschema.add_field('orders', 'product_id', field_type='INTEGER')
+    mschema.add_foreign_key('orders', 'product_id', None, 'products', 'id')
+    return mschema
+
+
+def test_render_cache_selected_columns():
+    """Le selezioni di colonne sono filtrate dalle righe in cache, con una sola voce per opzioni di rendering."""
+    mschema = make_mschema()
+    full = mschema.single_table_mschema('products')
+    assert full == '# Table: products, products table\n[\n(id:INTEGER, Primary Key, Examples: [1, 2]),\n' \
+                   '(Name:TEXT, name, Examples: [a, b]),\n(price:REAL, Examples: [1.5])\n]'
+    assert mschema.single_table_mschema('products', ['id', 'price']) == \
+        '# Table: products, products table\n[\n(id:INTEGER, Primary Key, Examples: [1, 2]),\n' \
+        '(price:REAL, Examples: [1.5])\n]'
+    # come in to_mschema, la selezione è confrontata con i nomi di colonna in minuscolo
+    assert 'Name:TEXT' in mschema.single_table_mschema('products', ['name'])
+    for i in range(100):
+        mschema.single_table_mschema('products', ['id'] if i % 2 else ['id', 'price', str(i)])
+    assert len(mschema._render_cache['products']) == 1
+    mschema.single_table_mschema('products', example_num=0)
+    assert len(mschema._render_cache['products']) == 2
+
+
+def test_render_cache_invalidation():
+    mschema = make_mschema()
+    mschema.single_table_mschema('products', ['price'])
+    mschema.set_column_property('products', 'price', 'comment', 'unit price')
+    assert '(price:REAL, unit price, Examples: [1.5])' in mschema.single_table_mschema('products', ['price'])
+    assert 'unit price' in mschema.to_mschema(selected_columns=['products.price'])
+    mschema.set_table_property('products', 'comment', 'catalogue')
+    assert mschema.single_table_mschema('products').startswith('# Table: products, catalogue')
+
+
+def test_field_info_mapping():
+    """FieldInfo si comporta come il dict che sostituisce, con le differenze documentate."""
+    mschema = make_mschema()
+    mschema.add_field('products', 'notes', field_type='TEXT', examples=None)
+    assert mschema.get_field_info('products', 'notes')['examples'] is None
+    assert mschema.get_field_info('products', 'missing') == {}
+
+    field_info = mschema.get_field_info('products', 'Name')
+    assert field_info['examples'] == ['a', 'b']
+    # la lista degli esempi è quella della colonna: le modifiche sul posto aggiornano anche il rendering
+    assert 'Examples: [a, b]' in mschema.single_table_mschema('products')
+    field_info['examples'].append('c')
+    assert field_info['examples'] == ['a', 'b', 'c']
+    assert 'Examples: [a, b, c]' in mschema.single_table_mschema('products')
+    field_info['examples'].remove('c')
+    assert 'Examples: [a, b]' in mschema.single_table_mschema('products')
+    mschema.set_column_property('products', 'Name', 'examples', field_info['examples'] + ['c'])
+    assert field_info['examples'] == ['a', 'b', 'c']
+    copy = field_info.copy()
+    assert type(copy) is dict and type(copy['examples']) is list and copy['comment'] == 'name'
+    assert field_info.get('stats') is None and 'stats' not in field_info
+    field_info['stats'] = {'count': 2}
+    assert field_info.to_dict()['stats'] == {'count': 2}
+    assert json.loads(json.dumps(field_info.to_dict()))['examples'] == ['a', 'b', 'c']
+
+
+def test_write_json_field_info(tmp_path):
+    mschema = make_mschema()
+    path = str(tmp_path / 'field.json')
+    write_json(path, {'field': mschema.get_field_info('products', 'id'), 'table': mschema.tables['orders']})
+    data = read_json(path)
+    assert data['field']['examples'] == ['1', '2'] and data['field']['primary_key'] is True
+    assert list(data['table']['fields'].keys()) == ['id', 'product_id']
+
+
+def test_save_json_non_serializable_values(tmp_path):
+    """Valori come date e decimali nelle statistiche vengono salvati come stringhe."""
+    mschema = make_mschema()
+    mschema.set_column_property('products', 'price', 'stats', {'max': decimal.Decimal('1.50'),
+                                                               'first_seen': datetime.date(2020, 1, 2)})
+    for file_name in ['mschema.json', 'mschema.sqlite']:
+        path = str(tmp_path / file_name)
+        mschema.save(path)
+        loaded = MSchema(type_engine=TypeEngine())
+        loaded.load(path)
+        assert loaded.get_field_info('products', 'price')['stats'] == {'max': '1.50', 'first_seen': '2020-01-02'}
+        loaded.close()
+
+
+def test_save_sqlite_over_source(tmp_path):
+    """Un M-Schema caricato in modo pigro può essere salvato sul proprio file, anche con tabelle non ancora lette."""
+    path = str(tmp_path / 'mschema.sqlite')
+    make_mschema().save(path)
+    mschema = MSchema(type_engine=TypeEngine())
+    mschema.load(path)
+    mschema.set_table_property('orders', 'comment', 'orders table')
+    assert not mschema.tables.is_loaded('products')
+    mschema.save(path)
+    assert not os.path.exists(path + '.tmp')
+    # le tabelle non ancora lette sono lette dal nuovo file
+    assert mschema.tables['products']['comment'] == 'products table'
+    mschema.close()
+
+    reloaded = MSchema(type_engine=TypeEngine())
+    reloaded.load(path, lazy=False)
+    assert reloaded.tables['orders']['comment'] == 'orders table'
+    assert reloaded.tables['products']['comment'] == 'products table'
+    assert reloaded.get_foreign_keys('orders') == [['orders', 'product_id', None, 'products', 'id']]
+
+
+def test_item_assignment_updates_indexes_and_cache():
+    """Assegnare direttamente una chiave di FieldInfo/TableInfo aggiorna indici e cache di rendering."""
+    mschema = make_mschema()
+    assert 'Name:TEXT' in mschema.single_table_mschema('products')
+    mschema.tables['products']['fields']['Name']['category'] = 'Enum'
+    assert mschema.get_category_fields('Enum', 'products') == ['Name']
+    mschema.tables['products']['fields']['Name']['type'] = 'VARCHAR(20)'
+    assert 'Name:VARCHAR' in mschema.single_table_mschema('products')
+    del mschema.tables['products']['fields']['Name']['category']
+    assert mschema.get_category_fields('Enum', 'products') == []
+    mschema.tables['products']['comment'] = 'all products'
+    assert mschema.single_table_mschema('products').startswith('# Table: products, all products\n')
+
+
+def test_rebuild_indexes_lazy(tmp_path):
+    """rebuild_indexes su un M-Schema caricato in modo pigro mantiene gli indici delle tabelle già lette."""
+    path = str(tmp_path / 'mschema.sqlite')
+    source = make_mschema()
+    source.set_column_property('products', 'Name', 'category', 'Enum')
+    source.save(path)
+    mschema = MSchema(type_engine=TypeEngine())
+    mschema.load(path)
+    assert mschema.get_category_fields('Enum', 'products') == ['Name']
+    mschema.rebuild_indexes()
+    assert not mschema.tables.is_loaded('orders')
+    assert mschema.get_category_fields('Enum', 'products') == ['Name']
+    mschema.close()
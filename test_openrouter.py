@@ -1,6 +1,10 @@
 from openrouter_llm import OpenRouterLLM
 from llama_index.core.llms import ChatMessage
+import asyncio
 import logging
+import io
+import httpx
+import requests
 
 def test_openrouter():
     """Test della connessione a OpenRouter con un prompt semplice."""
@@ -30,7 +34,89 @@ def test_openrouter():
         print(f"\nErrore durante il test: {str(e)}")
         return False
 
+def test_async_client_closed_on_loop_change(tmp_path, monkeypatch):
+    """Il client httpx di un event loop terminato viene chiuso quando ne viene creato uno nuovo."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'logs').mkdir()
+    llm = OpenRouterLLM(api_key='test-key', context_window=4096)
+
+    first = asyncio.run(llm._get_async_client())
+    second = asyncio.run(llm._get_async_client())
+    assert first is not second
+    assert first.is_closed
+    assert not second.is_closed
+
+    async def same_loop():
+        return await llm._get_async_client(), await llm._get_async_client()
+
+    third, fourth = asyncio.run(same_loop())
+    assert third is fourth and second.is_closed
+    asyncio.run(llm.aclose())
+    assert third.is_closed
+
 if __name__ == "__main__":
     print("=== Test OpenRouter ===")
     success = test_openrouter()
-    print("\n✓ Test completato" if success else "\n✗ Test fallito")
\ No newline at end of file
+    print("\n✓ Test completato" if success else "\n✗ Test fallito")
+
+SSE_BODY = (': OPENROUTER PROCESSING\n\n'
+            'data: {"choices": [{"delta": {"role": "assistant", "content": "ci"}}]}\n\n'
+            'data: {"choices": [{"delta": {"content": "ào"}}]}\n\n'
+            'data: {"choices": [{"delta": {}}], "usage": {"total_tokens": 12}}\n\n'
+            'data: [DONE]\n\n')
+
+
+def make_llm(tmp_path, monkeypatch) -> OpenRouterLLM:
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'logs').mkdir(exist_ok=True)
+    return OpenRouterLLM(api_key='test-key-stream', context_window=4096, max_retries=1, initial_retry_delay=0)
+
+
+def test_stream_chat(tmp_path, monkeypatch):
+    """stream_chat e stream_complete decodificano la risposta SSE di OpenRouter chunk per chunk."""
+    llm = make_llm(tmp_path, monkeypatch)
+    payloads = []
+
+    def post(url, headers=None, json=None, timeout=None, stream=False):
+        payloads.append(json)
+        response = requests.Response()
+        response.status_code = 200
+        response.raw = io.BytesIO(SSE_BODY.encode('utf-8'))
+        return response
+
+    monkeypatch.setattr(llm._session, 'post', post)
+    responses = list(llm.stream_chat([ChatMessage(role='user', content='ciao')]))
+    assert [r.delta for r in responses] == ['ci', 'ào', '']
+    assert responses[-1].message.content == 'ciào'
+    assert payloads[0]['stream'] is True
+    assert [r.text for r in llm.stream_complete('ciao')] == ['ci', 'ciào', 'ciào']
+
+
+def test_astream_chat(tmp_path, monkeypatch):
+    """astream_chat usa il client httpx condiviso e ritenta gli errori del server prima dell'inizio dello stream."""
+    llm = make_llm(tmp_path, monkeypatch)
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            return httpx.Response(502, text='bad gateway')
+        return httpx.Response(200, content=SSE_BODY.encode('utf-8'),
+                              headers={'Content-Type': 'text/event-stream'})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    async def get_async_client():
+        return client
+
+    monkeypatch.setattr(llm, '_get_async_client', get_async_client)
+
+    async def collect():
+        chat = [r async for r in await llm.astream_chat([ChatMessage(role='user', content='ciao')])]
+        completion = [r async for r in await llm.astream_complete('ciao')]
+        return chat, completion
+
+    chat, completion = asyncio.run(collect())
+    assert chat[-1].message.content == 'ciào'
+    assert [r.delta for r in completion] == ['ci', 'ào', '']
+    assert len(calls) == 3
@@ -0,0 +1,100 @@
+"""Test di SchemaPipeline contro l'esecuzione per fasi di SchemaEngine."""
+import threading
+import time
+from checkpoint_manager import CheckpointManager
+from pipeline import SchemaPipeline
+from schema_engine import SchemaEngine
+from test_schema_engine import FakeLLM, make_engine
+
+
+def test_pipeline_matches_phased_run(tmp_path):
+    """La pipeline produce lo stesso M-Schema di fields_category seguita da table_and_column_desc_generation."""
+    engine = make_engine(tmp_path)
+    phased = SchemaEngine(engine, db_name='test', llm=FakeLLM(), comment_mode='generation')
+    assert phased.fields_category() == {}
+    assert phased.table_and_column_desc_generation(language='EN') == {}
+
+    for lazy_mschema in [False, True]:
+        se = SchemaEngine(engine, db_name='test', llm=FakeLLM(), comment_mode='generation',
+                          lazy_mschema=lazy_mschema)
+        pipeline = SchemaPipeline(se, language='EN', profile_workers=2, classify_workers=2, understand_workers=2,
+                                  describe_workers=2, queue_size=1)
+        assert pipeline.run() == {}
+        assert se.mschema.dump() == phased.mschema.dump()
+        assert se.mschema.db_info == phased.mschema.db_info
+
+
+def test_pipeline_without_classification(tmp_path):
+    """Con classify=False la pipeline descrive le tabelle come table_and_column_desc_generation da sola."""
+    engine = make_engine(tmp_path)
+    phased = SchemaEngine(engine, db_name='test', llm=FakeLLM(), comment_mode='generation')
+    for table_name in phased.mschema.tables.keys():
+        for field_name in phased.mschema.tables[table_name]['fields'].keys():
+            phased.get_column_stats(table_name, field_name)
+    phased.table_and_column_desc_generation(language='EN')
+
+    se = SchemaEngine(engine, db_name='test', llm=FakeLLM(), comment_mode='generation')
+    assert SchemaPipeline(se, language='EN', classify=False).run() == {}
+    assert se.mschema.dump() == phased.mschema.dump()
+
+
+def test_pipeline_origin_mode(tmp_path):
+    """Senza descrizioni da generare la pipeline profila e classifica senza chiedere la comprensione del database."""
+    engine = make_engine(tmp_path)
+    llm = FakeLLM()
+    se = SchemaEngine(engine, db_name='test', llm=llm, comment_mode='origin')
+    assert se.table_and_column_desc_generation() == {}
+    assert SchemaPipeline(se).run() == {}
+    assert getattr(se.mschema, 'db_info', None) is None
+    assert se.mschema.get_field_info('products', 'price')['category'] == 'Measure'
+    assert not any('column information for a data table' in prompt for prompt in llm.prompts)
+
+
+def test_pipeline_resume(tmp_path):
+    """Una pipeline ripresa dal journal non richiama l'LLM per le tabelle completate."""
+    engine = make_engine(tmp_path)
+    checkpoint_dir = str(tmp_path / 'checkpoints')
+    se = SchemaEngine(engine, db_name='test', llm=FakeLLM(), comment_mode='generation',
+                      checkpoint=CheckpointManager(checkpoint_dir))
+    SchemaPipeline(se, language='EN').run()
+    expected = se.mschema.dump()
+
+    llm = FakeLLM()
+    se = SchemaEngine(engine, db_name='test', llm=llm, comment_mode='generation',
+                      checkpoint=CheckpointManager(checkpoint_dir))
+    assert SchemaPipeline(se, language='EN').run() == {}
+    assert llm.prompts == []
+    for table_name in expected['tables']:
+        assert se.mschema.tables[table_name]['comment'] == expected['tables'][table_name]['comment']
+
+
+def test_pipeline_overlap_without_classification(tmp_path):
+    """Con classify=False la descrizione della prima tabella inizia prima della fine della profilazione dell'ultima."""
+    engine = make_engine(tmp_path)
+    se = SchemaEngine(engine, db_name='test', llm=FakeLLM(), comment_mode='generation')
+    table_names = list(se.mschema.tables.keys())
+    events = []
+    events_guard = threading.Lock()
+
+    def log(event: str):
+        with events_guard:
+            events.append(event)
+
+    pipeline = SchemaPipeline(se, language='EN', classify=False, profile_workers=1, describe_workers=1,
+                              queue_size=1)
+    profile, describe_table = pipeline.profile, se.describe_table
+
+    def slow_profile(table_name):
+        if table_name == table_names[-1]:
+            time.sleep(0.5)
+        profile(table_name)
+        log('profile_end:' + table_name)
+
+    def logged_describe_table(table_name, *args, **kwargs):
+        log('describe_start:' + table_name)
+        return describe_table(table_name, *args, **kwargs)
+
+    pipeline.profile = slow_profile
+    se.describe_table = logged_describe_table
+    assert pipeline.run(table_names) == {}
+    assert events.index('describe_start:' + table_names[0]) < events.index('profile_end:' + table_names[-1])
@@ -0,0 +1,46 @@
+"""Test del rate limiter a token bucket condiviso per API key."""
+import asyncio
+import time
+from rate_limiter import RateLimiter, TokenBucket, get_rate_limiter, _parse_reset
+
+
+def test_token_bucket_burst_and_wait():
+    """Il bucket consente raffiche fino alla capacità, poi fa attendere in proporzione alla ricarica."""
+    bucket = TokenBucket(2, 1.0)
+    now = time.monotonic()
+    assert bucket.reserve(1, now) == 0.0
+    assert bucket.reserve(1, now) == 0.0
+    assert abs(bucket.reserve(1, now) - 1.0) < 1e-6
+    assert abs(bucket.reserve(1, now) - 2.0) < 1e-6
+
+
+def test_rate_limiter_pause_from_headers():
+    """Retry-After sospende le richieste, un residuo nullo sospende fino al reset."""
+    limiter = RateLimiter(6000)
+    limiter.update_from_headers({'Retry-After': '0.05'})
+    assert 0.0 < limiter.acquire() <= 0.05
+    limiter.update_from_headers({'x-ratelimit-remaining': '0', 'x-ratelimit-reset': '50ms'})
+    assert asyncio.run(limiter.aacquire()) > 0.0
+    assert _parse_reset('1m30s') == 90.0
+
+
+def test_shared_limiter_applies_stricter_limits(caplog):
+    """Un'istanza con la stessa API key ma limiti diversi non riceve in silenzio i limiti della prima."""
+    first = get_rate_limiter('shared-key-test', 60, None)
+    with caplog.at_level('WARNING'):
+        second = get_rate_limiter('shared-key-test', 20, 1000)
+    assert first is second
+    assert first.limits == (20, 1000, 20)
+    assert 'limiti diversi' in caplog.text
+
+    caplog.clear()
+    with caplog.at_level('WARNING'):
+        get_rate_limiter('shared-key-test', 60, 5000)
+    # i limiti più larghi non allentano quelli già in vigore
+    assert first.limits == (20, 1000, 20)
+    assert 'limiti diversi' in caplog.text
+
+    caplog.clear()
+    with caplog.at_level('WARNING'):
+        get_rate_limiter('shared-key-test', 20, 1000)
+    assert caplog.text == ''
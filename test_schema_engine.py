@@ -0,0 +1,490 @@
+"""Test di SchemaEngine su un database sqlite temporaneo (nessun server o LLM richiesto)."""
+import asyncio
+import datetime
+import decimal
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Any
+import pytest
+from llama_index.core.llms import CustomLLM, CompletionResponse, CompletionResponseGen, LLMMetadata
+from sqlalchemy import create_engine, event
+import database
+from schema_engine import SchemaEngine
+from stats_cache import StatsCache
+from utils import examples_to_str
+
+
+def make_engine(tmp_path, rows: int = 50):
+    """Database di prova: una tabella di prodotti e una di ordini che la referenzia."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    with engine.begin() as connection:
+        connection.exec_driver_sql('create table products (id integer primary key, name text, '
+                                   'price real, available boolean, created_at timestamp)')
+        connection.exec_driver_sql('create table orders (id integer primary key, '
+                                   'product_id integer references products(id), quantity integer)')
+        for i in range(rows):
+            connection.exec_driver_sql("insert into products values ({}, 'name{}', {}, {}, "
+                                       "'2020-01-01 10:00:00')".format(i, i % 5, i * 1.5, i % 2))
+            connection.exec_driver_sql('insert into orders values ({}, {}, {})'.format(i, i, i % 3))
+    return engine
+
+
+class FakeLLM(CustomLLM):
+    """
+    LLM deterministico per i test: la risposta dipende solo dal prompt, nel formato atteso da components.py.
+    I prompt ricevuti sono registrati in prompts.
+    """
+    prompts: list = []
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(context_window=4096, num_output=256, model_name='fake')
+
+    def answer(self, prompt: str) -> str:
+        digest = hashlib.sha1(prompt.encode('utf-8')).hexdigest()[:8]
+        if 'analyze whether this column represents a datetime' in prompt:
+            return 'No'
+        if 'infer the minimum granularity' in prompt:
+            return 'SECOND'
+        if 'Answer only "enum", "code", or "text"' in prompt:
+            return 'code'
+        if 'Answer only "enum", "code", or "measure"' in prompt:
+            return 'measure'
+        if 'Answer only "enum", "measure", "code", or "text"' in prompt:
+            return 'text'
+        if 'information about several columns' in prompt:
+            field_names = re.findall(r'\[Column \d+: ([^\]]+)\]', prompt)
+            return '```json\n{}\n```'.format(json.dumps([{"field_name": f, "category": "code"} for f in field_names]))
+        if 'sample data for a data table' in prompt:
+            return '```json\n{{"chinese_name": "column-{0}", "english_desc": "column-{0}"}}\n```'.format(digest)
+        if 'column information for a data table' in prompt:
+            return '```json\n{{"table_desc": "table-{}"}}\n```'.format(digest)
+        return 'info-{}'.format(digest)
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        self.prompts.append(prompt)
+        return CompletionResponse(text=self.answer(prompt))
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        yield self.complete(prompt, formatted, **kwargs)
+
+
+class QueryCounter:
+    """Registra le query eseguite su un engine."""
+
+    def __init__(self, engine):
+        self.queries = []
+        event.listen(engine, 'before_cursor_execute', self.before_cursor_execute)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.queries.append(statement)
+
+    def reset(self):
+        self.queries = []
+
+    def count(self, fragment: str) -> int:
+        return sum(1 for statement in self.queries if fragment.lower() in statement.lower())
+
+
+def test_profile_table_single_query(tmp_path):
+    """Tutte le colonne di una tabella vengono profilate con una sola query aggregata."""
+    engine = make_engine(tmp_path)
+    se = SchemaEngine(engine, db_name='test')
+    counter = QueryCounter(engine)
+
+    stats = se.get_column_stats('products', 'name')
+    assert counter.count('count(distinct') == 1
+    assert stats['count'] == 50 and stats['unique_count'] == 5
+    assert stats['max_len'] == 5 and stats['min_len'] == 5
+
+    # le altre colonne della tabella sono già profilate
+    price = se.get_column_stats('products', 'price')
+    assert counter.count('count(distinct') == 1
+    assert price['max'] == 73.5 and price['min'] == 0.0
+
+
+def test_profile_table_batches(tmp_path):
+    """Con profile_batch_size le colonne sono divise in più query, con lo stesso risultato."""
+    engine = make_engine(tmp_path)
+    se = SchemaEngine(engine, db_name='test')
+    se_batched = SchemaEngine(engine, db_name='test', profile_batch_size=2)
+    counter = QueryCounter(engine)
+
+    batched = se_batched.profile_table('products')
+    assert counter.count('count(distinct') == 3
+    for field_name, stats in se.profile_table('products').items():
+        assert batched[field_name] == stats
+        assert se.profile_column('products', field_name) == stats
+
+
+def test_stats_cache_warm_run(tmp_path):
+    """Con la cache calda una nuova esecuzione non ripete né la profilazione né i campionamenti."""
+    engine = make_engine(tmp_path)
+    cache_path = str(tmp_path / 'stats.sqlite')
+    se = SchemaEngine(engine, db_name='test', stats_cache=StatsCache(cache_path))
+    cold = [se.get_single_field_info_str('products', field_name)
+            for field_name in se.mschema.tables['products']['fields'].keys()]
+    cold_sample = se.get_table_sample('products')
+
+    se = SchemaEngine(engine, db_name='test', stats_cache=StatsCache(cache_path))
+    counter = QueryCounter(engine)
+    warm = [se.get_single_field_info_str('products', field_name)
+            for field_name in se.mschema.tables['products']['fields'].keys()]
+    assert se.get_table_sample('products') == cold_sample
+    assert warm == cold
+    assert counter.queries == []
+
+
+def test_stats_cache_invalidated_by_fingerprint(tmp_path):
+    """Le voci in cache di una tabella modificata non vengono usate."""
+    engine = make_engine(tmp_path)
+    cache = StatsCache()
+    se = SchemaEngine(engine, db_name='test', stats_cache=cache)
+    se.get_column_stats('products', 'name')
+    se.get_table_sample('products')
+
+    with engine.begin() as connection:
+        connection.exec_driver_sql('alter table products add column notes text')
+    se = SchemaEngine(engine, db_name='test', stats_cache=cache)
+    counter = QueryCounter(engine)
+    se.get_column_stats('products', 'name')
+    se.get_table_sample('products')
+    assert counter.count('count(distinct') == 1
+    assert counter.count('select distinct *') == 1
+
+
+def test_sampling_mode(tmp_path):
+    """Le tabelle oltre sample_row_budget sono profilate su intervalli casuali sparsi lungo la chiave primaria."""
+    engine = make_engine(tmp_path, rows=200)
+    se = SchemaEngine(engine, db_name='test', sample_row_budget=20)
+    counter = QueryCounter(engine)
+
+    stats = se.get_column_stats('products', 'name')
+    assert stats['approximate'] is True and stats['sample_rows'] == 20
+    assert stats['count'] == 200
+    # la stima delle righe è letta una sola volta per tabella
+    assert counter.count('select count(*) from `products`') == 1
+
+    with engine.connect() as connection:
+        plan = connection.exec_driver_sql('explain query plan select count(*) from {}'.format(
+            se.get_profile_source('products'))).fetchall()
+    assert not any(row[-1] == 'SCAN products' for row in plan)
+    # un intervallo per ognuno dei 10 strati della chiave: il campione copre tutta la tabella
+    ids = [row[0] for row in se.fetch('select id from {}'.format(se.get_profile_source('products')))]
+    assert len(ids) == 20 and len(set(ids)) == 20
+    assert sorted({i // 20 for i in ids}) == list(range(10))
+
+
+def test_sampling_mode_enum_candidates_exact(tmp_path):
+    """I valori candidati di una colonna Enum vengono dall'intera tabella, non dal campione."""
+    engine = make_engine(tmp_path, rows=200)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("update products set name = 'first' where id = 0")
+        connection.exec_driver_sql("update products set name = 'last' where id = 199")
+    se = SchemaEngine(engine, db_name='test', sample_row_budget=20)
+    te = se.type_engine
+    properties = se.get_field_properties('products', 'name', {'category': te.field_category_enum_label,
+                                                              'dim_or_meas': te.dimension_label})
+    assert {'first', 'last'} <= set(properties['examples'])
+    assert properties['examples_truncated'] is False
+
+
+def test_enum_candidates_truncated(tmp_path):
+    """La lista dei candidati è troncata a max_enum_values, contando anche la stringa vuota."""
+    engine = make_engine(tmp_path, rows=0)
+    with engine.begin() as connection:
+        for i in range(101):
+            connection.exec_driver_sql("insert into products (id, name) values ({}, '{}')".format(
+                i, '' if i == 0 else 'v{:03d}'.format(i)))
+    te = SchemaEngine(engine, db_name='test').type_engine
+    res = {'category': te.field_category_enum_label, 'dim_or_meas': te.dimension_label}
+
+    properties = SchemaEngine(engine, db_name='test', max_enum_values=100).get_field_properties(
+        'products', 'name', res)
+    assert properties['examples_truncated'] is True
+    assert '' not in properties['examples'] and len(properties['examples']) <= 100
+
+    properties = SchemaEngine(engine, db_name='test', max_enum_values=101).get_field_properties(
+        'products', 'name', res)
+    assert properties['examples_truncated'] is False
+    assert len(properties['examples']) == 100
+
+
+def test_fields_category_concurrent(tmp_path):
+    """La classificazione concorrente dà lo stesso risultato di quella sequenziale, nell'ordine di M-Schema."""
+    engine = make_engine(tmp_path)
+    sequential = SchemaEngine(engine, db_name='test', llm=FakeLLM())
+    assert sequential.fields_category(max_workers=1) == {}
+    concurrent = SchemaEngine(engine, db_name='test', llm=FakeLLM())
+    assert concurrent.fields_category(max_workers=4) == {}
+    assert concurrent.mschema.dump() == sequential.mschema.dump()
+    assert concurrent.mschema.get_field_info('products', 'price')['category'] == 'Measure'
+
+
+def test_fields_category_failures(tmp_path):
+    """Una colonna che fallisce viene riportata e non interrompe le altre."""
+    engine = make_engine(tmp_path)
+    se = SchemaEngine(engine, db_name='test', llm=FakeLLM())
+    classify_field = se.classify_field
+
+    def failing_classify_field(table_name, field_name):
+        if field_name == 'price':
+            raise ValueError('boom')
+        return classify_field(table_name, field_name)
+
+    se.classify_field = failing_classify_field
+    failures = se.fields_category(max_workers=2)
+    assert failures == {('products', 'price'): 'boom'}
+    assert se.mschema.get_field_info('products', 'price')['category'] == ''
+    assert se.mschema.get_field_info('products', 'name')['category'] == 'Code'
+
+
+def test_desc_generation_concurrent(tmp_path):
+    """Descrizioni generate in parallelo uguali a quelle sequenziali, con al più max_llm_calls chiamate in corso."""
+    engine = make_engine(tmp_path)
+    sequential = SchemaEngine(engine, db_name='test', llm=FakeLLM(), comment_mode='generation')
+    sequential.fields_category()
+    assert sequential.table_and_column_desc_generation(language='EN') == {}
+
+    in_flight = {'current': 0, 'max': 0}
+    guard = threading.Lock()
+
+    class SlowFakeLLM(FakeLLM):
+        def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+            with guard:
+                in_flight['current'] += 1
+                in_flight['max'] = max(in_flight['max'], in_flight['current'])
+            time.sleep(0.01)
+            with guard:
+                in_flight['current'] -= 1
+            return super().complete(prompt, formatted, **kwargs)
+
+    concurrent = SchemaEngine(engine, db_name='test', llm=SlowFakeLLM(), comment_mode='generation',
+                              max_workers=4, max_llm_calls=2)
+    concurrent.fields_category()
+    assert concurrent.table_and_column_desc_generation(language='EN') == {}
+    assert concurrent.mschema.dump() == sequential.mschema.dump()
+    assert concurrent.mschema.get_field_info('products', 'name')['comment'].startswith('column-')
+    assert concurrent.mschema.tables['products']['comment'].startswith('table-')
+    assert in_flight['max'] == 2
+
+
+def test_fields_category_batched(tmp_path):
+    """Con classify_batch_size le colonne incerte di una tabella sono classificate con un prompt per lotto."""
+    engine = make_engine(tmp_path)
+    llm = FakeLLM()
+    se = SchemaEngine(engine, db_name='test', llm=llm, classify_batch_size=3)
+    assert se.fields_category() == {}
+    batch_prompts = [p for p in llm.prompts if 'information about several columns' in p]
+    assert 0 < len(batch_prompts) <= 3
+    assert se.mschema.get_field_info('products', 'name')['category'] == 'Code'
+    for table_name, table in se.mschema.tables.items():
+        for field_name in table['fields'].keys():
+            assert se.mschema.get_field_info(table_name, field_name)['category'] != ''
+
+
+def test_bulk_reflection(tmp_path):
+    """La riflessione in blocco legge gli stessi metadati delle chiamate per tabella."""
+    engine = make_engine(tmp_path)
+    se = SchemaEngine(engine, db_name='test')
+    reflected = se.reflect_tables(['products', 'orders'])
+    for table_name in ['products', 'orders']:
+        per_table = se.reflect_table(table_name)
+        assert reflected[table_name]['pk'] == per_table['pk']
+        assert reflected[table_name]['foreign_keys'] == per_table['foreign_keys']
+        assert [c['name'] for c in reflected[table_name]['columns']] == [c['name'] for c in per_table['columns']]
+    assert se.mschema.get_field_info('products', 'id')['primary_key'] is True
+    assert se.mschema.is_foreign_key('orders', 'product_id')
+
+
+def test_bulk_reflection_fallback(tmp_path, monkeypatch):
+    """Se la riflessione in blocco fallisce, M-Schema è costruito con le chiamate per tabella."""
+    engine = make_engine(tmp_path)
+    expected = SchemaEngine(engine, db_name='test').mschema.dump()
+
+    def failing_reflect_tables(self, table_names):
+        raise NotImplementedError('no bulk reflection')
+
+    monkeypatch.setattr(SchemaEngine, 'reflect_tables', failing_reflect_tables)
+    assert SchemaEngine(engine, db_name='test').mschema.dump() == expected
+
+
+def test_text_examples_match_native_values(tmp_path):
+    """Gli esempi letti come testo sono scritti come i valori nativi restituiti dal driver."""
+    to_str = SchemaEngine._text_example_to_str
+    assert to_str('true', bool) == 'True' and to_str('f', bool) == 'False' and to_str('1', bool) == '1'
+    assert to_str('1e+20', float) == str(1e+20) and to_str('1.50', decimal.Decimal) == '1.5'
+    assert to_str('2020-01-01 10:00:00+00', datetime.datetime) == '2020-01-01 10:00:00+00:00'
+    assert to_str('2020-01-01 10:00:00+05:30', datetime.datetime) == '2020-01-01 10:00:00+05:30'
+    assert to_str('not a date', datetime.datetime) == 'not a date'
+
+    engine = make_engine(tmp_path)
+    se = SchemaEngine(engine, db_name='test')
+    for field_name in ['name', 'price', 'available', 'created_at']:
+        native = examples_to_str(se.get_field_examples('products', field_name))
+        assert se.mschema.get_field_info('products', field_name)['examples'][:1] == native[:1]
+        if field_name != 'created_at':
+            assert list(se.mschema.get_field_info('products', field_name)['examples']) == native
+
+
+def test_lazy_mschema_retry_after_failure(tmp_path):
+    """Una tabella pigra che fallisce il caricamento viene ricaricata senza duplicare le chiavi esterne."""
+    engine = make_engine(tmp_path)
+    se = SchemaEngine(engine, db_name='test', lazy_mschema=True)
+    get_table_examples = se.get_table_examples
+    calls = {'n': 0}
+
+    def flaky_get_table_examples(table_name, fields, num=5):
+        calls['n'] += 1
+        if calls['n'] == 1:
+            raise ConnectionError('lost connection')
+        return get_table_examples(table_name, fields, num)
+
+    se.get_table_examples = flaky_get_table_examples
+    assert se.mschema.tables.is_loaded('orders') is False
+    try:
+        se.mschema.tables['orders']
+        assert False, 'the first load should fail'
+    except ConnectionError:
+        pass
+    assert se.mschema.tables.is_loaded('orders') is False
+    assert list(se.mschema.tables['orders']['fields'].keys()) == ['id', 'product_id', 'quantity']
+    assert se.mschema.get_foreign_keys('orders') == [['orders', 'product_id', None, 'products', 'id']]
+
+
+def test_incremental_mode(tmp_path):
+    """In modalità incrementale solo le tabelle e le colonne modificate tornano all'LLM."""
+    engine = make_engine(tmp_path)
+    previous = SchemaEngine(engine, db_name='test', llm=FakeLLM(), comment_mode='generation')
+    previous.fields_category()
+    previous.table_and_column_desc_generation(language='EN')
+    previous_path = str(tmp_path / 'previous.json')
+    previous.mschema.save(previous_path)
+
+    with engine.begin() as connection:
+        connection.exec_driver_sql('alter table orders add column notes text')
+    llm = FakeLLM()
+    se = SchemaEngine(engine, db_name='test', llm=llm, comment_mode='incremental', previous_mschema=previous_path)
+    assert se.is_dirty_table('orders') and not se.is_dirty_table('products')
+    assert se.is_dirty_column('orders', 'notes') and not se.is_dirty_column('orders', 'quantity')
+    se.fields_category()
+    se.table_and_column_desc_generation(language='EN')
+
+    assert se.mschema.tables['products']['comment'] == previous.mschema.tables['products']['comment']
+    for field_name in ['id', 'product_id', 'quantity']:
+        assert se.mschema.get_field_info('orders', field_name)['comment'] == \
+               previous.mschema.get_field_info('orders', field_name)['comment']
+    assert se.mschema.get_field_info('orders', 'notes')['comment'].startswith('column-')
+    assert se.mschema.get_field_info('orders', 'notes')['category'] == 'Code'
+    # la tabella invariata non compare in nessun prompt di classificazione o descrizione
+    assert len(llm.prompts) > 0
+    assert not any('products' in prompt and 'orders' not in prompt for prompt in llm.prompts)
+
+
+def test_session_mode(tmp_path):
+    """In modalità sessione le connessioni sono riusate e i campionamenti non chiedono cursori lato server."""
+    engine = make_engine(tmp_path)
+    se = SchemaEngine(engine, db_name='test', connection_mode='session')
+    stream_options = []
+    event.listen(engine, 'before_cursor_execute', lambda conn, cursor, statement, parameters, context, executemany:
+                 stream_options.append(context.execution_options.get('stream_results', False)))
+    assert len(se.fetch_truncated('select * from products', max_rows=3)['truncated_results']) == 3
+    assert se.get_column_stats('products', 'name')['count'] == 50
+    assert not any(stream_options)
+    assert len(se._session_connections) == 1
+    se.close_connections()
+    # la connessione restituita al pool non è più in sola lettura
+    with engine.begin() as connection:
+        connection.exec_driver_sql("insert into products (id, name) values (1000, 'new')")
+
+
+@pytest.mark.skipif(not os.getenv('TEST_POSTGRES_URL'), reason='TEST_POSTGRES_URL not set')
+def test_session_mode_postgres():
+    """Su Postgres (psycopg2) i campionamenti in modalità sessione restituiscono le righe."""
+    engine = create_engine(os.getenv('TEST_POSTGRES_URL'))
+    with engine.begin() as connection:
+        connection.exec_driver_sql('drop table if exists session_mode_rows')
+        connection.exec_driver_sql('create table session_mode_rows (id integer primary key, name text)')
+        connection.exec_driver_sql("insert into session_mode_rows select i, 'name' || i from generate_series(1, 20) i")
+    try:
+        se = SchemaEngine(engine, db_name='test', include_tables=['session_mode_rows'], connection_mode='session',
+                          statement_timeout=10)
+        res = se.fetch_truncated('select * from session_mode_rows order by id', max_rows=5)
+        assert res['truncated_results'] is not None and len(res['truncated_results']) == 5
+        assert se.get_table_sample('session_mode_rows', max_rows=5)[1] != ''
+        se.close_connections()
+        transaction = SchemaEngine(engine, db_name='test', include_tables=['session_mode_rows'])
+        assert transaction.fetch_truncated('select * from session_mode_rows order by id', max_rows=5) == res
+    finally:
+        with engine.begin() as connection:
+            connection.exec_driver_sql('drop table session_mode_rows')
+
+
+SLOW_QUERY = 'with recursive n(i) as (select 1 union all select i + 1 from n where i < 100000000) select count(*) from n'
+
+
+def test_statement_timeout(tmp_path):
+    """Una query oltre statement_timeout viene interrotta dal database e registrata tra quelle saltate."""
+    engine = make_engine(tmp_path)
+    se = SchemaEngine(engine, db_name='test', statement_timeout=0.1)
+    start = time.monotonic()
+    assert se.fetch(SLOW_QUERY) is None
+    assert time.monotonic() - start < 5
+    assert se.skipped_queries == [{'sql': SLOW_QUERY + ';', 'timeout': 0.1}]
+    # la connessione resta utilizzabile e le query brevi non sono interrotte
+    assert se.fetch('select count(*) from products') == [(50,)]
+    assert se.fetch_truncated(SLOW_QUERY, timeout=0.1)['truncated_results'] is None
+    assert len(se.skipped_queries) == 2
+
+
+@pytest.mark.skipif(not os.getenv('TEST_MYSQL_URL'), reason='TEST_MYSQL_URL not set')
+def test_statement_timeout_mysql():
+    """Su MySQL anche le query che non accettano l'hint MAX_EXECUTION_TIME sono interrotte (KILL QUERY)."""
+    engine = create_engine(os.getenv('TEST_MYSQL_URL'))
+    se = SchemaEngine(engine, db_name='test', statement_timeout=0.5)
+    slow_queries = ['select count(*) from information_schema.columns a, information_schema.columns b, '
+                    'information_schema.columns c',
+                    'with t as (select 1 from information_schema.columns a, information_schema.columns b, '
+                    'information_schema.columns c) select count(*) from t']
+    for slow_query in slow_queries:
+        start = time.monotonic()
+        assert se.fetch(slow_query) is None
+        assert time.monotonic() - start < 10
+    assert len(se.skipped_queries) == 2
+    assert se.fetch('show tables') is not None
+
+
+def test_async_engine_missing_driver(monkeypatch):
+    """Senza il driver asyncio del dialetto create_async_db_engine spiega quale pacchetto installare."""
+    monkeypatch.setitem(database.ASYNC_DRIVERS, 'sqlite', 'driver_not_installed')
+    with pytest.raises(ImportError, match='pip install driver_not_installed'):
+        database.create_async_db_engine('sqlite:///test.db')
+
+
+def test_async_api(tmp_path):
+    """Le versioni async (aiosqlite) danno gli stessi risultati di quelle sincrone."""
+    pytest.importorskip('aiosqlite')
+    from sqlalchemy.ext.asyncio import create_async_engine
+    engine = make_engine(tmp_path)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+    sync = SchemaEngine(engine, db_name='test')
+    se = SchemaEngine(engine, db_name='test', async_engine=async_engine, max_db_connections=2)
+
+    async def run():
+        stats = await asyncio.gather(*[se.aget_column_stats('products', field_name)
+                                       for field_name in ['id', 'name', 'price']])
+        sample = await se.aget_table_sample('orders', max_rows=3)
+        examples = await se.aget_column_value_examples('products', 'name')
+        skipped = await se.afetch(SLOW_QUERY, timeout=0.1)
+        await async_engine.dispose()
+        return stats, sample, examples, skipped
+
+    stats, sample, examples, skipped = asyncio.run(run())
+    assert stats == [sync.get_column_stats('products', field_name) for field_name in ['id', 'name', 'price']]
+    assert sample == sync.get_table_sample('orders', max_rows=3)
+    assert examples == sync.get_column_value_examples('products', 'name')
+    assert skipped is None and len(se.skipped_queries) == 1
@@ -0,0 +1,66 @@
+"""Test della cache delle statistiche e dei campionamenti (StatsCache)."""
+import datetime
+import decimal
+import json
+import pickle
+from schema_engine import SchemaEngine
+from stats_cache import StatsCache
+from test_schema_engine import make_engine
+
+
+def test_stats_persisted_and_validated(tmp_path):
+    """Le statistiche sopravvivono alla riapertura e sono valide solo per lo stesso fingerprint/row count."""
+    cache_path = str(tmp_path / 'stats.sqlite')
+    key = StatsCache.make_key('db', None, 'products', 'name')
+    cache = StatsCache(cache_path)
+    cache.put(key, {'count': 3}, 'fp1', 3)
+    cache.close()
+
+    cache = StatsCache(cache_path)
+    assert cache.get(key, 'fp1', 3) == {'count': 3}
+    assert cache.get(key, 'fp2', 3) is None
+    assert cache.get(key, 'fp1', 4) is None
+
+
+def test_query_results_keep_python_types(tmp_path):
+    """I risultati delle query di campionamento conservano i tipi dei valori restituiti dal driver."""
+    cache_path = str(tmp_path / 'stats.sqlite')
+    key = StatsCache.make_key('db', None, 'products', 'table_sample:10')
+    result = {'truncated_results': [(1, datetime.date(2020, 1, 1), decimal.Decimal('1.50'))], 'fields': ['a', 'b', 'c']}
+    cache = StatsCache(cache_path)
+    cache.put_result(key, result, 'fp1')
+    cache.close()
+
+    cache = StatsCache(cache_path)
+    assert cache.get_result(key, 'fp1') == result
+    assert cache.get_result(key, 'fp2') is None
+
+    cache.invalidate('db', None, 'products')
+    assert cache.get_result(key, 'fp1') is None
+
+
+def test_query_results_stored_as_json(tmp_path):
+    """I risultati sono salvati in JSON: una voce non JSON (ad es. un pickle) viene ignorata, non eseguita."""
+    cache_path = str(tmp_path / 'stats.sqlite')
+    key = StatsCache.make_key('db', None, 'products', 'table_sample:10')
+    cache = StatsCache(cache_path)
+    cache.put_result(key, {'truncated_results': [(datetime.datetime(2020, 1, 1, 10, 0), b'\x00')], 'fields': ['a', 'b']},
+                     'fp1')
+    stored = cache._conn.execute('select result from query_results').fetchone()[0]
+    assert json.loads(stored)['fields'] == ['a', 'b']
+    cache._conn.execute('update query_results set result = ?', (pickle.dumps({'fields': []}),))
+    cache._conn.commit()
+    cache.close()
+
+    assert StatsCache(cache_path).get_result(key, 'fp1') is None
+
+
+def test_databases_sharing_cache(tmp_path):
+    """Due database con lo stesso db_name e le stesse tabelle non condividono le statistiche in cache."""
+    cache = StatsCache(str(tmp_path / 'stats.sqlite'))
+    stats = []
+    for name, rows in [('a', 10), ('b', 20)]:
+        (tmp_path / name).mkdir()
+        se = SchemaEngine(make_engine(tmp_path / name, rows=rows), db_name='test', stats_cache=cache)
+        stats.append(se.get_column_stats('products', 'id'))
+    assert stats[0]['count'] == 10 and stats[1]['count'] == 20
@@ -18,7 +18,7 @@ def analyze_time_patterns(schema: dict) -> Dict[str, Any]:
                 field_info = {
                     'table': table_name,
                     'field': field_name,
-                    'examples': field.get('examples', []),
+                    'examples': list(field.get('examples') or []),
                     'type': field.get('type', ''),
                     'category': field.get('category', ''),
                 }
@@ -27,7 +27,7 @@ def analyze_time_patterns(schema: dict) -> Dict[str, Any]:
                 # Organizza i dati per tipo di campo temporale
                 field_key = f"{table_name}.{field_name}"
                 time_data[field_key] = {
-                    'values': field.get('examples', []),
+                    'values': list(field.get('examples') or []),
                     'info': field_info
                 }
     
@@ -3,9 +3,19 @@ import datetime, decimal
 import json
 
 
+def json_default(value):
+    """
+    JSON encoding of the values json does not know: M-Schema mappings (FieldInfo, TableInfo) through
+    their to_dict, anything else (dates, decimals in the statistics...) as its string
+    """
+    if hasattr(value, 'to_dict'):
+        return value.to_dict()
+    return str(value)
+
+
 def write_json(path, data):
     with open(path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+        json.dump(data, f, ensure_ascii=False, indent=2, default=json_default)
 
 
 def read_json(path):
@@ -30,7 +40,32 @@ def save_raw_text(filename, content):
 
 def save_json(target_file,js,indent=4):
     with open(target_file, 'w', encoding='utf-8') as f:
-        json.dump(js, f, ensure_ascii=False, indent=indent)
+        json.dump(js, f, ensure_ascii=False, indent=indent, default=json_default)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    rough number of tokens of a text: about 4 ASCII characters per token, and one token per
+    non-ASCII character, since CJK characters take one token or more each
+    """
+    ascii_chars = len(text.encode('ascii', 'ignore'))
+    return ascii_chars // 4 + (len(text) - ascii_chars) + 1
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    longest prefix of the text whose estimate_tokens does not exceed max_tokens
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
 
 
 def is_email(string):